@@ -1,67 +1,160 @@
 import io
 import csv
-from typing import List, Tuple, Optional
+import signal
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Tuple, Optional
+from xml.etree import ElementTree
 import chardet
 import pypdf
 import docx2txt
-from bs4 import BeautifulSoup
+from .cache import DiskCache
+from .htmltext import html_to_text
+from .metrics import Metrics
+from .payload import Payload, open_payload
 
+# Bump when extraction output changes so cached text is not reused
+PARSER_VERSION = 4
 
-def parse_attachment(filename: str, content: bytes, mime_type: str) -> Optional[str]:
+# Bytes of a text attachment used to guess its encoding
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+# Source characters of HTML kept per character of requested text
+HTML_SOURCE_FACTOR = 20
+
+# With a character budget, a PDF is read for at most one page per this many
+# characters of it, so scanned pages without text do not keep it going to the end
+MIN_PAGE_CHARS = 100
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+_MISS = object()
+
+
+def _truncate(text: str, max_chars: Optional[int]) -> str:
+    return text[:max_chars] if max_chars else text
+
+
+def _decode_text(content: Payload, max_bytes: Optional[int] = None) -> str:
+    # chardet is slow on large inputs; a sample is enough to pick an encoding
+    detected = chardet.detect(content[:ENCODING_SAMPLE_BYTES])
+    encoding = detected.get('encoding', 'utf-8')
+    if not encoding:
+        encoding = 'utf-8'
+    content = content[:max_bytes] if max_bytes else bytes(content)
+    return content.decode(encoding, errors='ignore')
+
+
+def _csv_text(text: str, max_chars: Optional[int]) -> Optional[str]:
+    # Rows are streamed so only the budgeted prefix is ever split
+    lines = []
+    size = 0
+    for row in csv.reader(io.StringIO(text)):
+        line = ', '.join(row)
+        lines.append(line)
+        size += len(line) + 1
+        if max_chars and size >= max_chars:
+            break
+    if not lines:
+        return None
+    return _truncate(f"CSV Data:\n" + '\n'.join(lines), max_chars)
+
+
+def _pdf_text(content: Payload, max_chars: Optional[int], max_pages: Optional[int]) -> Optional[str]:
+    text_parts = []
+    size = 0
+    # Spilled payloads are read from their file as pypdf needs them
+    with open_payload(content) as source:
+        pdf_reader = pypdf.PdfReader(source)
+        for index, page in enumerate(pdf_reader.pages):
+            if max_pages and index >= max_pages:
+                break
+            try:
+                page_text = page.extract_text()
+            except Exception:
+                continue
+            if page_text.strip():
+                text_parts.append(page_text.strip())
+                size += len(text_parts[-1]) + 2
+                if max_chars and size >= max_chars:
+                    break
+    if text_parts:
+        return _truncate('\n\n'.join(text_parts), max_chars)
+    return None
+
+
+def _docx_text(content: Payload, max_chars: int) -> Optional[str]:
+    """Stream paragraphs out of word/document.xml, stopping at max_chars."""
+    parts = []
+    size = 0
+    with zipfile.ZipFile(open_payload(content)) as archive:
+        with archive.open('word/document.xml') as document:
+            for event, element in ElementTree.iterparse(document, events=('end',)):
+                if element.tag == _W + 't':
+                    parts.append(element.text or '')
+                elif element.tag == _W + 'tab':
+                    parts.append('\t')
+                elif element.tag in (_W + 'br', _W + 'cr', _W + 'p'):
+                    parts.append('\n')
+                    if element.tag == _W + 'p':
+                        element.clear()
+                else:
+                    continue
+                size += len(parts[-1])
+                if size >= max_chars:
+                    break
+    text = ''.join(parts).strip()
+    return _truncate(text, max_chars) if text else None
+
+
+def parse_attachment(filename: str, content: Payload, mime_type: str,
+                     max_chars: Optional[int] = None, max_pages: Optional[int] = None) -> Optional[str]:
     """Parse attachment content into text based on file type.
     
+    With ``max_chars`` extraction stops as soon as that much text has been
+    collected and the result is cut to that length; ``max_pages`` caps the
+    PDF pages read (by default one page per MIN_PAGE_CHARS of max_chars).
+    Work then scales with the budget rather than the size of the attachment.
+    
     Returns None if parsing fails or content is not text-extractable.
     """
     if not content:
         return None
+    if max_pages is None and max_chars:
+        max_pages = -(-max_chars // MIN_PAGE_CHARS)
     
     # Try to detect encoding for text files
     if mime_type.startswith('text/') or filename.lower().endswith(('.txt', '.csv', '.html', '.htm')):
         try:
-            # Detect encoding
-            detected = chardet.detect(content)
-            encoding = detected.get('encoding', 'utf-8')
-            if not encoding:
-                encoding = 'utf-8'
-            
-            text = content.decode(encoding, errors='ignore')
-            
             # Special handling for HTML
             if mime_type.startswith('text/html') or filename.lower().endswith(('.html', '.htm')):
-                soup = BeautifulSoup(text, 'html.parser')
-                return soup.get_text(separator=' ', strip=True)
+                # Markup outweighs text, so keep a generous prefix of the source
+                text = _decode_text(content, max_chars * HTML_SOURCE_FACTOR if max_chars else None)
+                return html_to_text(text, max_chars) or None
+            
+            # UTF-8 needs at most 4 bytes per character
+            text = _decode_text(content, max_chars * 4 if max_chars else None)
             
             # Special handling for CSV
             if mime_type == 'text/csv' or filename.lower().endswith('.csv'):
                 try:
-                    csv_reader = csv.reader(io.StringIO(text))
-                    rows = list(csv_reader)
-                    if rows:
-                        # Convert to readable format
-                        csv_text = '\n'.join([', '.join(row) for row in rows])
-                        return f"CSV Data:\n{csv_text}"
+                    csv_text = _csv_text(text, max_chars)
+                    if csv_text:
+                        return csv_text
                 except Exception:
                     pass
             
-            return text.strip()
+            return _truncate(text.strip(), max_chars)
         except Exception:
             return None
     
     # PDF parsing
     elif mime_type == 'application/pdf' or filename.lower().endswith('.pdf'):
         try:
-            pdf_file = io.BytesIO(content)
-            pdf_reader = pypdf.PdfReader(pdf_file)
-            text_parts = []
-            for page in pdf_reader.pages:
-                try:
-                    page_text = page.extract_text()
-                    if page_text.strip():
-                        text_parts.append(page_text.strip())
-                except Exception:
-                    continue
-            if text_parts:
-                return '\n\n'.join(text_parts)
+            return _pdf_text(content, max_chars, max_pages)
         except Exception:
             pass
     
@@ -69,8 +162,10 @@ def parse_attachment(filename: str, content: bytes, mime_type: str) -> Optional[
     elif (mime_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document' or 
           filename.lower().endswith('.docx')):
         try:
-            docx_file = io.BytesIO(content)
-            text = docx2txt.process(docx_file)
+            if max_chars:
+                return _docx_text(content, max_chars)
+            with open_payload(content) as docx_file:
+                text = docx2txt.process(docx_file)
             if text and text.strip():
                 return text.strip()
         except Exception:
@@ -79,14 +174,253 @@ def parse_attachment(filename: str, content: bytes, mime_type: str) -> Optional[
     return None
 
 
-def parse_all_attachments(attachments: List[Tuple[str, bytes, str]]) -> List[Tuple[str, str]]:
+class AttachmentTimeout(BaseException):
+    """Raised inside a worker when an attachment exceeds its time limit.
+    
+    Derives from BaseException so the broad ``except Exception`` handlers in
+    parse_attachment cannot swallow it.
+    """
+
+
+def _raise_timeout(signum, frame):
+    raise AttachmentTimeout()
+
+
+def _init_worker(memory_limit_mb: int) -> None:
+    if not memory_limit_mb:
+        return
+    try:
+        import resource
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        # Not enforceable on this platform; the size limit still applies
+        pass
+
+
+def _parse_with_timeout(filename: str, content: Payload, mime_type: str, timeout: float,
+                        max_chars: Optional[int] = None) -> Optional[str]:
+    """Worker entry point: parse_attachment under a wall-clock limit."""
+    use_alarm = timeout > 0 and hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return parse_attachment(filename, content, mime_type, max_chars=max_chars)
+    except AttachmentTimeout:
+        # Surface as a failed future so the result is not cached
+        raise TimeoutError(f"parsing {filename} took longer than {timeout}s") from None
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _timed_parse(filename: str, content: Payload, mime_type: str, timeout: float,
+                 max_chars: Optional[int] = None) -> Tuple[Optional[str], float]:
+    """Worker entry point that also reports how long the parse itself took."""
+    start = time.perf_counter()
+    text = _parse_with_timeout(filename, content, mime_type, timeout, max_chars)
+    return text, time.perf_counter() - start
+
+
+def attachment_cache_key(content: Payload, max_chars: Optional[int] = None) -> str:
+    return DiskCache.make_key("attachment", PARSER_VERSION, max_chars or 0, content)
+
+
+def _completed(value: Optional[str]) -> "Future[Optional[str]]":
+    future: "Future[Optional[str]]" = Future()
+    future.set_result(value)
+    return future
+
+
+def _follow(shared: "Future[Optional[str]]") -> "Future[Optional[str]]":
+    """A future of the caller's own that completes with a shared parse, so
+    callers keying on their futures never see another caller's."""
+    future: "Future[Optional[str]]" = Future()
+    
+    def done(shared: "Future[Optional[str]]") -> None:
+        if shared.cancelled():
+            future.cancel()
+        elif shared.exception() is not None:
+            future.set_exception(shared.exception())
+        else:
+            future.set_result(shared.result())
+    
+    shared.add_done_callback(done)
+    return future
+
+
+class AttachmentPool:
+    """Parse attachments on a process pool with per-attachment limits.
+    
+    Attachments larger than ``max_bytes`` are skipped. Each parse is stopped
+    after ``timeout`` seconds, and workers can be capped at
+    ``memory_limit_mb`` of address space where the platform allows it.
+    With ``max_workers=0`` attachments are parsed inline instead.
+    
+    Extracted text is looked up in ``cache`` by the SHA-256 of the
+    attachment bytes and PARSER_VERSION, so a repeated attachment is only
+    parsed once. Timeouts and worker crashes are not cached. An attachment
+    submitted again while its parse is still running shares that parse,
+    through a future of its own.
+    
+    Parse time per MIME type (excluding time queued for a worker), skipped
+    attachments and failures are recorded in ``metrics``.
+    """
+    
+    def __init__(self, max_workers: Optional[int] = None, timeout: float = 30.0,
+                 max_bytes: int = 10 * 1024 * 1024, memory_limit_mb: int = 0,
+                 cache: Optional[DiskCache] = None, metrics: Optional[Metrics] = None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.memory_limit_mb = memory_limit_mb
+        self.cache = cache
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight: Dict[str, "Future[Optional[str]]"] = {}
+        self._lock = threading.Lock()
+    
+    def _pool(self) -> ProcessPoolExecutor:
+        # Accounts are fetched (and their attachments submitted) from several threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=_init_worker,
+                    initargs=(self.memory_limit_mb,),
+                )
+            return self._executor
+    
+    def _reset(self, broken: ProcessPoolExecutor) -> None:
+        """Drop a pool whose worker died (e.g. hit the memory limit), unless it was already replaced."""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+        broken.shutdown(wait=False)
+    
+    def submit(self, filename: str, content: Payload, mime_type: str,
+               max_chars: Optional[int] = None) -> "Future[Optional[str]]":
+        mime_label = (mime_type or "unknown").lower()
+        if not content or len(content) > self.max_bytes:
+            self.metrics.inc("attachments_skipped", mime=mime_label)
+            return _completed(None)
+        
+        key = None
+        if self.cache is not None:
+            key = attachment_cache_key(content, max_chars)
+            cached = self.cache.get(key, _MISS)
+            if cached is not _MISS:
+                # An empty string records an attachment with no extractable text
+                return _completed(cached or None)
+            with self._lock:
+                running = self._in_flight.get(key)
+            if running is not None:
+                return _follow(running)
+        
+        if self.max_workers == 0:
+            start = time.perf_counter()
+            parsed_text = parse_attachment(filename, content, mime_type, max_chars=max_chars)
+            self.metrics.observe("attachment_parse", time.perf_counter() - start, mime=mime_label)
+            future = _completed(parsed_text)
+        else:
+            args = (filename, content, mime_type, self.timeout, max_chars)
+            executor = self._pool()
+            try:
+                timed = executor.submit(_timed_parse, *args)
+            except BrokenProcessPool:
+                # A worker died; start a fresh pool
+                self._reset(executor)
+                executor = self._pool()
+                timed = executor.submit(_timed_parse, *args)
+            future = self._untimed(timed, mime_label, executor)
+        
+        if key is not None:
+            with self._lock:
+                self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._store(key, done))
+        return future
+    
+    def _untimed(self, timed: "Future[Tuple[Optional[str], float]]", mime_label: str,
+                 executor: ProcessPoolExecutor) -> "Future[Optional[str]]":
+        """Record the worker's parse time and pass on just the text."""
+        future: "Future[Optional[str]]" = Future()
+        
+        def done(timed: "Future[Tuple[Optional[str], float]]") -> None:
+            try:
+                parsed_text, seconds = timed.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._reset(executor)
+                self.metrics.inc("attachment_failures", mime=mime_label)
+                future.set_exception(e)
+                return
+            self.metrics.observe("attachment_parse", seconds, mime=mime_label)
+            future.set_result(parsed_text)
+        
+        timed.add_done_callback(done)
+        return future
+    
+    def _store(self, key: str, future: "Future[Optional[str]]") -> None:
+        try:
+            if future.cancelled() or future.exception() is not None:
+                return
+            try:
+                self.cache.set(key, future.result() or "")
+            except OSError:
+                pass
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+    
+    def result(self, future: "Future[Optional[str]]") -> Optional[str]:
+        """Wait for a parse, treating worker failures as unparseable."""
+        # The worker enforces the timeout itself; this only guards against a hung process
+        wait = self.timeout * 2 + 5 if self.timeout > 0 else None
+        try:
+            return future.result(timeout=wait)
+        except Exception:
+            return None
+    
+    def submit_all(self, attachments: List[Tuple[str, Payload, str]],
+                   max_chars: Optional[int] = None) -> List[Tuple[str, "Future[Optional[str]]"]]:
+        return [(filename, self.submit(filename, content, mime_type, max_chars))
+                for filename, content, mime_type in attachments]
+    
+    def collect(self, pending: List[Tuple[str, "Future[Optional[str]]"]]) -> List[Tuple[str, str]]:
+        parsed_attachments = []
+        for filename, future in pending:
+            parsed_text = self.result(future)
+            if parsed_text:
+                parsed_attachments.append((filename, parsed_text))
+        return parsed_attachments
+    
+    def parse_all(self, attachments: List[Tuple[str, Payload, str]],
+                  max_chars: Optional[int] = None) -> List[Tuple[str, str]]:
+        return self.collect(self.submit_all(attachments, max_chars))
+    
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def parse_all_attachments(attachments: List[Tuple[str, Payload, str]],
+                          pool: Optional[AttachmentPool] = None,
+                          max_chars: Optional[int] = None) -> List[Tuple[str, str]]:
     """Parse all attachments and return list of (filename, parsed_text) tuples.
     
-    Only returns attachments that were successfully parsed.
+    Only returns attachments that were successfully parsed. With a pool the
+    attachments are parsed in parallel worker processes.
     """
+    if pool is not None:
+        return pool.parse_all(attachments, max_chars)
     parsed_attachments = []
     for filename, content, mime_type in attachments:
-        parsed_text = parse_attachment(filename, content, mime_type)
+        parsed_text = parse_attachment(filename, content, mime_type, max_chars=max_chars)
         if parsed_text:
             parsed_attachments.append((filename, parsed_text))
     return parsed_attachments
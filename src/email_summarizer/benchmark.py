@@ -0,0 +1,487 @@
+"""End-to-end benchmark against a synthetic mailbox and fake services.
+
+Generates a reproducible corpus, serves it from FakeIMAPServer and
+summarizes it against FakeOllamaServer, timing each stage:
+
+    fetch      IMAPEmailFetcher.fetch, latency per FETCH batch
+    parse      attachment extraction on the AttachmentPool, latency per attachment
+    html       html_to_text on every HTML body and attachment, latency per document
+    html_bs4   the same documents through BeautifulSoup, as parsed before html_to_text
+               (skipped when bs4 is not installed)
+    digest     generate_daily_digest, latency per LLM request
+
+Run it with:
+
+    python -m email_summarizer.benchmark --messages 500 --llm-latency 0.2
+    python -m email_summarizer.benchmark --json current.json --compare baseline.json
+
+With --compare the exit status is 1 when any stage's throughput drops, or
+its p95 latency grows, by more than --tolerance against the baseline.
+"""
+import argparse
+import email
+import io
+import json
+import random
+import sys
+import threading
+import time
+import zipfile
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import format_datetime, make_msgid
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from xml.sax.saxutils import escape
+
+from .attachment_parser import AttachmentPool
+from .fake_imap import FakeIMAPServer
+from .fake_ollama import FakeOllamaServer
+from .htmltext import html_to_text
+from .imap_fetcher import SPAM_MAILBOXES, FetchedEmail, IMAPEmailFetcher
+from .llm import LLMBackend, LLMResult, OllamaBackend
+from .metrics import percentile
+from .attachment_parser import HTML_SOURCE_FACTOR
+from .summarizer import ATTACHMENT_CHAR_BUDGET, EmailSummarizer
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:  # only needed for the html_bs4 comparison
+    BeautifulSoup = None
+
+ATTACHMENT_KINDS = ("pdf", "docx", "csv", "html")
+
+_WORDS = (
+    "meeting project deadline invoice review budget report update schedule team client proposal "
+    "contract quarter release launch design feedback approval request follow agenda notes draft "
+    "payment account delivery order shipment ticket issue support customer account server deploy "
+    "migration analysis forecast revenue hiring interview offer travel booking conference slides"
+).split()
+_SENDERS = ("alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi", "ivan", "judy")
+_DOMAINS = ("example.com", "example.org", "corp.example.net", "vendor.example.io")
+_SUBJECT_PREFIXES = ("", "", "", "Re: ", "Fwd: ", "URGENT: ", "Action required: ", "Invoice: ")
+
+
+@dataclass
+class CorpusSpec:
+    """Shape of a synthetic mail corpus; the same seed gives the same bytes."""
+    messages: int = 200
+    seed: int = 0
+    html_share: float = 0.5  # multipart/alternative with an HTML body
+    html_only_share: float = 0.0  # of those, sent as HTML only, without a plain-text body
+    attachment_share: float = 0.3  # messages with one or more attachments
+    max_attachments: int = 3
+    attachment_kinds: Sequence[str] = ATTACHMENT_KINDS
+    spam_share: float = 0.1  # delivered to the spam folder instead of INBOX
+    body_words: int = 150  # mean body length
+    attachment_pages: int = 4  # PDF pages / DOCX paragraphs scale
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(_WORDS) for _ in range(max(1, words)))
+    return text[0].upper() + text[1:] + "."
+
+
+def _paragraphs(rng: random.Random, words: int) -> List[str]:
+    paragraphs = []
+    while words > 0:
+        size = min(words, rng.randint(20, 60))
+        paragraphs.append(" ".join(_sentence(rng, rng.randint(6, 14)) for _ in range(max(1, size // 10))))
+        words -= size
+    return paragraphs
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """A minimal valid PDF with one line of Helvetica text per page."""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages))), len(pages)
+        ),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(pages):
+        text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        stream = f"BT /F1 10 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def make_docx(paragraphs: List[str]) -> bytes:
+    """A minimal .docx holding only word/document.xml."""
+    body = "".join(f"<w:p><w:r><w:t>{escape(p)}</w:t></w:r></w:p>" for p in paragraphs)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        "</Types>"
+    )
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", content_types)
+        archive.writestr("word/document.xml", document)
+    return out.getvalue()
+
+
+def _make_csv(rng: random.Random, rows: int) -> bytes:
+    lines = ["date,account,item,amount"]
+    for row in range(rows):
+        lines.append(f"2024-01-{row % 28 + 1:02d},{rng.choice(_SENDERS)},{rng.choice(_WORDS)},{rng.uniform(1, 5000):.2f}")
+    return "\n".join(lines).encode()
+
+
+def _make_html(paragraphs: List[str]) -> str:
+    body = "".join(f"<p>{escape(p)}</p>" for p in paragraphs)
+    return (
+        "<html><head><style>p { font-family: sans-serif; }</style></head>"
+        f"<body><table><tr><td>{body}</td></tr></table></body></html>"
+    )
+
+
+def _attachment(rng: random.Random, kind: str, spec: CorpusSpec) -> tuple:
+    size = max(1, int(rng.expovariate(1 / spec.attachment_pages)) + 1)
+    name = f"{rng.choice(_WORDS)}-{rng.randint(1, 999)}"
+    if kind == "pdf":
+        pages = [_sentence(rng, 40) for _ in range(size)]
+        return make_pdf(pages), "application", "pdf", name + ".pdf"
+    if kind == "docx":
+        return (make_docx(_paragraphs(rng, size * 80)), "application",
+                "vnd.openxmlformats-officedocument.wordprocessingml.document", name + ".docx")
+    if kind == "csv":
+        return _make_csv(rng, size * 50), "text", "csv", name + ".csv"
+    if kind == "html":
+        return _make_html(_paragraphs(rng, size * 80)).encode(), "text", "html", name + ".html"
+    raise ValueError(f"Unknown attachment kind {kind!r}; expected one of {ATTACHMENT_KINDS}")
+
+
+def generate_corpus(spec: CorpusSpec, now: Optional[datetime] = None) -> Dict[str, List[bytes]]:
+    """Build raw RFC 822 messages by mailbox, all dated within the last day."""
+    rng = random.Random(spec.seed)
+    now = now or datetime.now(timezone.utc)
+    mailboxes: Dict[str, List[bytes]] = {"INBOX": [], SPAM_MAILBOXES[0]: []}
+    # Oldest first, so UIDs increase with the date like a real mailbox
+    offsets = sorted((rng.uniform(60, 20 * 3600) for _ in range(spec.messages)), reverse=True)
+    for offset in offsets:
+        msg = EmailMessage()
+        sender = rng.choice(_SENDERS)
+        msg["From"] = f"{sender.title()} <{sender}@{rng.choice(_DOMAINS)}>"
+        msg["To"] = "Me <me@example.com>"
+        msg["Subject"] = rng.choice(_SUBJECT_PREFIXES) + _sentence(rng, rng.randint(3, 8))[:-1]
+        msg["Date"] = format_datetime(now - timedelta(seconds=offset))
+        msg["Message-ID"] = make_msgid(domain="bench.example.com")
+
+        words = max(5, int(rng.gauss(spec.body_words, spec.body_words / 3)))
+        paragraphs = _paragraphs(rng, words)
+        if rng.random() < spec.html_share:
+            if spec.html_only_share and rng.random() < spec.html_only_share:
+                msg.set_content(_make_html(paragraphs), subtype="html")
+            else:
+                msg.set_content("\n\n".join(paragraphs))
+                msg.add_alternative(_make_html(paragraphs), subtype="html")
+        else:
+            msg.set_content("\n\n".join(paragraphs))
+        if spec.attachment_kinds and rng.random() < spec.attachment_share:
+            for _ in range(rng.randint(1, max(1, spec.max_attachments))):
+                data, maintype, subtype, filename = _attachment(rng, rng.choice(spec.attachment_kinds), spec)
+                msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
+
+        mailbox = SPAM_MAILBOXES[0] if rng.random() < spec.spam_share else "INBOX"
+        mailboxes[mailbox].append(msg.as_bytes())
+    return mailboxes
+
+
+@dataclass
+class StageResult:
+    stage: str
+    items: int
+    unit: str
+    seconds: float
+    p50: float
+    p95: float
+    peak_rss_mb: float
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+
+def _peak_rss_mb() -> float:
+    """High-water resident set size of this process so far, in MB."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class _TimedBackend(LLMBackend):
+    """Records the latency of every request made through another backend."""
+
+    def __init__(self, backend: LLMBackend) -> None:
+        self.backend = backend
+        self.latencies: List[float] = []
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str, max_tokens: int = 1000, format: Optional[str] = None,
+                 system: Optional[str] = None) -> LLMResult:
+        start = time.monotonic()
+        try:
+            return self.backend.generate(prompt, max_tokens, format=format, system=system)
+        finally:
+            with self._lock:
+                self.latencies.append(time.monotonic() - start)
+
+    def warmup(self) -> None:
+        self.backend.warmup()
+
+    def close(self) -> None:
+        self.backend.close()
+
+
+def _html_documents(corpus: Dict[str, List[bytes]]) -> List[str]:
+    """Every HTML body and HTML attachment in the corpus."""
+    documents = []
+    for raw_messages in corpus.values():
+        for raw in raw_messages:
+            for part in email.message_from_bytes(raw).walk():
+                if part.get_content_type() == "text/html":
+                    documents.append(part.get_payload(decode=True).decode("utf-8", errors="ignore"))
+    return documents
+
+
+def _bs4_text(document: str, max_chars: int) -> str:
+    """HTML to text the way attachments were parsed before html_to_text."""
+    soup = BeautifulSoup(document[:max_chars * HTML_SOURCE_FACTOR], "html.parser")
+    return soup.get_text(separator=" ", strip=True)[:max_chars]
+
+
+def _timed(stage: str, unit: str, run: Callable[[List[float]], Any]) -> StageResult:
+    latencies: List[float] = []
+    start = time.monotonic()
+    result = run(latencies)
+    seconds = time.monotonic() - start
+    return StageResult(
+        stage=stage,
+        items=len(latencies),
+        unit=unit,
+        seconds=seconds,
+        p50=percentile(latencies, 50),
+        p95=percentile(latencies, 95),
+        peak_rss_mb=_peak_rss_mb(),
+        extra=result or {},
+    )
+
+
+def run_benchmark(spec: CorpusSpec, imap_latency: float = 0.0, llm_latency: float = 0.05,
+                  tokens_per_second: float = 0.0, fetch_mode: str = "partial", imap_batch_size: int = 50,
+                  imap_connections: int = 2, attachment_workers: int = 2, concurrency: int = 4,
+                  batch_tokens: int = 0) -> List[StageResult]:
+    """Run every stage once against fresh fake servers and return the timings."""
+    corpus = generate_corpus(spec)
+    results: List[StageResult] = []
+    emails: List[FetchedEmail] = []
+
+    with FakeIMAPServer(corpus, latency=imap_latency) as imap_server:
+        fetcher = IMAPEmailFetcher(
+            imap_server.host, "bench", "bench", use_ssl=False, port=imap_server.port, account_key="bench",
+            fetch_mode=fetch_mode, batch_size=imap_batch_size, max_connections=imap_connections,
+        )
+
+        def fetch(latencies: List[float]) -> Dict[str, Any]:
+            # Per thread, a batch's latency is the time since its previous batch
+            last: Dict[int, float] = {}
+            lock = threading.Lock()
+            started = time.monotonic()
+
+            def on_batch(batch: List[FetchedEmail]) -> None:
+                now = time.monotonic()
+                with lock:
+                    thread = threading.get_ident()
+                    latencies.append(now - last.get(thread, started))
+                    last[thread] = now
+
+            emails.extend(fetcher.fetch(None, window_24h=True, include_spam=True, on_batch=on_batch))
+            return {"emails": len(emails), "bytes_received": imap_server.stats["bytes_sent"]}
+
+        results.append(_timed("fetch", "batches", fetch))
+
+    pool = AttachmentPool(max_workers=attachment_workers)
+    try:
+        def parse(latencies: List[float]) -> Dict[str, Any]:
+            lock = threading.Lock()
+            pending = []
+            for message in emails:
+                for filename, content, mime_type in message.attachments:
+                    submitted = time.monotonic()
+                    future = pool.submit(filename, content, mime_type, max_chars=ATTACHMENT_CHAR_BUDGET + 1)
+
+                    def record(done: Any, submitted: float = submitted) -> None:
+                        with lock:
+                            latencies.append(time.monotonic() - submitted)
+
+                    future.add_done_callback(record)
+                    pending.append((filename, future))
+            parsed = pool.collect(pending)
+            return {"attachments": len(pending), "parsed": len(parsed)}
+
+        results.append(_timed("parse", "attachments", parse))
+    finally:
+        pool.close()
+
+    documents = _html_documents(corpus)
+    max_chars = ATTACHMENT_CHAR_BUDGET + 1
+
+    def convert(latencies: List[float], to_text: Callable[[str, int], str]) -> Dict[str, Any]:
+        chars = 0
+        for document in documents:
+            start = time.perf_counter()
+            chars += len(to_text(document, max_chars))
+            latencies.append(time.perf_counter() - start)
+        return {"source_chars": sum(map(len, documents)), "text_chars": chars}
+
+    results.append(_timed("html", "documents", lambda latencies: convert(latencies, html_to_text)))
+    if BeautifulSoup is not None:
+        results.append(_timed("html_bs4", "documents", lambda latencies: convert(latencies, _bs4_text)))
+
+    with FakeOllamaServer(latency=llm_latency, tokens_per_second=tokens_per_second, seed=spec.seed) as llm_server:
+        backend = _TimedBackend(OllamaBackend("bench", llm_server.url, pool_size=concurrency, keep_alive=None))
+        summarizer = EmailSummarizer(
+            "bench", llm_server.url, max_workers=concurrency,
+            attachment_pool=AttachmentPool(max_workers=attachment_workers),
+            batch_token_budget=batch_tokens, backend=backend,
+        )
+        try:
+            def digest(latencies: List[float]) -> Dict[str, Any]:
+                text = summarizer.generate_daily_digest(emails)
+                latencies.extend(backend.latencies)
+                return {"emails": len(emails), "llm_calls": summarizer.stats["llm_calls"], "digest_chars": len(text)}
+
+            results.append(_timed("digest", "llm calls", digest))
+        finally:
+            summarizer.close()
+    return results
+
+
+def format_results(results: List[StageResult]) -> str:
+    lines = [
+        f"{'stage':<8} {'items':>7} {'unit':<12} {'seconds':>8} {'items/s':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'peak RSS MB':>12}  details"
+    ]
+    for r in results:
+        details = ", ".join(f"{k}={v}" for k, v in r.extra.items())
+        lines.append(
+            f"{r.stage:<8} {r.items:>7} {r.unit:<12} {r.seconds:>8.2f} {r.throughput:>9.1f} "
+            f"{r.p50 * 1000:>8.1f} {r.p95 * 1000:>8.1f} {r.peak_rss_mb:>12.1f}  {details}"
+        )
+    return "\n".join(lines)
+
+
+def to_json(results: List[StageResult]) -> Dict[str, Any]:
+    return {r.stage: dict(asdict(r), throughput=r.throughput) for r in results}
+
+
+def compare(results: List[StageResult], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Describe every stage that regressed by more than tolerance."""
+    regressions = []
+    for r in results:
+        before = baseline.get(r.stage)
+        if not before:
+            continue
+        if before["throughput"] and r.throughput < before["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{r.stage}: throughput {r.throughput:.1f} {r.unit}/s vs {before['throughput']:.1f} baseline"
+            )
+        if before["p95"] and r.p95 > before["p95"] * (1 + tolerance):
+            regressions.append(f"{r.stage}: p95 {r.p95 * 1000:.1f} ms vs {before['p95'] * 1000:.1f} ms baseline")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark fetch, attachment parsing and digest generation offline")
+    parser.add_argument("--messages", type=int, default=200, help="Messages in the synthetic corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--html-share", type=float, default=0.5, help="Fraction of messages with an HTML body")
+    parser.add_argument("--html-only-share", type=float, default=0.0,
+                        help="Fraction of HTML messages without a plain-text body")
+    parser.add_argument("--attachment-share", type=float, default=0.3, help="Fraction of messages with attachments")
+    parser.add_argument("--attachment-kinds", default=",".join(ATTACHMENT_KINDS), help="Comma-separated subset of pdf,docx,csv,html")
+    parser.add_argument("--spam-share", type=float, default=0.1, help="Fraction of messages in the spam folder")
+    parser.add_argument("--body-words", type=int, default=150, help="Mean body length in words")
+    parser.add_argument("--imap-latency", type=float, default=0.0, help="Seconds added to every IMAP command")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds added to every LLM request")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Simulated generation speed")
+    parser.add_argument("--fetch-mode", default="partial", choices=("partial", "full"))
+    parser.add_argument("--imap-batch-size", type=int, default=50)
+    parser.add_argument("--imap-connections", type=int, default=2)
+    parser.add_argument("--attachment-workers", type=int, default=2, help="0 parses inline")
+    parser.add_argument("--concurrency", type=int, default=4, help="LLM requests in flight")
+    parser.add_argument("--batch-tokens", type=int, default=0, help="Batched prompt budget, 0 disables")
+    parser.add_argument("--json", dest="json_path", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier --json run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against --compare")
+    args = parser.parse_args()
+
+    spec = CorpusSpec(
+        messages=args.messages,
+        seed=args.seed,
+        html_share=args.html_share,
+        html_only_share=args.html_only_share,
+        attachment_share=args.attachment_share,
+        attachment_kinds=[kind.strip() for kind in args.attachment_kinds.split(",") if kind.strip()],
+        spam_share=args.spam_share,
+        body_words=args.body_words,
+    )
+    results = run_benchmark(
+        spec,
+        imap_latency=args.imap_latency,
+        llm_latency=args.llm_latency,
+        tokens_per_second=args.tokens_per_second,
+        fetch_mode=args.fetch_mode,
+        imap_batch_size=args.imap_batch_size,
+        imap_connections=args.imap_connections,
+        attachment_workers=args.attachment_workers,
+        concurrency=args.concurrency,
+        batch_tokens=args.batch_tokens,
+    )
+    print(format_results(results))
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(to_json(results), f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
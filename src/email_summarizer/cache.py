@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+from .payload import SpilledPayload, content_digest
+
+
+class DiskCache:
+    """Content-addressed cache of JSON values stored under the state directory.
+
+    Entries live at {root}/{key[:2]}/{key}.json. Reads refresh the file's
+    mtime, so pruning by age and entry count drops the least recently used
+    entries first.
+    """
+
+    def __init__(self, root: str, max_entries: int = 5000, max_age_days: float = 30.0) -> None:
+        self.root = root
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            if not isinstance(part, (bytes, SpilledPayload)):
+                part = str(part).encode("utf-8")
+            # A spilled payload gives the same key as the bytes it holds, without reading the file
+            digest.update(content_digest(part))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _entry(self, path: str) -> Optional[dict]:
+        """The stored entry, or None when it is missing, unreadable or older than max_age_days."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self.max_age_days and time.time() - entry.get("created", 0) > self.max_age_days * 86400:
+            return None
+        return entry
+
+    def __contains__(self, key: str) -> bool:
+        """Whether get() would hit, without touching the hit/miss counters or the entry's mtime."""
+        return self._entry(self._path(key)) is not None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        path = self._path(key)
+        entry = self._entry(path)
+        if entry is None:
+            self._count(False)
+            return default
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._count(True)
+        return entry.get("value", default)
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "value": value}, f)
+        os.replace(tmp_path, path)
+
+    def prune(self) -> int:
+        """Evict expired entries, then the least recently used beyond max_entries.
+
+        Returns the number of entries removed.
+        """
+        entries: List[Tuple[float, str]] = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        entries.sort(reverse=True)
+
+        cutoff = time.time() - self.max_age_days * 86400 if self.max_age_days else None
+        removed = 0
+        for index, (mtime, path) in enumerate(entries):
+            expired = cutoff is not None and mtime < cutoff
+            if expired or (self.max_entries and index >= self.max_entries) or path.endswith(".tmp"):
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)"
+
+
+def open_cache(state_dir: str, name: str, max_entries: int, max_age_days: float) -> Optional[DiskCache]:
+    """Open the named cache under state_dir, or None when caching is disabled."""
+    if max_entries <= 0:
+        return None
+    return DiskCache(os.path.join(state_dir, "cache", name), max_entries, max_age_days)
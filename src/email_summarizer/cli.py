@@ -2,37 +2,81 @@
 
 import sys
 import os
-from datetime import datetime
-from typing import List
+import signal
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from contextlib import ExitStack
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 import click
 
 # Add src to path so we can import our modules
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 
-from email_summarizer.config import load_config_from_env
+from email_summarizer.config import AppConfig, load_config_from_env
 from email_summarizer.state import StateStore
-from email_summarizer.imap_fetcher import IMAPEmailFetcher
-from email_summarizer.summarizer import EmailSummarizer
+from email_summarizer.imap_fetcher import HEADER_FIELDS, IMAPEmailFetcher
+from email_summarizer.summarizer import PROMPT_VERSION, EmailSummarizer
+from email_summarizer.cache import open_cache
+from email_summarizer.daemon import DIGEST_STATE_KEY, SummaryDaemon
+from email_summarizer.dedup import FingerprintStore
+from email_summarizer.journal import RunJournal
+from email_summarizer.attachment_parser import AttachmentPool
+from email_summarizer.llm import OllamaBackend
+from email_summarizer.metrics import Metrics
+from email_summarizer.rules import ImportanceRules
+from email_summarizer.store import MessageStore
 
 
-def fetch_emails_from_account(account_config, state_store: StateStore, window_24h: bool, include_spam: bool) -> List:
-    """Fetch emails from a single account."""
-    fetcher = IMAPEmailFetcher(
+def make_fetcher(account_config, app_config: AppConfig, metrics: Optional[Metrics] = None,
+                 rules: Optional[ImportanceRules] = None) -> IMAPEmailFetcher:
+    return IMAPEmailFetcher(
         host=account_config.imap_host,
+        port=account_config.imap_port,
         username=account_config.username,
         password=account_config.password,
         use_ssl=account_config.use_ssl,
-        account_key=account_config.provider
+        account_key=account_config.provider,
+        fetch_mode=app_config.imap_fetch_mode,
+        max_attachment_bytes=app_config.max_attachment_bytes,
+        spill_bytes=app_config.attachment_spill_bytes,
+        batch_size=app_config.imap_batch_size,
+        max_connections=app_config.imap_connections,
+        metrics=metrics,
+        # Partial fetches only download the headers that rules look at
+        header_fields=set(HEADER_FIELDS) | (rules.header_names() if rules else set()),
     )
+
+
+def fetch_emails_from_account(account_config, state_store: StateStore, window_24h: bool, include_spam: bool,
+                              app_config: AppConfig, on_batch: Optional[Callable[[List], None]] = None,
+                              metrics: Optional[Metrics] = None, rules: Optional[ImportanceRules] = None,
+                              skip_uids: Optional[Dict[str, Set[int]]] = None) -> Tuple[List, Dict]:
+    """Fetch emails from a single account.
     
-    last_run = state_store.get_last_run(account_config.provider)
-    emails = fetcher.fetch(last_run, window_24h, include_spam)
-    
-    # Update last run time
-    state_store.set_last_run(account_config.provider)
+    Returns the emails and the account's updated per-mailbox UID marks,
+    which are only saved (with the last-run time) once the digest is written.
+    """
+    fetcher = make_fetcher(account_config, app_config, metrics, rules)
     
-    return emails
+    last_run = state_store.get_last_run(account_config.provider)
+    marks = state_store.get_mailbox_marks(account_config.provider)
+    with fetcher.metrics.span("fetch_account", account=account_config.provider):
+        emails = fetcher.fetch(last_run, window_24h, include_spam, mailbox_marks=marks, on_batch=on_batch,
+                               skip_uids=skip_uids)
+    fetcher.metrics.inc("emails_fetched", len(emails), account=account_config.provider)
+    return emails, fetcher.mailbox_marks
+
+
+def load_importance_rules(config: AppConfig) -> ImportanceRules:
+    """Rules from IMPORTANCE_RULES, else <state_dir>/rules.json, else the defaults."""
+    path = config.importance_rules_path
+    if not path:
+        default_path = os.path.join(config.state_dir, "rules.json")
+        if not os.path.exists(default_path):
+            return ImportanceRules()
+        path = default_path
+    return ImportanceRules.load(path)
 
 
 @click.command()
@@ -41,12 +85,33 @@ def fetch_emails_from_account(account_config, state_store: StateStore, window_24
 @click.option('--outlook-only', is_flag=True, help='Only process Outlook account')
 @click.option('--no-spam', is_flag=True, help='Exclude spam/junk folders')
 @click.option('--output', '-o', help='Output file path (default: print to stdout)')
-def main(window_24h: bool, gmail_only: bool, outlook_only: bool, no_spam: bool, output: str):
+@click.option('--concurrency', type=int, help='Number of Ollama requests kept in flight (default: OLLAMA_CONCURRENCY or 4)')
+@click.option('--no-cache', is_flag=True, help='Ignore cached summaries and attachment text for this run')
+@click.option('--batch-tokens', type=int, help='Pack short emails into shared prompts up to this many tokens (default: OLLAMA_BATCH_TOKENS, 0 disables)')
+@click.option('--no-threads', is_flag=True, help='Summarize every email separately instead of once per conversation')
+@click.option('--no-dedup', is_flag=True, help='Summarize near-identical emails separately instead of collapsing them')
+@click.option('--llm-threshold', type=float, help='Summarize emails scoring below this importance score extractively, without the LLM (default: LLM_MIN_SCORE)')
+@click.option('--time-budget', type=float, help='Seconds the digest may spend summarizing; the most important mail goes first and the rest gets quick extractive summaries (default: TIME_BUDGET, 0 for no limit)')
+@click.option('--no-overview', is_flag=True, help='Leave out the executive summary of large digests')
+@click.option('--daemon', is_flag=True, help='Keep running: watch mailboxes with IDLE and summarize mail as it arrives')
+@click.option('--from-store', is_flag=True, help='Build the digest from the local message store instead of IMAP (mail stored since the last such digest, or --24h)')
+@click.option('--search', 'search_query', help='Full-text search stored mail and exit')
+@click.option('--metrics-json', help='Write a JSON run report with per-stage timings and counters (default: METRICS_JSON)')
+@click.option('--metrics-prom', help='Write run metrics as a Prometheus textfile (default: METRICS_PROM)')
+def main(window_24h: bool, gmail_only: bool, outlook_only: bool, no_spam: bool, output: str, concurrency: int, no_cache: bool,
+         batch_tokens: Optional[int], no_threads: bool, no_dedup: bool, llm_threshold: Optional[float], time_budget: Optional[float], no_overview: bool, daemon: bool, from_store: bool, search_query: Optional[str], metrics_json: Optional[str], metrics_prom: Optional[str]):
     """Email Summarizer - Fetch and summarize emails from Gmail and Outlook."""
     
+    metrics = Metrics()
+    # Locks on the accounts (or digest) this run works on, held until it ends
+    locks = ExitStack()
+    # Stores, the summarizer and the journal, closed (last opened first) on success and on errors
+    resources = ExitStack()
     try:
         # Load configuration
         config = load_config_from_env()
+        metrics_json = metrics_json or config.metrics_json_path
+        metrics_prom = metrics_prom or config.metrics_prom_path
         
         if not config.gmail and not config.outlook:
             click.echo("Error: No email accounts configured. Set GMAIL_USERNAME/GMAIL_PASSWORD and/or OUTLOOK_USERNAME/OUTLOOK_PASSWORD environment variables.", err=True)
@@ -54,48 +119,242 @@ def main(window_24h: bool, gmail_only: bool, outlook_only: bool, no_spam: bool,
         
         # Initialize state store
         state_store = StateStore(config.state_dir)
+        resources.callback(state_store.close)
+        store = MessageStore(os.path.join(config.state_dir, "messages.db")) if config.message_store else None
+        if store is not None:
+            resources.callback(store.close)
+        if store is None and (daemon or from_store or search_query):
+            click.echo("Error: --daemon, --from-store and --search need the message store (MESSAGE_STORE=0 disables it).", err=True)
+            sys.exit(1)
+        if search_query:
+            print_search_results(store, search_query)
+            metrics.set_gauge("run_success", 1)
+            return
+        rules = load_importance_rules(config)
         
         # Initialize summarizer
-        summarizer = EmailSummarizer(config.ollama_model)
-        
-        # Collect all emails
-        all_emails = []
+        summary_cache = None
+        fingerprints = None
+        attachment_cache = None
+        if not no_cache:
+            summary_cache = open_cache(
+                config.state_dir, "summaries",
+                config.summary_cache_max_entries, config.summary_cache_max_age_days,
+            )
+            fingerprints = FingerprintStore(config.state_dir)
+            attachment_cache = open_cache(
+                config.state_dir, "attachments",
+                config.attachment_cache_max_entries, config.attachment_cache_max_age_days,
+            )
+        attachment_pool = AttachmentPool(
+            max_workers=max(0, config.attachment_workers),
+            timeout=config.attachment_timeout,
+            max_bytes=config.max_attachment_bytes,
+            memory_limit_mb=config.attachment_memory_mb,
+            cache=attachment_cache,
+            metrics=metrics,
+        )
+        max_workers = concurrency or config.ollama_concurrency
+        backend = OllamaBackend(
+            config.ollama_model,
+            config.ollama_url,
+            timeout=config.ollama_timeout,
+            stream=config.ollama_stream,
+            pool_size=max_workers,
+            retries=config.ollama_retries,
+            keep_alive=config.ollama_keep_alive or None,
+        )
+        summarizer = EmailSummarizer(
+            config.ollama_model,
+            config.ollama_url,
+            max_workers=max_workers,
+            request_timeout=config.ollama_timeout,
+            cache=summary_cache,
+            attachment_pool=attachment_pool,
+            batch_token_budget=config.ollama_batch_tokens if batch_tokens is None else batch_tokens,
+            backend=backend,
+            metrics=metrics,
+            rules=rules,
+            group_threads=config.thread_conversations and not no_threads,
+            collapse_duplicates=config.collapse_duplicates and not no_dedup,
+            fingerprints=fingerprints,
+            llm_min_score=config.llm_min_score if llm_threshold is None else llm_threshold,
+            extractive_bulk=config.extractive_bulk,
+            content_token_budget=config.prompt_content_tokens,
+            time_budget=(config.time_budget if time_budget is None else time_budget) or None,
+            overview_min_entries=0 if no_overview else config.overview_min_entries,
+        )
+        resources.callback(summarizer.close)
+        # Load the model while mail is downloading
+        summarizer.warmup()
         
+        accounts = []
         if config.gmail and not outlook_only:
-            click.echo("Fetching emails from Gmail...")
-            gmail_emails = fetch_emails_from_account(
-                config.gmail, state_store, window_24h, not no_spam
-            )
-            all_emails.extend(gmail_emails)
-            click.echo(f"Found {len(gmail_emails)} emails from Gmail")
+            accounts.append(("Gmail", config.gmail))
+        if config.outlook and not gmail_only:
+            accounts.append(("Outlook", config.outlook))
         
-        if config.outlook and not outlook_only:
-            click.echo("Fetching emails from Outlook...")
-            outlook_emails = fetch_emails_from_account(
-                config.outlook, state_store, window_24h, not no_spam
-            )
-            all_emails.extend(outlook_emails)
-            click.echo(f"Found {len(outlook_emails)} emails from Outlook")
+        # Runs working on the same account (or on the stored digest) would repeat each other's work
+        for key in ([DIGEST_STATE_KEY] if from_store else [account_config.provider for _, account_config in accounts]):
+            locks.enter_context(state_store.lock(key))
+        
+        if daemon:
+            run_daemon(accounts, config, state_store, summarizer, store, window_24h, not no_spam, metrics, rules)
+            summarizer.close()
+            metrics.set_gauge("run_success", 1)
+            return
+        
+        digest_started = datetime.now(timezone.utc)
+        precomputed = None
+        journal = None
+        account_marks = {}
+        if from_store:
+            # Stored by the daemon or earlier runs; summaries by this model are reused
+            providers = [account_config.provider for _, account_config in accounts]
+            if window_24h:
+                all_emails = store.load(since=digest_started - timedelta(days=1), accounts=providers)
+            else:
+                all_emails = store.load(stored_since=state_store.get_last_run(DIGEST_STATE_KEY), accounts=providers)
+            precomputed = store.summaries([email.key for email in all_emails], config.ollama_model, PROMPT_VERSION)
+            click.echo(f"Found {len(all_emails)} stored emails ({len(precomputed)} already summarized)")
+        else:
+            # Messages an interrupted run already stored are picked up instead of fetched again
+            journal = RunJournal(state_store, store, summarizer)
+            # Closed before the summarizer: pending saves still wait on attachment parses
+            resources.callback(journal.close)
+            resumed = {}
+            precomputed = {}
+            for name, account_config in accounts:
+                emails, summaries, skip_uids = journal.resume(account_config.provider)
+                resumed[name] = (emails, skip_uids)
+                precomputed.update(summaries)
+                if emails:
+                    click.echo(f"Resuming interrupted run: {len(emails)} emails from {name} already fetched"
+                               f" ({len(summaries)} summarized)")
+            
+            def on_batch(provider: str) -> Callable[[List], None]:
+                def fetched(batch: List) -> None:
+                    summarizer.prefetch(batch)
+                    journal.fetched(provider, batch)
+                return fetched
+            
+            # Fetch accounts in parallel; summaries start as soon as each batch arrives
+            emails_by_account = {}
+            with ThreadPoolExecutor(max_workers=max(1, len(accounts)), thread_name_prefix="account") as pool:
+                futures = {}
+                for name, account_config in accounts:
+                    click.echo(f"Fetching emails from {name}...")
+                    futures[pool.submit(
+                        fetch_emails_from_account,
+                        account_config, state_store, window_24h, not no_spam, config,
+                        on_batch(account_config.provider), metrics, rules, resumed[name][1],
+                    )] = (name, account_config.provider)
+                for future in as_completed(futures):
+                    name, provider = futures[future]
+                    emails_by_account[name], account_marks[provider] = future.result()
+                    click.echo(f"Found {len(emails_by_account[name])} emails from {name}")
+            
+            # Collect all emails
+            all_emails = []
+            for name, _ in accounts:
+                all_emails.extend(resumed[name][0] + emails_by_account[name])
         
         if not all_emails:
             click.echo("No emails found for the specified time period.")
+            for provider, marks in account_marks.items():
+                state_store.complete_run(provider, marks, digest_started)
+            metrics.set_gauge("run_success", 1)
             return
         
-        # Generate digest
+        # Generate digest, writing each section as soon as it is ready
         click.echo("Generating digest...")
-        digest = summarizer.generate_daily_digest(all_emails)
-        
-        # Output result
-        if output:
-            with open(output, 'w', encoding='utf-8') as f:
-                f.write(digest)
-            click.echo(f"Digest saved to {output}")
-        else:
-            click.echo(digest)
+        sections = summarizer.iter_daily_digest(all_emails, summaries=precomputed)
+        digest_text = []
+        with metrics.span("digest"):
+            if output:
+                with open(output, 'w', encoding='utf-8') as f:
+                    for section in sections:
+                        f.write(section + "\n")
+                        f.flush()
+                        digest_text.append(section)
+                        if journal is not None:
+                            journal.summarized()
+                click.echo(f"Digest saved to {output}")
+            else:
+                for section in sections:
+                    click.echo(section)
+                    digest_text.append(section)
+                    if journal is not None:
+                        journal.summarized()
+        if journal is not None:
+            # Every fetched batch is in the store once the journal is done saving
+            journal.close()
+        if store is not None:
+            with metrics.span("store"):
+                store.set_summaries(summarizer.last_summaries.items(), config.ollama_model, PROMPT_VERSION)
+                store.add_digest("\n".join(digest_text), config.ollama_model, len(all_emails))
+                if config.store_retention_days:
+                    store.prune(digest_started - timedelta(days=config.store_retention_days))
+        summarizer.close()
+        # Only now is the mail of this run accounted for
+        for provider, marks in account_marks.items():
+            state_store.complete_run(provider, marks, digest_started)
+        if from_store and not window_24h:
+            state_store.set_last_run(DIGEST_STATE_KEY, digest_started)
+        click.echo(summarizer.throughput_report())
+        for title, name, cache in (("Summary", "summaries", summary_cache), ("Attachment", "attachments", attachment_cache)):
+            if cache is None:
+                continue
+            click.echo(f"{title} cache: {cache.stats()}")
+            metrics.inc("cache_hits", cache.hits, cache=name)
+            metrics.inc("cache_misses", cache.misses, cache=name)
+            metrics.inc("cache_evictions", cache.prune(), cache=name)
+        metrics.set_gauge("run_success", 1)
             
     except Exception as e:
+        metrics.set_gauge("run_success", 0)
         click.echo(f"Error: {e}", err=True)
         sys.exit(1)
+    finally:
+        try:
+            resources.close()
+        finally:
+            locks.close()
+            _export_metrics(metrics, metrics_json, metrics_prom)
+
+
+def print_search_results(store: MessageStore, query: str, limit: int = 20) -> None:
+    results = store.search(query, limit)
+    if not results:
+        click.echo("No stored emails match.")
+    for email, snippet in results:
+        click.echo(f"{email.date.strftime('%Y-%m-%d %H:%M')}  {email.from_addr}  {email.subject}")
+        if snippet:
+            click.echo(f"    {' '.join(snippet.split())}")
+
+
+def run_daemon(accounts, config: AppConfig, state_store: StateStore, summarizer: EmailSummarizer, store: MessageStore,
+               window_24h: bool, include_spam: bool, metrics: Metrics, rules: ImportanceRules) -> None:
+    """Summarize mail as it arrives until interrupted (Ctrl-C or SIGTERM)."""
+    summary_daemon = SummaryDaemon(summarizer, store, state_store, poll_interval=config.daemon_poll_interval)
+    signal.signal(signal.SIGTERM, lambda *_: summary_daemon.stop())
+    fetchers = [make_fetcher(account_config, config, metrics, rules) for _, account_config in accounts]
+    click.echo(f"Watching {', '.join(name for name, _ in accounts)} for new mail...")
+    try:
+        summary_daemon.run(fetchers, include_spam, window_24h)
+    except KeyboardInterrupt:
+        summary_daemon.stop()
+    click.echo("Daemon stopped")
+
+
+def _export_metrics(metrics: Metrics, json_path: Optional[str], prom_path: Optional[str]) -> None:
+    try:
+        if json_path:
+            metrics.write_json(json_path)
+        if prom_path:
+            metrics.write_prometheus(prom_path)
+    except OSError as e:
+        click.echo(f"Could not write metrics: {e}", err=True)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,204 @@
+"""Prompt compaction: keep the text worth sending to the model.
+
+Email bodies carry a lot besides what the sender just wrote: the quoted
+history of a reply, signatures, legal disclaimers, unsubscribe footers
+and long tracking links. compact() removes those and fit_tokens() trims
+what is left to a token budget at a sentence or word boundary, so the
+prompt holds as much of the real content as the budget allows.
+"""
+import re
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+_ATTRIBUTION = re.compile(r"^On\b.{0,300}?\bwrote:\s*$", re.IGNORECASE | re.MULTILINE | re.DOTALL)
+# Outlook-style reply headers, or a separator line, start the quoted original
+_ORIGINAL = re.compile(
+    r"^(?:-{2,}\s*Original Message\s*-{2,}|_{10,}\s*$|From:\s.*\n(?:.*\n){0,3}?(?:Sent|Date):\s)",
+    re.IGNORECASE | re.MULTILINE,
+)
+# RFC 3676 signature separator ("-- ", a bare "--" is often just a divider),
+# and the footers mobile clients append
+_SIGNATURE = re.compile(
+    r"^-- \r?$|^(?:Sent from my\b|Sent from (?:Mail|Outlook|Yahoo Mail)\b|Get Outlook for\b).*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# A closing line, followed only by a name/contact block, ends the message
+_SIGN_OFF = re.compile(
+    r"^[ \t]*(?:best|best regards|kind regards|warm regards|regards|thanks|many thanks|thank you|cheers|"
+    r"sincerely|yours truly|all the best|talk soon)[ \t]*[,.!]?[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# Last word of a line ending like a sentence; "Inc." or an initial is not one
+_SENTENCE_LINE = re.compile(r"(\w*)([.!?])[\"')\]]*$")
+_ABBREVIATION = re.compile(r"[A-Z][A-Za-z]{0,3}")
+_POSTSCRIPT = re.compile(r"^\s*P\.?\s?S\b", re.IGNORECASE)
+_DISCLAIMER = re.compile(
+    r"intended (?:solely )?(?:for the )?(?:named )?recipient|confidentiality notice|privileged and confidential|"
+    r"(?:e-?mail|message) (?:and any attachments )?(?:is|are|may be|may contain) (?:confidential|privileged)|"
+    r"you (?:are receiving|received) this (?:e-?mail|message|newsletter)|this (?:e-?mail|message) was sent to\b|"
+    r"\bunsubscribe\b|manage (?:your )?(?:e-?mail |subscription )?preferences|"
+    r"view (?:this (?:e-?mail|message) |it )?in (?:your|a) (?:web )?browser|do not reply to this (?:e-?mail|message)|"
+    r"please consider the environment before printing",
+    re.IGNORECASE,
+)
+_FORWARDED = re.compile(r"^[ \t]*(?:-+[ \t]*Forwarded message[ \t]*-+|Begin forwarded message:)[ \t]*$",
+                        re.IGNORECASE | re.MULTILINE)
+_URL = re.compile(r"<?\b(?:https?://|www\.)[^\s<>\"')\]]+>?", re.IGNORECASE)
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_RULE = re.compile(r"^[ \t]*[-=_*~#]{4,}[ \t]*$", re.MULTILINE)
+_SENTENCE_END = re.compile(r"[.!?](?=\s)")
+
+# Only the start of very long bodies is compacted; the rest would not fit a prompt anyway
+MAX_CHARS = 50000
+
+# Trailing lines after a closing line that still count as a signature
+MAX_SIGNATURE_LINES = 6
+MAX_SIGNATURE_LINE_CHARS = 80
+
+# Paragraphs this long are never treated as disclaimers or footers
+MAX_FOOTER_CHARS = 1200
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English)."""
+    return len(text) // 4 + 1
+
+
+def strip_quoted(text: str) -> str:
+    """Drop the quoted history a client appends to a reply."""
+    cut = len(text)
+    for pattern in (_ATTRIBUTION, _ORIGINAL):
+        match = pattern.search(text)
+        if match:
+            cut = min(cut, match.start())
+    lines = [line for line in text[:cut].splitlines() if not line.lstrip().startswith(">")]
+    return "\n".join(lines).strip()
+
+
+def _sentence(line: str) -> bool:
+    if _POSTSCRIPT.match(line):
+        return True
+    match = _SENTENCE_LINE.search(line.rstrip())
+    return bool(match) and not (match.group(2) == "." and _ABBREVIATION.fullmatch(match.group(1)))
+
+
+def _signature_block(lines: List[str]) -> bool:
+    """Whether the lines after a closing line look like a name/contact block rather than body text."""
+    lines = [line for line in lines if line.strip()]
+    return len(lines) <= MAX_SIGNATURE_LINES and all(
+        len(line) <= MAX_SIGNATURE_LINE_CHARS and not _sentence(line) for line in lines
+    )
+
+
+def strip_signature(text: str) -> str:
+    """Drop a signature block and mobile "Sent from" footers.
+
+    >>> strip_signature("Can we meet at 3?\\n\\nBest,\\nBob Smith\\nVP Sales, Acme Inc.")
+    'Can we meet at 3?'
+    >>> strip_signature("Hi team,\\n\\nThanks.\\nWe need approval by Friday.\\n\\nBob")
+    'Hi team,\\n\\nThanks.\\nWe need approval by Friday.\\n\\nBob'
+    >>> strip_signature("It shipped.\\n\\nThanks!\\nPS: the deck is attached")
+    'It shipped.\\n\\nThanks!\\nPS: the deck is attached'
+    >>> strip_signature("Agenda\\n--\\n1. Budget review\\n2. Hiring")
+    'Agenda\\n--\\n1. Budget review\\n2. Hiring'
+    >>> strip_signature("See you then.\\n-- \\nBob")
+    'See you then.'
+    """
+    match = _SIGNATURE.search(text)
+    if match:
+        text = text[:match.start()]
+    # Only the last closing line counts, and only with something above it
+    for match in reversed(list(_SIGN_OFF.finditer(text))):
+        if text[:match.start()].strip() and _signature_block(text[match.end():].splitlines()):
+            text = text[:match.start()]
+        break
+    return text.rstrip()
+
+
+def strip_boilerplate(text: str) -> str:
+    """Drop disclaimer, unsubscribe and "view in browser" paragraphs."""
+    paragraphs = [
+        paragraph for paragraph in _PARAGRAPH_BREAK.split(text)
+        if not (len(paragraph) <= MAX_FOOTER_CHARS and _DISCLAIMER.search(paragraph))
+    ]
+    return "\n\n".join(paragraphs)
+
+
+def _link(match: "re.Match[str]") -> str:
+    url = match.group(0).strip("<>")
+    # Sentence punctuation right after a link is not part of it
+    stripped = url.rstrip(".,;:!?")
+    host = urlsplit(stripped if "://" in stripped else "http://" + stripped).hostname or ""
+    if host.startswith("www."):
+        host = host[4:]
+    return (f"<{host}>" if host else "") + url[len(stripped):]
+
+
+def collapse_urls(text: str) -> str:
+    """Replace each link with its host name: tracking paths and query strings carry nothing to summarize."""
+    return _URL.sub(_link, text)
+
+
+def normalize_whitespace(text: str) -> str:
+    """Collapse runs of spaces and blank lines, and drop separator rules."""
+    text = _RULE.sub("", text)
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    return _PARAGRAPH_BREAK.sub("\n\n", "\n".join(lines)).strip()
+
+
+def compact(text: str, quoted: bool = False) -> str:
+    """Body text without quoted history, signature, boilerplate or long links.
+
+    Quoted history is kept with ``quoted=True``, and in forwards, where
+    the forwarded message is the content.
+    """
+    if not text:
+        return ""
+    text = text[:MAX_CHARS]
+    if not quoted:
+        forwarded = _FORWARDED.search(text)
+        above = text[:forwarded.start()] if forwarded else ""
+        if forwarded is None or _ATTRIBUTION.search(above) or _ORIGINAL.search(above):
+            text = strip_quoted(text) or text
+    return normalize_whitespace(collapse_urls(strip_signature(strip_boilerplate(text))))
+
+
+def compact_document(text: str) -> str:
+    """Attachment text with links collapsed and whitespace normalized; nothing else is removed."""
+    return normalize_whitespace(collapse_urls(text)) if text else ""
+
+
+def fit_tokens(text: str, max_tokens: int) -> str:
+    """Text cut to about max_tokens, at the last sentence (or word) boundary that fits."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    limit = max(0, (max_tokens - 1) * 4 - 3)
+    head = text[:limit]
+    # Prefer ending on a full sentence, as long as that keeps most of the room
+    sentence_ends = [match.end() for match in _SENTENCE_END.finditer(head)]
+    if sentence_ends and sentence_ends[-1] >= limit * 0.7:
+        return head[:sentence_ends[-1]]
+    space = head.rfind(" ")
+    if space >= limit * 0.7:
+        head = head[:space]
+    return head.rstrip() + "..."
+
+
+def fill_budget(texts: List[str], max_tokens: int, per_text: Optional[int] = None,
+                min_tokens: int = 1) -> List[str]:
+    """Fit texts, in priority order, into one budget.
+
+    Each text takes what it needs (up to ``per_text`` tokens) from what
+    the ones before it left; a text left fewer than ``min_tokens`` comes
+    back empty.
+    """
+    remaining = max_tokens
+    fitted = []
+    for text in texts:
+        allowance = remaining if per_text is None else min(per_text, remaining)
+        text = fit_tokens(text, allowance) if allowance >= min_tokens else ""
+        remaining -= estimate_tokens(text) if text else 0
+        fitted.append(text)
+    return fitted
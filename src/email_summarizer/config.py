@@ -18,8 +18,54 @@ class AppConfig:
 	gmail: Optional[EmailAccountConfig]
 	outlook: Optional[EmailAccountConfig]
 	ollama_model: str = "llama3.1:8b"
+	ollama_url: str = "http://localhost:11434"
 	state_dir: str = os.path.expanduser("~/.email-summarizer")
 	include_spam: bool = True
+	ollama_concurrency: int = 4  # Requests kept in flight to Ollama
+	ollama_timeout: float = 60.0  # Seconds per Ollama request
+	ollama_batch_tokens: int = 0  # Pack short emails into prompts up to this size, 0 disables
+	prompt_content_tokens: int = 750  # Tokens of compacted email content per prompt
+	ollama_stream: bool = False  # Stream Ollama replies chunk by chunk
+	thread_conversations: bool = True  # Summarize each reply chain once instead of per email
+	collapse_duplicates: bool = True  # Summarize one email per cluster of near-identical bodies
+	llm_min_score: Optional[float] = None  # Emails scoring below this get an extractive summary, None sends all to the LLM
+	extractive_bulk: bool = True  # Spam-folder and bulk mail get an extractive summary instead of an LLM call
+	time_budget: Optional[float] = None  # Seconds of summarizing before the rest gets extractive summaries, None for no limit
+	overview_min_entries: int = 30  # Digests with this many entries get an executive summary, 0 disables
+	ollama_keep_alive: str = "30m"  # How long Ollama keeps the model loaded after a request
+	ollama_retries: int = 2  # Retries for connection errors, timeouts, 429 and 5xx
+	summary_cache_max_entries: int = 5000  # 0 disables the summary cache
+	summary_cache_max_age_days: float = 30.0
+	imap_fetch_mode: str = "partial"  # "partial" (structure first) or "full" (RFC822)
+	max_attachment_bytes: int = 10 * 1024 * 1024  # Larger attachments are not downloaded
+	attachment_spill_bytes: int = 256 * 1024  # Larger attachments are kept in temporary files, 0 keeps all in memory
+	imap_batch_size: int = 50  # Messages per FETCH command
+	imap_connections: int = 2  # Concurrent IMAP connections per account
+	attachment_workers: int = os.cpu_count() or 1  # 0 parses attachments inline
+	attachment_timeout: float = 30.0  # Seconds per attachment
+	attachment_memory_mb: int = 0  # Per-worker address space cap, 0 for none
+	attachment_cache_max_entries: int = 20000  # 0 disables the attachment text cache
+	attachment_cache_max_age_days: float = 90.0
+	importance_rules_path: str = ""  # JSON importance rules; defaults to <state_dir>/rules.json if present
+	metrics_json_path: str = ""  # Write a JSON run report here after each run
+	metrics_prom_path: str = ""  # Write a Prometheus textfile here after each run
+	daemon_poll_interval: float = 60.0  # Seconds between checks in --daemon mode when a server lacks IDLE
+	message_store: bool = True  # Keep parsed messages, summaries and digests in <state_dir>/messages.db
+	store_retention_days: float = 90.0  # Stored messages older than this are deleted, 0 keeps everything
+
+
+def _int_env(name: str, default: int) -> int:
+	try:
+		return int(os.getenv(name, "").strip() or default)
+	except ValueError:
+		return default
+
+
+def _float_env(name: str, default: float) -> float:
+	try:
+		return float(os.getenv(name, "").strip() or default)
+	except ValueError:
+		return default
 
 
 def load_config_from_env() -> AppConfig:
@@ -30,6 +76,38 @@ def load_config_from_env() -> AppConfig:
 	- GMAIL_USERNAME, GMAIL_PASSWORD (or app password)
 	- OUTLOOK_USERNAME, OUTLOOK_PASSWORD
 	- OLLAMA_MODEL (optional)
+	- OLLAMA_URL (optional, default http://localhost:11434)
+	- OLLAMA_CONCURRENCY (optional, default 4)
+	- OLLAMA_TIMEOUT (optional, seconds, default 60)
+	- OLLAMA_BATCH_TOKENS (optional, default 0 = no batching)
+	- PROMPT_CONTENT_TOKENS (optional, default 750)
+	- OLLAMA_STREAM (optional, "1" to stream replies)
+	- THREAD_CONVERSATIONS (optional, "0" to summarize every email separately)
+	- COLLAPSE_DUPLICATES (optional, "0" to summarize near-identical emails separately)
+	- LLM_MIN_SCORE (optional, importance score below which emails are summarized extractively)
+	- EXTRACTIVE_BULK (optional, "0" to send spam-folder and bulk mail to the LLM too)
+	- TIME_BUDGET (optional, seconds the digest may spend summarizing; unset for no limit)
+	- OVERVIEW_MIN_ENTRIES (optional, digest entries needed for an executive summary, default 30, 0 disables)
+	- OLLAMA_KEEP_ALIVE (optional, default "30m")
+	- OLLAMA_RETRIES (optional, default 2)
+	- SUMMARY_CACHE_MAX_ENTRIES (optional, default 5000, 0 disables)
+	- SUMMARY_CACHE_MAX_AGE_DAYS (optional, default 30)
+	- IMAP_FETCH_MODE (optional, "partial" or "full", default "partial")
+	- MAX_ATTACHMENT_MB (optional, default 10)
+	- ATTACHMENT_SPILL_KB (optional, default 256, 0 keeps attachments in memory)
+	- IMAP_BATCH_SIZE (optional, default 50)
+	- IMAP_CONNECTIONS (optional, per account, default 2)
+	- ATTACHMENT_WORKERS (optional, default CPU count, 0 parses inline)
+	- ATTACHMENT_TIMEOUT (optional, seconds, default 30)
+	- ATTACHMENT_MEMORY_MB (optional, default 0 = unlimited)
+	- ATTACHMENT_CACHE_MAX_ENTRIES (optional, default 20000, 0 disables)
+	- ATTACHMENT_CACHE_MAX_AGE_DAYS (optional, default 90)
+	- IMPORTANCE_RULES (optional, path to JSON importance rules)
+	- METRICS_JSON (optional, path for the JSON run report)
+	- METRICS_PROM (optional, path for the Prometheus textfile)
+	- DAEMON_POLL_INTERVAL (optional, seconds, default 60)
+	- MESSAGE_STORE (optional, "0" to keep no local copy of messages)
+	- STORE_RETENTION_DAYS (optional, default 90, 0 keeps everything)
 	- EMAIL_SUMMARIZER_STATE_DIR (optional)
 	"""
 	load_path = os.path.expanduser("~/.email-summarizer/config.env")
@@ -49,6 +127,42 @@ def load_config_from_env() -> AppConfig:
 	outlook_pass = os.getenv("OUTLOOK_PASSWORD", "").strip()
 
 	ollama_model = os.getenv("OLLAMA_MODEL", "llama3.1:8b").strip() or "llama3.1:8b"
+	ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434").strip() or "http://localhost:11434"
+	ollama_concurrency = _int_env("OLLAMA_CONCURRENCY", 4)
+	ollama_timeout = _float_env("OLLAMA_TIMEOUT", 60.0)
+	ollama_batch_tokens = _int_env("OLLAMA_BATCH_TOKENS", 0)
+	prompt_content_tokens = _int_env("PROMPT_CONTENT_TOKENS", 750)
+	ollama_stream = os.getenv("OLLAMA_STREAM", "").strip().lower() in ("1", "true", "yes")
+	thread_conversations = os.getenv("THREAD_CONVERSATIONS", "1").strip().lower() not in ("0", "false", "no")
+	collapse_duplicates = os.getenv("COLLAPSE_DUPLICATES", "1").strip().lower() not in ("0", "false", "no")
+	llm_min_score: Optional[float] = None
+	if os.getenv("LLM_MIN_SCORE", "").strip():
+		llm_min_score = _float_env("LLM_MIN_SCORE", 0.0)
+	extractive_bulk = os.getenv("EXTRACTIVE_BULK", "1").strip().lower() not in ("0", "false", "no")
+	time_budget: Optional[float] = None
+	if os.getenv("TIME_BUDGET", "").strip():
+		time_budget = _float_env("TIME_BUDGET", 0.0) or None
+	overview_min_entries = _int_env("OVERVIEW_MIN_ENTRIES", 30)
+	ollama_keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m").strip()
+	ollama_retries = _int_env("OLLAMA_RETRIES", 2)
+	summary_cache_max_entries = _int_env("SUMMARY_CACHE_MAX_ENTRIES", 5000)
+	summary_cache_max_age_days = _float_env("SUMMARY_CACHE_MAX_AGE_DAYS", 30.0)
+	imap_fetch_mode = os.getenv("IMAP_FETCH_MODE", "partial").strip().lower() or "partial"
+	max_attachment_bytes = int(_float_env("MAX_ATTACHMENT_MB", 10.0) * 1024 * 1024)
+	attachment_spill_bytes = int(_float_env("ATTACHMENT_SPILL_KB", 256.0) * 1024)
+	imap_batch_size = _int_env("IMAP_BATCH_SIZE", 50)
+	imap_connections = _int_env("IMAP_CONNECTIONS", 2)
+	attachment_workers = _int_env("ATTACHMENT_WORKERS", os.cpu_count() or 1)
+	attachment_timeout = _float_env("ATTACHMENT_TIMEOUT", 30.0)
+	attachment_memory_mb = _int_env("ATTACHMENT_MEMORY_MB", 0)
+	attachment_cache_max_entries = _int_env("ATTACHMENT_CACHE_MAX_ENTRIES", 20000)
+	attachment_cache_max_age_days = _float_env("ATTACHMENT_CACHE_MAX_AGE_DAYS", 90.0)
+	importance_rules_path = os.path.expanduser(os.getenv("IMPORTANCE_RULES", "").strip())
+	metrics_json_path = os.path.expanduser(os.getenv("METRICS_JSON", "").strip())
+	metrics_prom_path = os.path.expanduser(os.getenv("METRICS_PROM", "").strip())
+	daemon_poll_interval = _float_env("DAEMON_POLL_INTERVAL", 60.0)
+	message_store = os.getenv("MESSAGE_STORE", "1").strip().lower() not in ("0", "false", "no")
+	store_retention_days = _float_env("STORE_RETENTION_DAYS", 90.0)
 	state_dir = os.getenv("EMAIL_SUMMARIZER_STATE_DIR", os.path.expanduser("~/.email-summarizer")).strip()
 
 	gmail = None
@@ -73,5 +187,37 @@ def load_config_from_env() -> AppConfig:
 		gmail=gmail,
 		outlook=outlook,
 		ollama_model=ollama_model,
+		ollama_url=ollama_url,
 		state_dir=state_dir,
+		ollama_concurrency=ollama_concurrency,
+		ollama_timeout=ollama_timeout,
+		ollama_batch_tokens=ollama_batch_tokens,
+		prompt_content_tokens=prompt_content_tokens,
+		ollama_stream=ollama_stream,
+		thread_conversations=thread_conversations,
+		collapse_duplicates=collapse_duplicates,
+		llm_min_score=llm_min_score,
+		extractive_bulk=extractive_bulk,
+		time_budget=time_budget,
+		overview_min_entries=overview_min_entries,
+		ollama_keep_alive=ollama_keep_alive,
+		ollama_retries=ollama_retries,
+		summary_cache_max_entries=summary_cache_max_entries,
+		summary_cache_max_age_days=summary_cache_max_age_days,
+		imap_fetch_mode=imap_fetch_mode,
+		max_attachment_bytes=max_attachment_bytes,
+		attachment_spill_bytes=attachment_spill_bytes,
+		imap_batch_size=imap_batch_size,
+		imap_connections=imap_connections,
+		attachment_workers=attachment_workers,
+		attachment_timeout=attachment_timeout,
+		attachment_memory_mb=attachment_memory_mb,
+		attachment_cache_max_entries=attachment_cache_max_entries,
+		attachment_cache_max_age_days=attachment_cache_max_age_days,
+		importance_rules_path=importance_rules_path,
+		metrics_json_path=metrics_json_path,
+		metrics_prom_path=metrics_prom_path,
+		daemon_poll_interval=daemon_poll_interval,
+		message_store=message_store,
+		store_retention_days=store_retention_days,
 	)
@@ -0,0 +1,157 @@
+"""Group fetched emails into conversations.
+
+Messages are linked through Message-ID, In-Reply-To and References, the
+same way mail clients thread them. A reply whose client dropped those
+headers is attached to an earlier message in the same account with the
+same subject once "Re:"/"Fwd:" prefixes are removed.
+
+Each conversation can then be summarized with one prompt holding only the
+new text of every message: quoted history, signatures, boilerplate (see
+compaction) and paragraphs already seen earlier in the thread are dropped.
+"""
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from email.utils import parseaddr
+from typing import Dict, Hashable, List, Tuple
+
+from .compaction import compact
+from .imap_fetcher import FetchedEmail
+
+_REPLY_PREFIX = re.compile(r"^\s*(?:(?:re|fwd?|aw|wg|sv|vs|tr)\s*(?:\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+def normalize_subject(subject: str) -> str:
+    """Subject without reply/forward prefixes, lower-cased and whitespace-collapsed."""
+    return " ".join(_REPLY_PREFIX.sub("", subject or "").split()).lower()
+
+
+def is_reply(email: FetchedEmail) -> bool:
+    return bool(email.in_reply_to or email.references or _REPLY_PREFIX.match(email.subject or ""))
+
+
+@dataclass
+class Conversation:
+    emails: List[FetchedEmail] = field(default_factory=list)  # oldest first
+
+    @property
+    def subject(self) -> str:
+        root = self.emails[0].subject if self.emails else ""
+        return _REPLY_PREFIX.sub("", root).strip() or root
+
+    @property
+    def latest(self) -> FetchedEmail:
+        return self.emails[-1]
+
+    @property
+    def date(self) -> datetime:
+        return self.latest.date
+
+    def participants(self) -> List[str]:
+        """Distinct senders in order of first appearance."""
+        seen = set()
+        names = []
+        for email in self.emails:
+            address = parseaddr(email.from_addr)[1].lower() or email.from_addr
+            if address not in seen:
+                seen.add(address)
+                names.append(email.from_addr)
+        return names
+
+    def messages(self) -> List[Tuple[FetchedEmail, str]]:
+        """(email, new text) per distinct message, without repeated history.
+
+        A message delivered to more than one mailbox appears once.
+        Paragraphs that already appeared earlier in the thread, such as
+        signatures, are left out.
+        """
+        seen_ids = set()
+        seen_paragraphs = set()
+        result = []
+        for email in self.emails:
+            if email.message_id:
+                if email.message_id in seen_ids:
+                    continue
+                seen_ids.add(email.message_id)
+            paragraphs = []
+            for paragraph in _PARAGRAPH_BREAK.split(compact(email.body_text)):
+                key = " ".join(paragraph.split()).lower()
+                if not key or key in seen_paragraphs:
+                    continue
+                seen_paragraphs.add(key)
+                paragraphs.append(paragraph.strip())
+            result.append((email, "\n\n".join(paragraphs)))
+        return result
+
+    def __len__(self) -> int:
+        return len(self.emails)
+
+
+class _DisjointSet:
+    def __init__(self) -> None:
+        self.parent: Dict[Hashable, Hashable] = {}
+
+    def find(self, node: Hashable) -> Hashable:
+        self.parent.setdefault(node, node)
+        root = node
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[node] != root:
+            self.parent[node], node = root, self.parent[node]
+        return root
+
+    def union(self, a: Hashable, b: Hashable) -> None:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+
+def group_conversations(emails: List[FetchedEmail]) -> List[Conversation]:
+    """Group emails into conversations, ordered by each one's first email in the input.
+
+    Messages within a conversation are sorted by date.
+    """
+    links = _DisjointSet()
+    roots_by_subject: Dict[Tuple[str, str], int] = {}
+    orphans: List[Tuple[int, Tuple[str, str]]] = []
+    for index, email in enumerate(emails):
+        node = ("email", index)
+        links.find(node)
+        ids = [email.message_id, email.in_reply_to] + email.references
+        for message_id in ids:
+            if message_id:
+                links.union(node, ("id", message_id))
+
+        subject_key = (email.account, normalize_subject(email.subject))
+        if not subject_key[1]:
+            continue
+        if email.in_reply_to or email.references:
+            continue
+        if _REPLY_PREFIX.match(email.subject or ""):
+            orphans.append((index, subject_key))
+        else:
+            roots_by_subject.setdefault(subject_key, index)
+
+    # Replies without threading headers join a same-subject original, or each other
+    for index, subject_key in orphans:
+        links.union(("email", index), ("subject",) + subject_key)
+        if subject_key in roots_by_subject:
+            links.union(("email", roots_by_subject[subject_key]), ("subject",) + subject_key)
+
+    groups: Dict[Hashable, List[int]] = {}
+    for index in range(len(emails)):
+        groups.setdefault(links.find(("email", index)), []).append(index)
+    conversations = []
+    for indexes in groups.values():
+        members = sorted((emails[i] for i in indexes), key=lambda e: _timestamp(e.date))
+        conversations.append((indexes[0], Conversation(members)))
+    conversations.sort(key=lambda pair: pair[0])
+    return [conversation for _, conversation in conversations]
+
+
+def _timestamp(date: datetime) -> float:
+    try:
+        return date.timestamp()
+    except (OverflowError, OSError, ValueError):
+        return 0.0
@@ -0,0 +1,108 @@
+"""Long-running mode: summarize mail as it arrives.
+
+The daemon keeps one IMAP connection per watched mailbox open in IDLE (or
+polls servers without it). Each new message is fetched, its attachments
+parsed and the message summarized straight away. Message and summary go
+to the MessageStore, so the scheduled digest only has to assemble
+summaries (``email-summarizer --from-store``).
+
+When a reply arrives, the conversation it belongs to is summarized again
+from the stored messages. The digest rebuilds the same thread prompt from
+the store and finds that summary in the summary cache.
+"""
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Set, Tuple
+
+from .conversations import group_conversations, is_reply
+from .imap_fetcher import FetchedEmail, IMAPEmailFetcher, MailboxMark
+from .state import StateStore
+from .store import MessageStore
+from .summarizer import PROMPT_VERSION, EmailSummarizer
+
+# StateStore key holding when the last --from-store digest was built
+DIGEST_STATE_KEY = "digest"
+
+
+class SummaryDaemon:
+    def __init__(self, summarizer: EmailSummarizer, store: MessageStore, state_store: StateStore,
+                 poll_interval: float = 60.0) -> None:
+        self.summarizer = summarizer
+        self.store = store
+        self.state_store = state_store
+        # Seconds between checks on servers without IDLE
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        # Summarizing is serialized so thread refreshes see every stored reply
+        self._lock = threading.Lock()
+
+    def process(self, emails: List[FetchedEmail]) -> None:
+        """Summarize and store newly arrived emails."""
+        with self._lock:
+            self.summarizer.summarize_arrivals(emails)
+            # Attachment text was just extracted for the summaries, so this hits the attachment cache
+            self.store.save((email, self.summarizer.attachment_texts(email)) for email in emails)
+            self.store.set_summaries(
+                self.summarizer.last_summaries.items(), self.summarizer.ollama_model, PROMPT_VERSION
+            )
+            if self.summarizer.group_threads:
+                self._refresh_threads(emails)
+        print(f"Summarized {len(emails)} new emails")
+
+    def _refresh_threads(self, emails: List[FetchedEmail]) -> None:
+        """Summarize each conversation the new emails extend, as the digest will."""
+        if not any(is_reply(email) for email in emails):
+            return
+        arrived: Set[Tuple[str, str, int]] = {email.key for email in emails}
+        stored = self.store.load(stored_since=self.state_store.get_last_run(DIGEST_STATE_KEY))
+        for conversation in group_conversations(stored):
+            if (len(conversation) > 1 and any(email.key in arrived for email in conversation.emails)
+                    and any(self.summarizer.needs_llm(conversation.emails))):
+                self.summarizer.summarize_thread(conversation)
+
+    def _synced(self, account_key: str) -> Callable[[str, MailboxMark], None]:
+        def synced(mailbox: str, mark: MailboxMark) -> None:
+            # One mailbox's sync says nothing about the account's other mailboxes,
+            # so the last-run time (their SINCE fallback) stays where it is
+            self.state_store.set_mailbox_mark(account_key, mailbox, mark)
+        return synced
+
+    def run(self, fetchers: List[IMAPEmailFetcher], include_spam: bool = True,
+            window_24h: bool = False) -> None:
+        """Watch every mailbox of every fetcher until stop() is called.
+
+        Mailboxes resume from their UID marks. Without one (or with
+        window_24h), the first sync covers mail since the last run, or
+        the last 24 hours.
+        """
+        day_ago = datetime.now(timezone.utc) - timedelta(days=1)
+        threads = []
+        for fetcher in fetchers:
+            since_dt = None if window_24h else self.state_store.get_last_run(fetcher.account_key)
+            since_dt = since_dt or day_ago
+            marks = {} if window_24h else self.state_store.get_mailbox_marks(fetcher.account_key)
+            for mailbox in fetcher.mailboxes(include_spam):
+                thread = threading.Thread(
+                    target=fetcher.watch,
+                    args=(mailbox, self.stop_event, self.process),
+                    kwargs={
+                        "since_dt": since_dt,
+                        "mailbox_marks": marks,
+                        "on_synced": self._synced(fetcher.account_key),
+                        "poll_interval": self.poll_interval,
+                    },
+                    name=f"watch-{fetcher.account_key}-{mailbox}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+        try:
+            while any(thread.is_alive() for thread in threads) and not self.stop_event.wait(1.0):
+                pass
+        finally:
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+    def stop(self) -> None:
+        self.stop_event.set()
@@ -0,0 +1,250 @@
+"""Near-duplicate detection for bulk mail.
+
+Each email body is normalized (lower-cased, links and addresses dropped)
+and reduced to a 64-bit SimHash over word 3-shingles. Two bodies from the
+same sender are near duplicates when their fingerprints differ in at most
+``max_distance`` bits. Numbers are kept, so mail that differs in an amount,
+date or order number does not look the same.
+Fingerprints are indexed by splitting them into ``max_distance + 1`` bands:
+any two within that distance agree exactly on at least one band, so each
+lookup only compares against the few fingerprints sharing a band and
+clustering a batch takes roughly linear time.
+
+FingerprintStore keeps the fingerprints of earlier runs, with the summary
+each one received, so a newsletter or notification that keeps arriving is
+recognized across runs as well.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from email.utils import parseaddr
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+from .imap_fetcher import FetchedEmail
+
+FINGERPRINT_BITS = 64
+
+# Differing bits tolerated between near duplicates
+MAX_DISTANCE = 3
+
+# Bodies with fewer words are too short to fingerprint reliably
+MIN_TOKENS = 20
+
+# Only the start of very long bodies is fingerprinted
+MAX_CHARS = 20000
+
+SHINGLE_SIZE = 3
+
+_URL = re.compile(r"(?:https?://|www\.)\S+|\S+@\S+\.\w+", re.IGNORECASE)
+_TOKEN = re.compile(r"[^\W\d_]+|\d+")
+
+T = TypeVar("T")
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Words and numbers of a body, with the links and addresses that vary per copy removed."""
+    return _TOKEN.findall(_URL.sub(" ", text[:MAX_CHARS].lower()))
+
+
+def sender(email: FetchedEmail) -> str:
+    """Sender address, lower-cased; only mail from the same sender is ever collapsed."""
+    return parseaddr(email.from_addr)[1].lower() or email.from_addr
+
+
+def fingerprint(text: str) -> Optional[int]:
+    """64-bit SimHash of a body's word shingles; None for bodies too short to compare."""
+    tokens = normalize_tokens(text)
+    if len(tokens) < MIN_TOKENS:
+        return None
+    digests = b"".join(
+        hashlib.blake2b(" ".join(tokens[i:i + SHINGLE_SIZE]).encode("utf-8"), digest_size=8).digest()
+        for i in range(len(tokens) - SHINGLE_SIZE + 1)
+    )
+    total = len(digests) // 8
+    # Count byte values per position, so the per-bit tally costs 8 * 256 steps
+    # per byte position rather than 64 per shingle
+    result = 0
+    for position in range(8):
+        ones = [0] * 8
+        for value, count in Counter(digests[position::8]).items():
+            for bit in range(8):
+                if value >> bit & 1:
+                    ones[bit] += count
+        for bit in range(8):
+            if ones[bit] * 2 > total:
+                result |= 1 << (position * 8 + bit)
+    return result
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex(Generic[T]):
+    """Fingerprints banded for lookup of the nearest one within max_distance."""
+
+    def __init__(self, max_distance: int = MAX_DISTANCE) -> None:
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        width = FINGERPRINT_BITS // bands
+        self._bands: List[Tuple[int, int]] = [
+            (i * width, (FINGERPRINT_BITS if i == bands - 1 else (i + 1) * width) - i * width)
+            for i in range(bands)
+        ]
+        self._tables: List[Dict[int, List[Tuple[int, T]]]] = [{} for _ in self._bands]
+        self._size = 0
+
+    def _keys(self, value: int) -> List[int]:
+        return [value >> shift & ((1 << width) - 1) for shift, width in self._bands]
+
+    def add(self, value: int, item: T) -> None:
+        for table, key in zip(self._tables, self._keys(value)):
+            table.setdefault(key, []).append((value, item))
+        self._size += 1
+
+    def find(self, value: int, accept: Optional[Callable[[T], bool]] = None) -> Optional[T]:
+        """Item whose fingerprint is nearest to value, if any is within max_distance
+        (among the items accept() is true for)."""
+        best: Optional[Tuple[int, T]] = None
+        for table, key in zip(self._tables, self._keys(value)):
+            for candidate, item in table.get(key, ()):
+                distance = hamming_distance(value, candidate)
+                if (distance <= self.max_distance and (best is None or distance < best[0])
+                        and (accept is None or accept(item))):
+                    best = (distance, item)
+        return best[1] if best else None
+
+    def __len__(self) -> int:
+        return self._size
+
+
+@dataclass
+class DuplicateCluster:
+    emails: List[FetchedEmail] = field(default_factory=list)  # input order
+    fingerprint: Optional[int] = None
+    sender: str = ""
+
+    @property
+    def representative(self) -> FetchedEmail:
+        return self.emails[0]
+
+    @property
+    def duplicates(self) -> List[FetchedEmail]:
+        return self.emails[1:]
+
+
+def cluster_duplicates(emails: List[FetchedEmail], max_distance: int = MAX_DISTANCE,
+                       fingerprints: Optional[Dict[Any, Optional[int]]] = None) -> List[DuplicateCluster]:
+    """Group near-identical emails, ordered by each cluster's first email.
+
+    Each email joins the cluster of the nearest earlier fingerprint from
+    the same sender within max_distance. Emails too short to fingerprint
+    stay on their own.
+    ``fingerprints`` may hold precomputed values keyed by email.key.
+    """
+    index: SimHashIndex[DuplicateCluster] = SimHashIndex(max_distance)
+    clusters: List[DuplicateCluster] = []
+    for email in emails:
+        if fingerprints is not None and email.key in fingerprints:
+            value = fingerprints[email.key]
+        else:
+            value = fingerprint(email.body_text)
+        address = sender(email)
+        cluster = None
+        if value is not None:
+            cluster = index.find(value, lambda candidate: candidate.sender == address)
+        if cluster is None:
+            cluster = DuplicateCluster(fingerprint=value, sender=address)
+            clusters.append(cluster)
+            if value is not None:
+                index.add(value, cluster)
+        cluster.emails.append(email)
+    return clusters
+
+
+class FingerprintStore:
+    """Fingerprints of earlier runs with the summary each one got.
+
+    Stored at: {state_dir}/fingerprints.json
+    Schema:
+    {
+        "entries": [
+            {"fingerprint": "9f0c...", "sender": "news@example.com", "subject": "...", "summary": "...",
+             "message": "<id@host>", "first_seen": 1700000000.0, "last_seen": 1700086400.0, "count": 14}
+        ]
+    }
+    ``message`` names the last message recorded against the entry; entries
+    only match mail from their ``sender``. The
+    least recently seen entries are dropped beyond max_entries or after
+    max_age_days.
+    """
+
+    def __init__(self, state_dir: str, max_entries: int = 5000, max_age_days: float = 30.0,
+                 max_distance: int = MAX_DISTANCE) -> None:
+        self.path = os.path.join(state_dir, "fingerprints.json")
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._entries: List[Dict[str, Any]] = []
+        self._index: SimHashIndex[Dict[str, Any]] = SimHashIndex(max_distance)
+        os.makedirs(state_dir, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f).get("entries", [])
+        except (OSError, ValueError, AttributeError):
+            # Missing or corrupt: start over
+            return
+        cutoff = time.time() - self.max_age_days * 86400 if self.max_age_days else 0
+        for entry in entries:
+            try:
+                value = int(entry["fingerprint"], 16)
+                if float(entry.get("last_seen", 0)) < cutoff:
+                    continue
+            except (KeyError, TypeError, ValueError):
+                continue
+            self._entries.append(entry)
+            self._index.add(value, entry)
+
+    def find(self, value: int, sender: str) -> Optional[Dict[str, Any]]:
+        """Entry of an earlier message from sender within max_distance of value."""
+        with self._lock:
+            return self._index.find(value, lambda entry: entry.get("sender") == sender)
+
+    def record(self, value: int, subject: str, summary: str, count: int = 1, message: str = "",
+               sender: str = "") -> None:
+        """Remember a summarized message, or refresh the entry it duplicates."""
+        now = time.time()
+        with self._lock:
+            entry = self._index.find(value, lambda entry: entry.get("sender") == sender)
+            if entry is None:
+                entry = {"fingerprint": f"{value:016x}", "sender": sender, "subject": subject, "summary": summary,
+                         "first_seen": now, "count": 0}
+                self._entries.append(entry)
+                self._index.add(value, entry)
+            elif summary:
+                entry["summary"] = summary
+            entry["last_seen"] = now
+            entry["message"] = message
+            entry["count"] = int(entry.get("count", 0)) + count
+
+    def save(self) -> None:
+        with self._lock:
+            entries = sorted(self._entries, key=lambda e: e.get("last_seen", 0), reverse=True)
+            if self.max_entries:
+                entries = entries[:self.max_entries]
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": entries}, f)
+            os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
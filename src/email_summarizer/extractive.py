@@ -0,0 +1,125 @@
+"""Extractive summaries: the most central sentences of a text, no model needed.
+
+Sentences are weighted with TF-IDF (each sentence counting as a document)
+and ranked with TextRank over their cosine similarities, with a small
+boost for sentences sharing words with the subject and for sentences near
+the start, where emails usually say what they are about. Everything is
+plain Python; a typical email takes about a millisecond.
+
+Used for mail that does not warrant an LLM call (spam, bulk mail, low
+priority) and as the fallback when the LLM fails or times out.
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List
+
+# Sentences ranked per text; later ones are ignored
+MAX_SENTENCES = 60
+
+# Only the start of very long texts is considered
+MAX_CHARS = 20000
+
+# Sentences shorter than this many words are ranked last
+MIN_WORDS = 4
+
+# Characters kept of each selected sentence
+MAX_SENTENCE_CHARS = 300
+
+DAMPING = 0.85
+ITERATIONS = 30
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])|\n\s*\n|\n(?=\s*(?:[-*•]|\d+[.)])\s)")
+_URL = re.compile(r"(?:https?://|www\.)\S+", re.IGNORECASE)
+_WORD = re.compile(r"[^\W\d_]{2,}")
+_STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having he her
+here hers him his how i if in into is it its just me more most my no nor not now of off on once only or
+other our ours out over own please same she should so some such than that the their them then there these
+they this those through to too under until up very was we were what when where which while who whom why
+will with would you your yours
+""".split())
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences (or bullet items and paragraphs) of a text, whitespace-collapsed."""
+    text = _URL.sub(" ", text[:MAX_CHARS])
+    sentences = (" ".join(part.split()) for part in _SENTENCE_END.split(text))
+    return [sentence for sentence in sentences if sentence]
+
+
+def _terms(sentence: str) -> List[str]:
+    return [word for word in _WORD.findall(sentence.lower()) if word not in _STOPWORDS]
+
+
+def _tfidf(sentences: List[List[str]]) -> List[Dict[str, float]]:
+    """Unit-length TF-IDF vector per sentence, with sentences as documents."""
+    frequency = Counter(term for terms in sentences for term in set(terms))
+    count = len(sentences)
+    vectors = []
+    for terms in sentences:
+        weights = {
+            term: (1 + math.log(tf)) * math.log(1 + count / frequency[term])
+            for term, tf in Counter(terms).items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        vectors.append({term: weight / norm for term, weight in weights.items()})
+    return vectors
+
+
+def _similarity(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(term, 0.0) for term, weight in a.items())
+
+
+def rank_sentences(sentences: List[str], subject: str = "") -> List[float]:
+    """TextRank score of each sentence, boosted by subject overlap and position."""
+    terms = [_terms(sentence) for sentence in sentences]
+    vectors = _tfidf(terms)
+    count = len(sentences)
+    edges: List[List[float]] = [[0.0] * count for _ in range(count)]
+    for i in range(count):
+        for j in range(i + 1, count):
+            edges[i][j] = edges[j][i] = _similarity(vectors[i], vectors[j])
+    totals = [sum(row) or 1.0 for row in edges]
+    scores = [1.0] * count
+    for _ in range(ITERATIONS):
+        scores = [
+            (1 - DAMPING) + DAMPING * sum(edges[j][i] * scores[j] / totals[j] for j in range(count) if edges[j][i])
+            for i in range(count)
+        ]
+    subject_terms = set(_terms(subject))
+    for i, sentence_terms in enumerate(terms):
+        if len(sentence_terms) < MIN_WORDS and len(sentences[i].split()) < MIN_WORDS:
+            scores[i] *= 0.1
+            continue
+        if subject_terms:
+            scores[i] += 0.5 * len(subject_terms.intersection(sentence_terms)) / len(subject_terms)
+        scores[i] += 0.3 / (1 + i)
+    return scores
+
+
+def extract(text: str, subject: str = "", max_sentences: int = 3) -> List[str]:
+    """The max_sentences highest-ranked sentences of text, in their original order."""
+    sentences = split_sentences(text)[:MAX_SENTENCES]
+    if len(sentences) <= max_sentences:
+        return sentences
+    scores = rank_sentences(sentences, subject)
+    best = sorted(range(len(sentences)), key=lambda i: -scores[i])[:max_sentences]
+    return [sentences[i] for i in sorted(best)]
+
+
+def summarize(text: str, subject: str = "", max_sentences: int = 3,
+              attachments: Iterable[str] = ()) -> str:
+    """Bullet-point summary made of the text's most central sentences; empty when nothing is readable."""
+    bullets = []
+    for sentence in extract(text, subject, max_sentences):
+        if len(sentence) > MAX_SENTENCE_CHARS:
+            sentence = sentence[:MAX_SENTENCE_CHARS].rsplit(" ", 1)[0] + "..."
+        bullets.append(f"• {sentence}")
+    attachments = list(attachments)
+    if attachments:
+        bullets.append(f"• Attachments: {', '.join(attachments)}")
+    return "\n".join(bullets)
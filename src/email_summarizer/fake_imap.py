@@ -0,0 +1,444 @@
+"""Minimal in-process IMAP4rev1 server for benchmarks and offline runs.
+
+Serves a fixed set of RFC 822 messages over plain TCP so the real
+IMAPClient/IMAPEmailFetcher code path, protocol parsing included, can be
+exercised without a mail provider:
+
+    with FakeIMAPServer({"INBOX": [raw1, raw2]}) as server:
+        fetcher = IMAPEmailFetcher(server.host, "user", "pass", use_ssl=False, port=server.port)
+
+Only the commands the fetcher uses are implemented: CAPABILITY, LOGIN,
+SELECT/EXAMINE, UID SEARCH, UID FETCH (including BODY[HEADER.FIELDS (...)]),
+IDLE, NOOP and LOGOUT. Any username and password are accepted.
+"""
+import email
+import re
+import select
+import socketserver
+import threading
+import time
+from datetime import datetime, timezone
+from email.message import Message
+from email.utils import getaddresses, parsedate_to_datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_FETCH_ITEM = re.compile(rb"BODY(?:\.PEEK)?\[[^\]]*\](?:<\d+\.\d+>)?|[A-Z0-9.]+", re.IGNORECASE)
+_SECTION = re.compile(rb"BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?", re.IGNORECASE)
+_TOKEN = re.compile(rb'"((?:[^"\\]|\\.)*)"|(\S+)')
+_LITERAL = re.compile(rb"\{(\d+)\+?\}\r\n$")
+
+
+def _nstring(value: Any) -> bytes:
+    """Encode a value as NIL, a quoted string or a literal."""
+    if value is None:
+        return b"NIL"
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    if b"\r" in value or b"\n" in value or any(byte > 126 for byte in value):
+        return b"{%d}\r\n%s" % (len(value), value)
+    return b'"' + value.replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"'
+
+
+def _plist(params: List[Tuple[str, str]]) -> bytes:
+    if not params:
+        return b"NIL"
+    return b"(" + b" ".join(_nstring(k.upper()) + b" " + _nstring(v) for k, v in params) + b")"
+
+
+def _addresses(msg: Message, header: str) -> bytes:
+    entries = []
+    for name, addr in getaddresses(msg.get_all(header, [])):
+        if not addr:
+            continue
+        mailbox, _, host = addr.partition("@")
+        entries.append(b"(" + b" ".join([_nstring(name or None), b"NIL", _nstring(mailbox), _nstring(host or None)]) + b")")
+    return b"(" + b"".join(entries) + b")" if entries else b"NIL"
+
+
+def _envelope(msg: Message) -> bytes:
+    from_ = _addresses(msg, "From")
+    fields = [
+        _nstring(msg.get("Date")),
+        _nstring(msg.get("Subject")),
+        from_,
+        _addresses(msg, "Sender") if msg.get("Sender") else from_,
+        _addresses(msg, "Reply-To") if msg.get("Reply-To") else from_,
+        _addresses(msg, "To"),
+        _addresses(msg, "Cc"),
+        _addresses(msg, "Bcc"),
+        _nstring(msg.get("In-Reply-To")),
+        _nstring(msg.get("Message-ID")),
+    ]
+    return b"(" + b" ".join(fields) + b")"
+
+
+def _raw_payload(part: Message) -> bytes:
+    payload = part.get_payload()
+    if isinstance(payload, str):
+        return payload.encode("utf-8", errors="surrogateescape")
+    return part.as_bytes()
+
+
+def _bodystructure(msg: Message, sections: Dict[str, bytes], section: str = "") -> bytes:
+    """Build BODYSTRUCTURE, recording each leaf's encoded content by section."""
+    maintype = msg.get_content_maintype()
+    subtype = msg.get_content_subtype()
+    params = [(k, v) for k, v in (msg.get_params() or [])[1:]]
+
+    if msg.is_multipart() and maintype == "multipart":
+        children = []
+        for index, child in enumerate(msg.get_payload(), start=1):
+            child_section = f"{section}.{index}" if section else str(index)
+            children.append(_bodystructure(child, sections, child_section))
+        return b"(" + b"".join(children) + b" " + _nstring(subtype.upper()) + b" " + _plist(params) + b" NIL NIL NIL)"
+
+    section = section or "1"
+    content = _raw_payload(msg)
+    sections[section] = content
+    fields = [
+        _nstring(maintype.upper()),
+        _nstring(subtype.upper()),
+        _plist(params),
+        _nstring(msg.get("Content-ID")),
+        _nstring(msg.get("Content-Description")),
+        _nstring((msg.get("Content-Transfer-Encoding") or "7bit").upper()),
+        str(len(content)).encode(),
+    ]
+    if maintype == "text":
+        fields.append(str(content.count(b"\n")).encode())
+    elif msg.get_content_type() == "message/rfc822":
+        inner = msg.get_payload(0)
+        fields += [_envelope(inner), _bodystructure(inner, {}, section), str(content.count(b"\n")).encode()]
+
+    disposition = msg.get_content_disposition()
+    if disposition:
+        filename = msg.get_filename()
+        disposition_data = b"(" + _nstring(disposition.upper()) + b" " + _plist([("filename", filename)] if filename else []) + b")"
+    else:
+        disposition_data = b"NIL"
+    fields += [b"NIL", disposition_data, b"NIL", b"NIL"]
+    return b"(" + b" ".join(fields) + b")"
+
+
+class _StoredMessage:
+    """A message with its FETCH data precomputed, so serving it is cheap."""
+
+    def __init__(self, uid: int, raw: bytes, internal_date: Optional[datetime]) -> None:
+        self.uid = uid
+        self.raw = raw
+        msg = email.message_from_bytes(raw)
+        if internal_date is None:
+            try:
+                internal_date = parsedate_to_datetime(msg.get("Date", ""))
+            except (TypeError, ValueError):
+                internal_date = None
+        internal_date = internal_date or datetime.now(timezone.utc)
+        if internal_date.tzinfo is None:
+            internal_date = internal_date.astimezone()
+        self.internal_date = internal_date
+        self.envelope = _envelope(msg)
+        self.header_items = msg.items()
+        self.sections: Dict[str, bytes] = {}
+        self.bodystructure = _bodystructure(msg, self.sections)
+        header_end = raw.find(b"\r\n\r\n")
+        separator = 4
+        if header_end < 0:
+            header_end = raw.find(b"\n\n")
+            separator = 2
+        if header_end < 0:
+            header_end, separator = len(raw), 0
+        self.sections["HEADER"] = raw[:header_end + separator]
+        self.sections["TEXT"] = raw[header_end + separator:]
+        self.sections[""] = raw
+
+
+class FakeIMAPServer:
+    """Serves ``mailboxes`` (name -> raw messages) on a local port.
+
+    UIDs are assigned from 1 in insertion order. ``latency`` seconds are
+    added to every command to simulate a round trip to a real provider.
+    Messages added while a client is in IDLE are announced with EXISTS.
+    """
+
+    def __init__(self, mailboxes: Optional[Dict[str, Iterable[bytes]]] = None, host: str = "127.0.0.1",
+                 port: int = 0, latency: float = 0.0, uidvalidity: int = 1, idle: bool = True) -> None:
+        self.latency = latency
+        self.uidvalidity = uidvalidity
+        # Advertise IDLE; without it clients have to poll
+        self.idle = idle
+        self._lock = threading.Lock()
+        self._mailboxes: Dict[str, List[_StoredMessage]] = {}
+        self.stats: Dict[str, int] = {"connections": 0, "commands": 0, "fetches": 0, "bytes_sent": 0}
+        for name, messages in (mailboxes or {}).items():
+            self.create_mailbox(name)
+            for raw in messages:
+                self.add_message(name, raw)
+        self._server = _Server((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def create_mailbox(self, name: str) -> None:
+        with self._lock:
+            self._mailboxes.setdefault(name, [])
+
+    def add_message(self, mailbox: str, raw: bytes, internal_date: Optional[datetime] = None) -> int:
+        """Append a message and return its UID."""
+        with self._lock:
+            messages = self._mailboxes.setdefault(mailbox, [])
+            uid = messages[-1].uid + 1 if messages else 1
+            messages.append(_StoredMessage(uid, raw, internal_date))
+            return uid
+
+    def start(self) -> "FakeIMAPServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-imap", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeIMAPServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def _snapshot(self, mailbox: str) -> Optional[List[_StoredMessage]]:
+        with self._lock:
+            messages = self._mailboxes.get(mailbox)
+            return list(messages) if messages is not None else None
+
+    def _handler(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            disable_nagle_algorithm = True
+
+            def setup(self) -> None:
+                super().setup()
+                server._count(connections=1)
+                self.selected: Optional[List[_StoredMessage]] = None
+                self.selected_name = ""
+
+            def send(self, data: bytes) -> None:
+                self.wfile.write(data)
+                self.wfile.flush()
+                server._count(bytes_sent=len(data))
+
+            def read_command(self) -> Optional[bytes]:
+                line = self.rfile.readline()
+                if not line:
+                    return None
+                # Inline literals, e.g. a password sent as {8}
+                match = _LITERAL.search(line)
+                while match:
+                    self.send(b"+ Ready\r\n")
+                    literal = self.rfile.read(int(match.group(1)))
+                    rest = self.rfile.readline()
+                    line = line[:match.start()] + _nstring(literal) + rest
+                    match = _LITERAL.search(line)
+                return line.rstrip(b"\r\n")
+
+            def handle(self) -> None:
+                self.send(b"* OK [CAPABILITY IMAP4rev1] Fake IMAP ready\r\n")
+                while True:
+                    try:
+                        line = self.read_command()
+                    except ConnectionError:
+                        return
+                    if line is None:
+                        return
+                    tag, _, rest = line.partition(b" ")
+                    command, _, args = rest.partition(b" ")
+                    server._count(commands=1)
+                    if server.latency:
+                        time.sleep(server.latency)
+                    try:
+                        if not self.dispatch(tag, command.upper(), args):
+                            return
+                    except ConnectionError:
+                        return
+                    except Exception as e:
+                        self.send(tag + b" BAD " + str(e).encode("utf-8", errors="replace") + b"\r\n")
+
+            def dispatch(self, tag: bytes, command: bytes, args: bytes) -> bool:
+                if command == b"CAPABILITY":
+                    capabilities = b"IMAP4rev1 IDLE" if server.idle else b"IMAP4rev1"
+                    self.send(b"* CAPABILITY " + capabilities + b"\r\n" + tag + b" OK CAPABILITY completed\r\n")
+                elif command == b"IDLE" and server.idle and self.selected is not None:
+                    self.idle(tag)
+                elif command in (b"LOGIN", b"NOOP", b"CHECK"):
+                    self.send(tag + b" OK " + command + b" completed\r\n")
+                elif command == b"LOGOUT":
+                    self.send(b"* BYE Logging out\r\n" + tag + b" OK LOGOUT completed\r\n")
+                    return False
+                elif command in (b"SELECT", b"EXAMINE"):
+                    self.select(tag, command, args)
+                elif command == b"CLOSE":
+                    self.selected = None
+                    self.send(tag + b" OK CLOSE completed\r\n")
+                elif command == b"UID":
+                    subcommand, _, subargs = args.partition(b" ")
+                    subcommand = subcommand.upper()
+                    if self.selected is None:
+                        self.send(tag + b" BAD No mailbox selected\r\n")
+                    elif subcommand == b"SEARCH":
+                        uids = [str(m.uid).encode() for m in self.search(subargs)]
+                        self.send(b"* SEARCH" + b"".join(b" " + uid for uid in uids) + b"\r\n"
+                                  + tag + b" OK SEARCH completed\r\n")
+                    elif subcommand == b"FETCH":
+                        self.fetch(tag, subargs)
+                    else:
+                        self.send(tag + b" BAD Unsupported UID command\r\n")
+                else:
+                    self.send(tag + b" BAD Unsupported command\r\n")
+                return True
+
+            def select(self, tag: bytes, command: bytes, args: bytes) -> None:
+                name = _tokens(args)[0].decode("utf-8")
+                messages = server._snapshot(name)
+                if messages is None:
+                    self.selected = None
+                    self.send(tag + b" NO Mailbox does not exist\r\n")
+                    return
+                self.selected = messages
+                self.selected_name = name
+                uidnext = messages[-1].uid + 1 if messages else 1
+                access = b"READ-ONLY" if command == b"EXAMINE" else b"READ-WRITE"
+                self.send(
+                    b"* %d EXISTS\r\n* 0 RECENT\r\n* FLAGS (\\Seen)\r\n"
+                    b"* OK [UIDVALIDITY %d] UIDs valid\r\n* OK [UIDNEXT %d] Predicted next UID\r\n"
+                    % (len(messages), server.uidvalidity, uidnext)
+                    + tag + b" OK [" + access + b"] " + command + b" completed\r\n"
+                )
+
+            def idle(self, tag: bytes) -> None:
+                self.send(b"+ idling\r\n")
+                while True:
+                    messages = server._snapshot(self.selected_name) or []
+                    if len(messages) > len(self.selected or []):
+                        self.selected = messages
+                        self.send(b"* %d EXISTS\r\n" % len(messages))
+                    readable, _, _ = select.select([self.connection], [], [], 0.05)
+                    if readable:
+                        line = self.rfile.readline()
+                        if not line:
+                            raise ConnectionError("client went away during IDLE")
+                        if line.strip().upper() == b"DONE":
+                            self.send(tag + b" OK IDLE terminated\r\n")
+                            return
+
+            def search(self, args: bytes) -> List[_StoredMessage]:
+                tokens = _tokens(args)
+                messages = self.selected or []
+                index = 0
+                while index < len(tokens):
+                    key = tokens[index].upper()
+                    if key == b"ALL":
+                        index += 1
+                    elif key == b"UID":
+                        wanted = _uid_set(tokens[index + 1], messages)
+                        messages = [m for m in messages if m.uid in wanted]
+                        index += 2
+                    elif key in (b"SINCE", b"BEFORE"):
+                        day = datetime.strptime(tokens[index + 1].decode(), "%d-%b-%Y").date()
+                        if key == b"SINCE":
+                            messages = [m for m in messages if m.internal_date.date() >= day]
+                        else:
+                            messages = [m for m in messages if m.internal_date.date() < day]
+                        index += 2
+                    else:
+                        raise ValueError(f"Unsupported search key {key.decode(errors='replace')}")
+                return messages
+
+            def fetch(self, tag: bytes, args: bytes) -> None:
+                uid_spec, _, items_spec = args.partition(b" ")
+                wanted = _uid_set(uid_spec, self.selected or [])
+                items = _FETCH_ITEM.findall(items_spec.strip().strip(b"()"))
+                server._count(fetches=1)
+                out = []
+                for seq, message in enumerate(self.selected or [], start=1):
+                    if message.uid not in wanted:
+                        continue
+                    out.append(b"* %d FETCH (" % seq + b" ".join(_fetch_item(message, item) for item in items) + b")\r\n")
+                out.append(tag + b" OK FETCH completed\r\n")
+                self.send(b"".join(out))
+
+        return Handler
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _tokens(args: bytes) -> List[bytes]:
+    return [quoted if quoted else atom for quoted, atom in _TOKEN.findall(args)]
+
+
+def _uid_set(spec: bytes, messages: List[_StoredMessage]) -> set:
+    """Expand an IMAP UID set such as 1,4:7,9:* against the mailbox."""
+    highest = messages[-1].uid if messages else 0
+    wanted = set()
+    for piece in spec.split(b","):
+        low, _, high = piece.partition(b":")
+        start = highest if low == b"*" else int(low)
+        end = start if not high else (highest if high == b"*" else int(high))
+        if start > end:
+            start, end = end, start
+        wanted.update(m.uid for m in messages if start <= m.uid <= end)
+    return wanted
+
+
+def _fetch_item(message: _StoredMessage, item: bytes) -> bytes:
+    name = item.upper()
+    if name == b"UID":
+        return b"UID %d" % message.uid
+    if name == b"FLAGS":
+        return b"FLAGS (\\Seen)"
+    if name == b"INTERNALDATE":
+        return b'INTERNALDATE "' + message.internal_date.strftime("%d-%b-%Y %H:%M:%S %z").encode() + b'"'
+    if name == b"RFC822.SIZE":
+        return b"RFC822.SIZE %d" % len(message.raw)
+    if name == b"RFC822":
+        return b"RFC822 " + _literal(message.raw)
+    if name == b"ENVELOPE":
+        return b"ENVELOPE " + message.envelope
+    if name in (b"BODYSTRUCTURE", b"BODY"):
+        return name + b" " + message.bodystructure
+    match = _SECTION.fullmatch(item)
+    if not match:
+        raise ValueError(f"Unsupported FETCH item {item.decode(errors='replace')}")
+    section = match.group(1).decode().upper()
+    if section.startswith(("HEADER.FIELDS ", "HEADER.FIELDS.NOT ")):
+        names = {name.lower() for name in section[section.index("(") + 1:section.rindex(")")].split()}
+        keep = not section.startswith("HEADER.FIELDS.NOT")
+        data = b"".join(
+            f"{name}: {value}\r\n".encode("utf-8", errors="surrogateescape")
+            for name, value in message.header_items if (name.lower() in names) == keep
+        ) + b"\r\n"
+    else:
+        data = message.sections.get(section, b"")
+    key = b"BODY[" + match.group(1) + b"]"
+    if match.group(2) is not None:
+        offset = int(match.group(2))
+        data = data[offset:offset + int(match.group(3))]
+        key += b"<" + match.group(2) + b">"
+    return key + b" " + _literal(data)
+
+
+def _literal(data: bytes) -> bytes:
+    return b"{%d}\r\n%s" % (len(data), data)
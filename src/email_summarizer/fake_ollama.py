@@ -0,0 +1,220 @@
+"""In-process stand-in for the Ollama HTTP API.
+
+Used to benchmark and exercise the summarizer offline:
+
+    with FakeOllamaServer(latency=0.2, tokens_per_second=50) as server:
+        summarizer = EmailSummarizer(ollama_url=server.url)
+
+or, to point a real run at it:
+
+    python -m email_summarizer.fake_ollama --port 11434 --latency 0.5
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+_BATCH_ENTRY = re.compile(r"^### Email (\d+)", re.MULTILINE)
+_SUBJECT = re.compile(r"^Subject: (.*)$", re.MULTILINE)
+
+
+def _tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # Clients dropping idle keep-alive connections is not an error here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeOllamaServer:
+    """Serves /api/generate with canned summaries and simulated latency.
+
+    Each request sleeps ``latency`` seconds plus the completion length at
+    ``tokens_per_second``. ``fail_rate`` of requests get a 503 to exercise
+    retries. Batched JSON prompts are answered with one entry per email.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 tokens_per_second: float = 0.0, fail_rate: float = 0.0, seed: Optional[int] = None) -> None:
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.fail_rate = fail_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "failures": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+            "connections": 0,
+        }
+        self._server = _Server((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return self.fail_rate > 0 and self._random.random() < self.fail_rate
+
+    def respond(self, request: Dict[str, Any]) -> str:
+        """Build the canned completion for a generate request."""
+        prompt = request.get("prompt", "")
+        if request.get("format") == "json":
+            ids = _BATCH_ENTRY.findall(prompt)
+            subjects = _SUBJECT.findall(prompt)
+            return json.dumps({
+                email_id: f"• Summary of '{subject.strip()}'"
+                for email_id, subject in zip(ids, subjects)
+            })
+        subjects = _SUBJECT.findall(prompt)
+        subject = subjects[0].strip() if subjects else "the email"
+        return f"• Summary of '{subject}'\n• No action needed"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; don't let Nagle hold the body back
+            disable_nagle_algorithm = True
+
+            def setup(self) -> None:
+                super().setup()
+                server._count(connections=1)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self) -> None:
+                if self.path == "/api/version":
+                    self._send_json(200, {"version": "fake"})
+                elif self.path == "/api/tags":
+                    self._send_json(200, {"models": []})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._send_json(400, {"error": "invalid json"})
+                    return
+                if self.path != "/api/generate":
+                    self._send_json(404, {"error": "not found"})
+                    return
+                if not request.get("prompt"):
+                    # Model load / keep_alive request
+                    self._send_json(200, {"model": request.get("model"), "response": "", "done": True})
+                    return
+                if server._should_fail():
+                    server._count(failures=1)
+                    self._send_json(503, {"error": "server busy"})
+                    return
+
+                server._count(requests=1, in_flight=1)
+                try:
+                    text = server.respond(request)
+                    prompt_tokens = _tokens(request.get("system", "") + request["prompt"])
+                    completion_tokens = _tokens(text)
+                    delay = server.latency
+                    if server.tokens_per_second:
+                        delay += completion_tokens / server.tokens_per_second
+                    time.sleep(delay)
+                finally:
+                    server._count(in_flight=-1)
+                server._count(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+                final = {
+                    "model": request.get("model"),
+                    "done": True,
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": completion_tokens,
+                }
+                if not request.get("stream", True):
+                    self._send_json(200, dict(final, response=text))
+                    return
+
+                # NDJSON stream, one chunk per word, using chunked encoding
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                words = re.findall(r"\S+\s*", text) or [""]
+                for word in words:
+                    self._write_chunk({"model": request.get("model"), "response": word, "done": False})
+                self._write_chunk(dict(final, response=""))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, body: Dict[str, Any]) -> None:
+                data = json.dumps(body).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server for offline testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Simulated generation speed")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+    server = FakeOllamaServer(args.host, args.port, args.latency, args.tokens_per_second, args.fail_rate)
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Fast HTML-to-text conversion for mail bodies and HTML attachments.
+
+A single regex scan over the source yields tags and the text between
+them; no tree is built. Script, style and similar elements are skipped
+by jumping straight to their closing tag, and so are elements hidden
+with inline styles (the preheaders and tracking blocks of marketing
+mail). Block-level tags become line breaks. With ``max_chars`` the scan
+stops as soon as that much text has been collected, so the cost depends
+on the budget rather than on the size of the document.
+"""
+import re
+from html import unescape
+from typing import List, Optional
+
+# Elements whose content is never text; skipped up to their closing tag
+SKIPPED = frozenset(("script", "style", "title", "noscript", "template", "svg", "iframe", "object", "xml"))
+
+# Elements that start a new line
+BLOCKS = frozenset((
+    "address", "article", "aside", "blockquote", "br", "caption", "dd", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li",
+    "main", "nav", "ol", "p", "pre", "section", "table", "tbody", "tfoot", "thead", "tr", "ul",
+))
+
+# Table cells are separated by a space
+CELLS = frozenset(("td", "th"))
+
+VOID = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr",
+))
+
+# Hidden elements whose end tag may be omitted are not skipped: an
+# unclosed one would hide the rest of the document
+OPTIONAL_END = frozenset((
+    "p", "li", "dt", "dd", "td", "th", "tr", "thead", "tbody", "tfoot", "option", "colgroup", "caption",
+))
+
+_TOKEN = re.compile(
+    r"<(?:!--.*?--\s*>|![^>]*>|\?[^>]*>|(/?)([a-zA-Z][\w:.-]*)((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>)",
+    re.DOTALL,
+)
+_STYLE = re.compile(r"""\bstyle\s*=\s*(?:"([^"]*)"|'([^']*)')""", re.IGNORECASE)
+_HIDDEN_STYLE = re.compile(
+    r"display\s*:\s*none|visibility\s*:\s*hidden|mso-hide\s*:\s*all|max-height\s*:\s*0(?![.\d])"
+    r"|font-size\s*:\s*0(?![.\d])|opacity\s*:\s*0(?![.\d])",
+    re.IGNORECASE,
+)
+_HIDDEN_ATTRIBUTE = re.compile(r"(?:^|\s)(?:hidden|aria-hidden\s*=\s*[\"']?true)(?=[\s/=\"']|$)", re.IGNORECASE)
+# Invisible characters marketing mail pads preheaders with
+_INVISIBLE = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u034f\u2060\ufeff\u00ad"))
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+
+def _hidden(attributes: str) -> bool:
+    if "hidden" in attributes.lower() and _HIDDEN_ATTRIBUTE.search(attributes):
+        return True
+    match = _STYLE.search(attributes)
+    return bool(match and _HIDDEN_STYLE.search(match.group(1) or match.group(2) or ""))
+
+
+def _closing(html: str, name: str, start: int) -> int:
+    """Position just past the end tag of name from start, or the end of html."""
+    match = re.compile(rf"</{re.escape(name)}\s*>", re.IGNORECASE).search(html, start)
+    return match.end() if match else len(html)
+
+
+def html_to_text(html: str, max_chars: Optional[int] = None) -> str:
+    """Visible text of an HTML document, one line per block.
+
+    With max_chars the result is at most that long, and the scan stops
+    once it has that much text. A hidden element left unclosed is hidden
+    up to its parent's end tag or, for an inline one, the next block:
+
+    >>> html_to_text('<p>Hi<span style="display:none">preheader</span> there</p><p>Next</p>')
+    'Hi there\\n\\nNext'
+    >>> html_to_text('<div><span style="display:none">preheader</div><p>Sale today</p>')
+    'Sale today'
+    >>> html_to_text('<td><span hidden>preheader<p>Your order shipped</p></td>')
+    'Your order shipped'
+    """
+    if not html:
+        return ""
+    pieces: List[str] = []
+    size = 0
+    position = 0
+    # Open elements of the hidden subtree being skipped, its root first
+    hidden: List[str] = []
+    while position < len(html):
+        match = _TOKEN.search(html, position)
+        end = match.start() if match else len(html)
+        if end > position and not hidden:
+            text = html[position:end]
+            if "&" in text:
+                text = unescape(text)
+            if not text.isspace():
+                text = text.replace("\n", " ")
+                pieces.append(text)
+                size += len(text)
+                if max_chars and size >= max_chars:
+                    # Source whitespace counts until it is collapsed
+                    size = len(_normalize(pieces))
+                    if size >= max_chars:
+                        break
+        if match is None:
+            break
+        position = match.end()
+        name = (match.group(2) or "").lower()
+        if not name:
+            continue  # comment, doctype or processing instruction
+        closing = bool(match.group(1))
+        attributes = match.group(3) or ""
+        if hidden:
+            if closing and name in hidden:
+                # Also closes whatever was left open inside it
+                del hidden[len(hidden) - 1 - hidden[::-1].index(name):]
+                continue
+            boundary = hidden[0] not in BLOCKS and (name in BLOCKS or name in CELLS)
+            if not closing and not boundary:
+                if name in SKIPPED:
+                    if not attributes.rstrip().endswith("/"):
+                        position = _closing(html, name, position)
+                elif name not in VOID and not attributes.rstrip().endswith("/"):
+                    hidden.append(name)
+                continue
+            # The parent's end tag, or a block after an unclosed inline element
+            hidden = []
+        if closing:
+            if name in BLOCKS:
+                pieces.append("\n")
+            elif name in CELLS:
+                pieces.append(" ")
+            continue
+        if name in SKIPPED:
+            if not attributes.rstrip().endswith("/"):
+                position = _closing(html, name, position)
+            continue
+        if name in BLOCKS:
+            pieces.append("\n")
+        elif name in CELLS:
+            pieces.append(" ")
+        if (name not in VOID and name not in OPTIONAL_END and not attributes.rstrip().endswith("/")
+                and _hidden(attributes)):
+            hidden = [name]
+    text = _normalize(pieces)
+    return text[:max_chars] if max_chars else text
+
+
+def _normalize(pieces: List[str]) -> str:
+    text = "".join(pieces).translate(_INVISIBLE)
+    lines = (" ".join(line.split()) for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
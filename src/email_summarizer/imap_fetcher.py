@@ -1,67 +1,397 @@
 from __future__ import annotations
 
+import base64
 import email
-from dataclasses import dataclass
+import queue
+import quopri
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional, Tuple
+from email.header import decode_header, make_header
+from email.parser import BytesHeaderParser
+from email.utils import collapse_rfc2231_value, decode_rfc2231, formataddr, parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from IMAPClient import IMAPClient
+from imapclient import IMAPClient
+
+from .htmltext import html_to_text
+from .metrics import Metrics
+from .payload import SPILL_BYTES, Payload, spill
+
+# (UIDVALIDITY, highest UID seen) per mailbox
+MailboxMark = Tuple[int, int]
+
+SPAM_MAILBOXES = ["[Gmail]/Spam", "Junk", "Spam"]
+
+# "partial" fetches ENVELOPE/BODYSTRUCTURE first and then only the parts we
+# use; "full" downloads the whole RFC822 message.
+FETCH_MODES = ("partial", "full")
+
+# Text bodies larger than this are fetched as a prefix only
+MAX_BODY_BYTES = 256 * 1024
+
+# Characters of text kept from an HTML body when there is no plain-text one
+HTML_BODY_CHARS = 20000
+
+# Plain-text bodies smaller than this may be an empty placeholder, so the
+# HTML body is fetched as well in "partial" mode
+MIN_TEXT_BODY_BYTES = 64
+
+# Headers kept on FetchedEmail.headers for importance rules; in "partial"
+# mode only these are downloaded, via BODY.PEEK[HEADER.FIELDS (...)]
+HEADER_FIELDS = ("Importance", "X-Priority", "Priority", "Precedence", "List-Id", "List-Unsubscribe", "Auto-Submitted")
+
+# Always fetched, to group messages into conversations
+THREAD_HEADERS = ("Message-Id", "In-Reply-To", "References")
+
+_MESSAGE_ID = re.compile(r"<[^<>\s]+>")
+
+# Called with each batch of parsed emails as soon as it is fetched
+BatchCallback = Callable[[List["FetchedEmail"]], None]
+
+# Called by watch() after each sync with the mailbox and its updated mark
+SyncCallback = Callable[[str, MailboxMark], None]
+
+# Servers may drop an IDLE after 30 minutes (RFC 2177), so it is re-issued sooner
+IDLE_TIMEOUT = 25 * 60
+
+# How often an IDLE wait wakes up to check whether it should stop
+IDLE_CHECK_INTERVAL = 1.0
+
+# Longest wait between reconnect attempts
+MAX_RECONNECT_DELAY = 300.0
+
+# Batches per connection that iter_fetch lets wait for the consumer
+PENDING_BATCHES = 2
+
+# How often a worker waiting to hand over a batch checks for a closed generator
+HAND_OVER_TIMEOUT = 0.5
+
+# Marks the end of one mailbox in iter_fetch
+_DONE = object()
 
 
-@dataclass
 class FetchedEmail:
-	account: str
-	uid: int
-	subject: str
-	from_addr: str
-	to_addrs: List[str]
-	date: datetime
-	body_text: str
-	html_text: Optional[str]
-	attachments: List[Tuple[str, bytes, str]]  # (filename, content, mime)
-	raw_message: bytes
+	"""One fetched message.
+
+	Slotted, since a run holds every message until the digest is written.
+	Attachment content is bytes, or a SpilledPayload for large files.
+	raw_message and html_text are only kept when the fetcher is asked to
+	(keep_raw); body_text already holds the text of HTML-only mail.
+	"""
+
+	__slots__ = (
+		"account", "uid", "subject", "from_addr", "to_addrs", "date", "body_text", "html_text", "attachments",
+		"raw_message", "mailbox", "headers", "message_id", "in_reply_to", "references",
+	)
+
+	def __init__(self, account: str, uid: int, subject: str, from_addr: str, to_addrs: List[str], date: datetime,
+			body_text: str, html_text: Optional[str] = None,
+			attachments: Optional[List[Tuple[str, Payload, str]]] = None,  # (filename, content, mime)
+			raw_message: bytes = b"", mailbox: str = "INBOX", headers: Optional[Dict[str, str]] = None,
+			message_id: str = "", in_reply_to: str = "", references: Optional[List[str]] = None) -> None:
+		self.account = account
+		self.uid = uid
+		self.subject = subject
+		self.from_addr = from_addr
+		self.to_addrs = to_addrs
+		self.date = date
+		self.body_text = body_text
+		self.html_text = html_text
+		self.attachments = attachments if attachments is not None else []
+		self.raw_message = raw_message
+		self.mailbox = mailbox
+		self.headers = headers if headers is not None else {}  # lower-cased names from header_fields
+		self.message_id = message_id
+		self.in_reply_to = in_reply_to
+		self.references = references if references is not None else []  # oldest first
+
+	@property
+	def key(self) -> Tuple[str, str, int]:
+		"""Identity of the message; UIDs are only unique within a mailbox."""
+		return (self.account, self.mailbox, self.uid)
+
+	def __eq__(self, other: object) -> bool:
+		if not isinstance(other, FetchedEmail):
+			return NotImplemented
+		return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+	__hash__ = None  # type: ignore[assignment]
+
+	def __repr__(self) -> str:
+		return f"FetchedEmail(account={self.account!r}, mailbox={self.mailbox!r}, uid={self.uid!r}, subject={self.subject!r})"
 
 
 class IMAPEmailFetcher:
-	def __init__(self, host: str, username: str, password: str, use_ssl: bool = True, account_key: str = "") -> None:
+	def __init__(self, host: str, username: str, password: str, use_ssl: bool = True, account_key: str = "",
+			fetch_mode: str = "partial", max_attachment_bytes: int = 10 * 1024 * 1024, batch_size: int = 50,
+			max_connections: int = 2, port: Optional[int] = None, metrics: Optional[Metrics] = None,
+			header_fields: Iterable[str] = HEADER_FIELDS, keep_raw: bool = False,
+			spill_bytes: int = SPILL_BYTES) -> None:
+		if fetch_mode not in FETCH_MODES:
+			raise ValueError(f"Unknown fetch mode {fetch_mode!r}; expected one of {FETCH_MODES}")
 		self.host = host
+		self.port = port
 		self.username = username
 		self.password = password
 		self.use_ssl = use_ssl
 		self.account_key = account_key or username
+		self.fetch_mode = fetch_mode
+		self.max_attachment_bytes = max_attachment_bytes
+		self.batch_size = max(1, batch_size)
+		self.max_connections = max(1, max_connections)
+		self.header_fields = tuple(sorted({name.title() for name in header_fields} | set(THREAD_HEADERS)))
+		# raw_message and html_text are dropped unless kept; attachments
+		# over spill_bytes are moved to temporary files (0 keeps them in memory)
+		self.keep_raw = keep_raw
+		self.spill_bytes = spill_bytes
+		# Updated by fetch(); persist via StateStore.set_mailbox_marks
+		self.mailbox_marks: Dict[str, MailboxMark] = {}
+		self.metrics = metrics if metrics is not None else Metrics()
 
 	def _connect(self) -> IMAPClient:
-		client = IMAPClient(self.host, use_uid=True, ssl=self.use_ssl)
-		client.login(self.username, self.password)
+		with self.metrics.span("imap_connect", account=self.account_key):
+			client = IMAPClient(self.host, port=self.port, use_uid=True, ssl=self.use_ssl)
+			client.login(self.username, self.password)
 		return client
 
-	def _search_since(self, client: IMAPClient, since_dt: Optional[datetime], include_spam: bool) -> List[int]:
-		uids: List[int] = []
-		mailboxes: List[bytes] = [b"INBOX"]
+	def mailboxes(self, include_spam: bool) -> List[str]:
+		mailboxes = ["INBOX"]
 		if include_spam:
 			# Common spam/junk folders across providers
-			mailboxes += [b"[Gmail]/Spam", b"Junk", b"Spam"]
-		for mbox in mailboxes:
+			mailboxes += SPAM_MAILBOXES
+		return mailboxes
+
+	def _search_since(self, client: IMAPClient, since_dt: Optional[datetime]) -> List[int]:
+		if since_dt:
+			criteria = ["SINCE", since_dt.strftime("%d-%b-%Y")]
+		else:
+			criteria = ["ALL"]
+		try:
+			return sorted(client.search(criteria))
+		except Exception:
+			return []
+
+	def _search_new(self, client: IMAPClient, last_uid: int) -> List[int]:
+		try:
+			found = client.search(["UID", f"{last_uid + 1}:*"])
+		except Exception:
+			return []
+		# "n:*" always matches the newest message, even when its UID is below n
+		return sorted(uid for uid in found if uid > last_uid)
+
+	def _iter_mailbox(self, client: IMAPClient, mailbox: str, since_dt: Optional[datetime],
+			use_marks: bool, skip: Iterable[int] = ()) -> Iterator[List[FetchedEmail]]:
+		"""Yield the mailbox's new mail one non-empty batch at a time; its mark is updated
+		after the last one. UIDs in skip count towards the mark but are not downloaded."""
+		try:
+			with self.metrics.span("imap_select", account=self.account_key, mailbox=mailbox):
+				info = client.select_folder(mailbox, readonly=True)
+		except Exception:
+			return
+		uidvalidity = int(info.get(b"UIDVALIDITY", 0))
+
+		mark = self.mailbox_marks.get(mailbox)
+		incremental = use_marks and mark is not None and mark[0] == uidvalidity
+		with self.metrics.span("imap_search", account=self.account_key, mailbox=mailbox):
+			if incremental:
+				uid_list = self._search_new(client, mark[1])
+			else:
+				uid_list = self._search_since(client, since_dt)
+
+		# Everything below UIDNEXT was covered by this search
+		last_uid = int(info.get(b"UIDNEXT", 1)) - 1
+		if mark is not None and mark[0] == uidvalidity:
+			last_uid = max(last_uid, mark[1])
+		if uid_list:
+			last_uid = max(last_uid, uid_list[-1])
+		skip = set(skip)
+		uid_list = [uid for uid in uid_list if uid not in skip]
+
+		# SINCE only has day granularity; drop messages from earlier that day
+		cutoff = None if incremental else since_dt
+		for chunk in _chunks(uid_list, self.batch_size):
+			if self.fetch_mode == "partial":
+				batch = self._fetch_partial(client, chunk, mailbox, cutoff)
+			else:
+				batch = self._fetch_full(client, chunk, mailbox, cutoff)
+			self.metrics.inc("imap_messages", len(batch), account=self.account_key, mailbox=mailbox)
+			if batch:
+				yield batch
+		# Only once every batch has been taken: if the consumer fails on one,
+		# the next sync starts from the old mark and fetches it again
+		self.mailbox_marks[mailbox] = (uidvalidity, last_uid)
+
+	def _fetch_full(self, client: IMAPClient, uids: List[int], mailbox: str, cutoff: Optional[datetime]) -> List[FetchedEmail]:
+		with self.metrics.span("imap_fetch", account=self.account_key, mailbox=mailbox, phase="rfc822"):
+			messages = client.fetch(uids, [b'INTERNALDATE', b'RFC822'])
+		self._count_bytes(messages, mailbox)
+		emails: List[FetchedEmail] = []
+		for uid, data in messages.items():
+			if cutoff and not _received_since(data.get(b'INTERNALDATE'), cutoff):
+				continue
 			try:
-				client.select_folder(mbox, readonly=True)
-			except Exception:
+				with self.metrics.span("mime_parse", mode="full"):
+					emails.append(self._parse_message(int(uid), data[b'RFC822'], mailbox))
+			except Exception as e:
+				print(f"Error parsing email {uid} in {mailbox}: {e}")
 				continue
-			if since_dt:
-				criteria = ["SINCE", since_dt.strftime("%d-%b-%Y")]
-			else:
-				criteria = ["ALL"]
+		return emails
+
+	def _fetch_partial(self, client: IMAPClient, uids: List[int], mailbox: str, cutoff: Optional[datetime]) -> List[FetchedEmail]:
+		"""Two-phase fetch: structure first, then only text parts and
+		attachments under max_attachment_bytes via BODY.PEEK[section]."""
+		with self.metrics.span("imap_fetch", account=self.account_key, mailbox=mailbox, phase="structure"):
+			meta = client.fetch(uids, [b'ENVELOPE', b'BODYSTRUCTURE', b'INTERNALDATE'] + self._header_item())
+
+		plans: Dict[int, Tuple[Any, Optional[datetime], Dict[str, str], List[_Part]]] = {}
+		groups: Dict[Tuple[bytes, ...], List[int]] = {}
+		for uid, data in meta.items():
+			internal_date = data.get(b'INTERNALDATE')
+			if cutoff and not _received_since(internal_date, cutoff):
+				continue
+			try:
+				parts = _select_parts(data[b'BODYSTRUCTURE'])
+			except Exception as e:
+				print(f"Error reading structure of email {uid} in {mailbox}: {e}")
+				continue
+			headers = self._headers(_header_fields_data(data) or b"")
+			plans[int(uid)] = (data.get(b'ENVELOPE'), internal_date, headers, parts)
+			items = tuple(sorted(
+				part.fetch_item(self.max_attachment_bytes) for part in parts
+				if part.fetch_item(self.max_attachment_bytes)
+			))
+			groups.setdefault(items, []).append(int(uid))
+
+		# Messages with the same set of sections share one FETCH
+		bodies: Dict[int, Dict[bytes, Any]] = {}
+		for items, group in groups.items():
+			if not items:
+				continue
+			with self.metrics.span("imap_fetch", account=self.account_key, mailbox=mailbox, phase="parts"):
+				fetched = client.fetch(group, list(items))
+			self._count_bytes(fetched, mailbox)
+			bodies.update({int(uid): data for uid, data in fetched.items()})
+
+		emails: List[FetchedEmail] = []
+		for uid, (envelope, internal_date, headers, parts) in plans.items():
 			try:
-				found = client.search(criteria)
-			except Exception:
-				found = []
-			if found:
-				uids.extend(found)
-		# Deduplicate
-		return sorted(list(set(uids)))
-
-	def fetch(self, last_run: Optional[datetime], window_24h: bool, include_spam: bool = True) -> List[FetchedEmail]:
+				with self.metrics.span("mime_parse", mode="partial"):
+					message = self._build_partial(uid, envelope, internal_date, parts, bodies.get(uid, {}), mailbox)
+				_set_headers(message, headers)
+				emails.append(message)
+			except Exception as e:
+				print(f"Error parsing email {uid} in {mailbox}: {e}")
+				continue
+		return emails
+
+	def _header_item(self) -> List[bytes]:
+		if not self.header_fields:
+			return []
+		return [f"BODY.PEEK[HEADER.FIELDS ({' '.join(self.header_fields)})]".encode()]
+
+	def _headers(self, source: Any) -> Dict[str, str]:
+		"""Pick header_fields out of a header block or parsed message."""
+		if isinstance(source, bytes):
+			source = BytesHeaderParser().parsebytes(source)
+		headers = {}
+		for name in self.header_fields:
+			value = source.get(name)
+			if value is not None:
+				headers[name.lower()] = _decode_words(value).strip()
+		return headers
+
+	def _count_bytes(self, messages: Dict[Any, Dict[bytes, Any]], mailbox: str) -> None:
+		"""Record the size of the message data (RFC822 or body sections) downloaded."""
+		size = sum(
+			len(value) for data in messages.values() for value in data.values() if isinstance(value, bytes)
+		)
+		self.metrics.inc("imap_bytes_fetched", size, account=self.account_key, mailbox=mailbox)
+
+	def _build_partial(self, uid: int, envelope: Any, internal_date: Optional[datetime], parts: List[_Part],
+			data: Dict[bytes, Any], mailbox: str) -> FetchedEmail:
+		body_text = ""
+		html_text = None
+		attachments: List[Tuple[str, Payload, str]] = []
+		for part in parts:
+			if part.role == "attachment":
+				# Oversized attachments are listed without their content
+				content: Payload = b""
+				if part.size <= self.max_attachment_bytes:
+					content = spill(part.decode(_section_data(data, part.section)), self.spill_bytes)
+				attachments.append((part.filename, content, part.mime_type))
+			elif part.role == "text":
+				body_text = part.decode_text(_section_data(data, part.section)).strip()
+			elif part.role == "html":
+				html_text = part.decode_text(_section_data(data, part.section))
+		if not body_text and html_text:
+			body_text = html_to_text(html_text, HTML_BODY_CHARS)
+
+		subject = ""
+		from_addr = ""
+		to_addrs: List[str] = []
+		date = None
+		if envelope is not None:
+			subject = _decode_words(envelope.subject)
+			from_addr = ", ".join(_format_address(a) for a in (envelope.from_ or ()))
+			to_addrs = [_format_address(a) for a in (envelope.to or ())]
+			date = envelope.date
+		date = date or internal_date or datetime.now(timezone.utc)
+		if date.tzinfo is None:
+			date = date.astimezone()
+
+		return FetchedEmail(
+			account=self.account_key,
+			uid=uid,
+			subject=subject,
+			from_addr=from_addr,
+			to_addrs=to_addrs,
+			date=date,
+			body_text=body_text,
+			html_text=html_text if self.keep_raw else None,
+			attachments=attachments,
+			mailbox=mailbox,
+		)
+
+	def fetch(self, last_run: Optional[datetime], window_24h: bool, include_spam: bool = True,
+			mailbox_marks: Optional[Dict[str, MailboxMark]] = None,
+			on_batch: Optional[BatchCallback] = None,
+			skip_uids: Optional[Dict[str, Set[int]]] = None) -> List[FetchedEmail]:
 		"""Fetch emails since last_run, or last 24h if window_24h is True.
 		Includes spam/junk if include_spam.
+
+		Collects the batches of iter_fetch(), mailbox by mailbox. on_batch,
+		if given, receives each batch as soon as it arrives, so callers can
+		start processing before the whole account is downloaded.
+		"""
+		emails: List[FetchedEmail] = []
+		for batch in self.iter_fetch(last_run, window_24h, include_spam, mailbox_marks, skip_uids):
+			if on_batch is not None:
+				on_batch(batch)
+			emails.extend(batch)
+		# Batches of concurrently fetched mailboxes interleave; the sort is stable
+		order = {mailbox: index for index, mailbox in enumerate(self.mailboxes(include_spam))}
+		emails.sort(key=lambda message: order[message.mailbox])
+		return emails
+
+	def iter_fetch(self, last_run: Optional[datetime], window_24h: bool, include_spam: bool = True,
+			mailbox_marks: Optional[Dict[str, MailboxMark]] = None,
+			skip_uids: Optional[Dict[str, Set[int]]] = None) -> Iterator[List[FetchedEmail]]:
+		"""Yield emails since last_run (or from the last 24h) in batches as they arrive.
+
+		When mailbox_marks holds a (UIDVALIDITY, last UID) pair for a mailbox
+		whose UIDVALIDITY is unchanged, only UIDs above the mark are fetched.
+		Each mailbox is fetched while it is selected, so UIDs never cross
+		folders. Updated marks are left in self.mailbox_marks, and are only
+		complete once the generator is exhausted. UIDs in skip_uids (by
+		mailbox), such as messages a resumed run already has, are not
+		downloaded.
+
+		Mailboxes are fetched concurrently over up to max_connections IMAP
+		connections. Connections stop downloading while a few batches are
+		waiting to be consumed, so a slow consumer bounds the mail in memory.
 		"""
 		since_dt: Optional[datetime] = None
 		if window_24h:
@@ -69,97 +399,386 @@ class IMAPEmailFetcher:
 		elif last_run:
 			since_dt = last_run.astimezone(timezone.utc)
 
-		with self._connect() as client:
-			uid_list = self._search_since(client, since_dt, include_spam)
-			if not uid_list:
-				return []
-			messages = client.fetch(uid_list, [
-				b'ENVELOPE', b'RFC822', b'BODYSTRUCTURE'
-			])
+		self.mailbox_marks = dict(mailbox_marks or {})
+		mailboxes = self.mailboxes(include_spam)
+		use_marks = not window_24h
+		skip_uids = skip_uids or {}
+		if self.max_connections == 1:
+			with self._connect() as client:
+				for mailbox in mailboxes:
+					yield from self._iter_mailbox(client, mailbox, since_dt, use_marks, skip_uids.get(mailbox, ()))
+			return
+
+		# Each worker borrows a connection from the pool for one mailbox and
+		# hands its batches over, followed by _DONE or the error it hit
+		idle: "queue.Queue[IMAPClient]" = queue.Queue()
+		opened: List[IMAPClient] = []
+		ready: "queue.Queue[Any]" = queue.Queue(maxsize=self.max_connections * PENDING_BATCHES)
+		closed = threading.Event()
+
+		def hand_over(item: Any) -> bool:
+			while not closed.is_set():
+				try:
+					ready.put(item, timeout=HAND_OVER_TIMEOUT)
+					return True
+				except queue.Full:
+					continue
+			return False
+
+		def fetch_one(mailbox: str) -> None:
+			try:
+				try:
+					client = idle.get_nowait()
+				except queue.Empty:
+					client = self._connect()
+					opened.append(client)
+				try:
+					for batch in self._iter_mailbox(client, mailbox, since_dt, use_marks, skip_uids.get(mailbox, ())):
+						if not hand_over(batch):
+							return
+				finally:
+					idle.put(client)
+			except Exception as e:
+				hand_over(e)
+				return
+			hand_over(_DONE)
 
-	emails: List[FetchedEmail] = []
-	for uid, data in messages.items():
+		pool = ThreadPoolExecutor(max_workers=min(self.max_connections, len(mailboxes)),
+			thread_name_prefix=f"imap-{self.account_key}")
 		try:
-			raw = data[b'RFC822']
-			msg = email.message_from_bytes(raw)
-
-			# Extract basic fields
-			subject = msg.get('Subject', '')
-			from_addr = msg.get('From', '')
-			to_addrs = [addr.strip() for addr in msg.get('To', '').split(',') if addr.strip()]
-			date_str = msg.get('Date', '')
-                
-			# Parse date
+			for mailbox in mailboxes:
+				pool.submit(fetch_one, mailbox)
+			remaining = len(mailboxes)
+			while remaining:
+				item = ready.get()
+				if item is _DONE:
+					remaining -= 1
+				elif isinstance(item, Exception):
+					raise item
+				else:
+					yield item
+		finally:
+			# Also reached when the consumer stops early: release blocked workers
+			closed.set()
+			pool.shutdown(wait=True)
+			for client in opened:
+				try:
+					client.logout()
+				except Exception:
+					pass
+
+	def watch(self, mailbox: str, stop: threading.Event, on_batch: BatchCallback,
+			since_dt: Optional[datetime] = None, mailbox_marks: Optional[Dict[str, MailboxMark]] = None,
+			on_synced: Optional[SyncCallback] = None, poll_interval: float = 60.0,
+			idle_timeout: float = IDLE_TIMEOUT) -> None:
+		"""Fetch new mail in one mailbox as it arrives, until stop is set.
+
+		Syncs from the mailbox's mark (or since_dt without one), then waits
+		with IDLE for the server to announce new messages, or polls every
+		poll_interval seconds if the server has no IDLE. on_batch receives
+		each batch from this thread; on_synced is called after every sync,
+		once on_batch has seen all of it, so the mark can be persisted.
+		Dropped connections are re-opened with exponential backoff. Returns
+		at once if the mailbox does not exist.
+		"""
+		self.mailbox_marks.update(mailbox_marks or {})
+		delay = 1.0
+		while not stop.is_set():
 			try:
-				from email.utils import parsedate_to_datetime
-				date = parsedate_to_datetime(date_str)
-			except Exception:
-				date = datetime.now(timezone.utc)
-
-			# Extract body text and HTML
-			body_text = ""
-			html_text = None
-			attachments: List[Tuple[str, bytes, str]] = []
-
-			if msg.is_multipart():
-				for part in msg.walk():
-					content_type = part.get_content_type()
-					content_disposition = str(part.get('Content-Disposition', ''))
-					
-					if 'attachment' in content_disposition:
-					    # Handle attachments
-					    filename = part.get_filename()
-					    if filename:
-					        payload = part.get_payload(decode=True)
-					        if payload:
-					            attachments.append((filename, payload, content_type))
-					elif content_type == 'text/plain' and not body_text:
-					    # Plain text body
-					    payload = part.get_payload(decode=True)
-					    if payload:
-					        try:
-					            body_text = payload.decode('utf-8', errors='ignore').strip()
-					        except Exception:
-					            body_text = str(payload).strip()
-					elif content_type == 'text/html' and not html_text:
-					    # HTML body
-					    payload = part.get_payload(decode=True)
-					    if payload:
-					        try:
-					            html_text = payload.decode('utf-8', errors='ignore')
-					        except Exception:
-					            html_text = str(payload)
-			else:
-				# Single part message
-				content_type = msg.get_content_type()
-				payload = msg.get_payload(decode=True)
-				if payload:
+				with self._connect() as client:
 					try:
-					    text = payload.decode('utf-8', errors='ignore')
-					    if content_type == 'text/html':
-					        html_text = text
-					    else:
-					        body_text = text.strip()
-					except Exception:
-					    text = str(payload)
-					    if content_type == 'text/html':
-					        html_text = text
-					    else:
-					        body_text = text.strip()
-
-			emails.append(FetchedEmail(
-                    account=self.account_key,
-                    uid=int(uid),
-                    subject=subject,
-                    from_addr=from_addr,
-                    to_addrs=to_addrs,
-                    date=date,
-                    body_text=body_text,
-                    html_text=html_text,
-                    attachments=attachments,
-                    raw_message=raw,
-			))
-		except Exception as e:
-			print(f"Error parsing email {uid}: {e}")
-			continue
-	return emails
+						client.select_folder(mailbox, readonly=True)
+					except IMAPClient.AbortError:
+						raise
+					except IMAPClient.Error:
+						return
+					delay = 1.0
+					use_idle = b"IDLE" in client.capabilities()
+					while not stop.is_set():
+						for batch in self._iter_mailbox(client, mailbox, since_dt, True):
+							on_batch(batch)
+						if mailbox in self.mailbox_marks and on_synced is not None:
+							on_synced(mailbox, self.mailbox_marks[mailbox])
+						if use_idle:
+							self._wait_idle(client, stop, idle_timeout)
+						elif not stop.wait(poll_interval):
+							client.noop()
+			except Exception as e:
+				if stop.is_set():
+					return
+				self.metrics.inc("imap_reconnects", account=self.account_key, mailbox=mailbox)
+				print(f"IMAP watch of {mailbox} failed: {e}; reconnecting in {delay:.0f}s")
+				stop.wait(delay)
+				delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+	def _wait_idle(self, client: IMAPClient, stop: threading.Event, timeout: float) -> None:
+		"""IDLE until the server reports new messages, timeout passes or stop is set."""
+		deadline = time.monotonic() + timeout
+		client.idle()
+		try:
+			while not stop.is_set() and time.monotonic() < deadline:
+				responses = client.idle_check(timeout=IDLE_CHECK_INTERVAL)
+				if any(len(response) > 1 and response[1] == b"EXISTS" for response in responses):
+					return
+		finally:
+			client.idle_done()
+
+	def _parse_message(self, uid: int, raw: bytes, mailbox: str) -> FetchedEmail:
+		msg = email.message_from_bytes(raw)
+
+		# Extract basic fields
+		subject = msg.get('Subject', '')
+		from_addr = msg.get('From', '')
+		to_addrs = [addr.strip() for addr in msg.get('To', '').split(',') if addr.strip()]
+		date_str = msg.get('Date', '')
+
+		# Parse date
+		try:
+			date = parsedate_to_datetime(date_str)
+		except Exception:
+			date = datetime.now(timezone.utc)
+
+		# Extract body text and HTML
+		body_text = ""
+		html_text = None
+		attachments: List[Tuple[str, Payload, str]] = []
+
+		if msg.is_multipart():
+			for part in msg.walk():
+				content_type = part.get_content_type()
+				content_disposition = str(part.get('Content-Disposition', ''))
+
+				if 'attachment' in content_disposition:
+					# Handle attachments
+					filename = part.get_filename()
+					if filename:
+						payload = part.get_payload(decode=True)
+						if payload:
+							attachments.append((filename, spill(payload, self.spill_bytes), content_type))
+				elif content_type == 'text/plain' and not body_text:
+					# Plain text body
+					payload = part.get_payload(decode=True)
+					if payload:
+						try:
+							body_text = payload.decode('utf-8', errors='ignore').strip()
+						except Exception:
+							body_text = str(payload).strip()
+				elif content_type == 'text/html' and not html_text:
+					# HTML body
+					payload = part.get_payload(decode=True)
+					if payload:
+						try:
+							html_text = payload.decode('utf-8', errors='ignore')
+						except Exception:
+							html_text = str(payload)
+		else:
+			# Single part message
+			content_type = msg.get_content_type()
+			payload = msg.get_payload(decode=True)
+			if payload:
+				try:
+					text = payload.decode('utf-8', errors='ignore')
+				except Exception:
+					text = str(payload)
+				if content_type == 'text/html':
+					html_text = text
+				else:
+					body_text = text.strip()
+		if not body_text and html_text:
+			# HTML-only mail
+			body_text = html_to_text(html_text, HTML_BODY_CHARS)
+
+		message = FetchedEmail(
+			account=self.account_key,
+			uid=uid,
+			subject=subject,
+			from_addr=from_addr,
+			to_addrs=to_addrs,
+			date=date,
+			body_text=body_text,
+			html_text=html_text if self.keep_raw else None,
+			attachments=attachments,
+			raw_message=raw if self.keep_raw else b"",
+			mailbox=mailbox,
+		)
+		_set_headers(message, self._headers(msg))
+		return message
+
+
+def _set_headers(message: FetchedEmail, headers: Dict[str, str]) -> None:
+	message.headers = headers
+	ids = _MESSAGE_ID.findall(headers.get("message-id", ""))
+	message.message_id = ids[0] if ids else ""
+	# In-Reply-To may carry several IDs or comments; the last ID is the parent
+	parents = _MESSAGE_ID.findall(headers.get("in-reply-to", ""))
+	message.in_reply_to = parents[-1] if parents else ""
+	message.references = _MESSAGE_ID.findall(headers.get("references", ""))
+
+
+def _received_since(internal_date: Optional[datetime], since_dt: datetime) -> bool:
+	if internal_date is None:
+		return True
+	if internal_date.tzinfo is None:
+		# IMAPClient normalises INTERNALDATE to naive local time
+		internal_date = internal_date.astimezone()
+	return internal_date >= since_dt
+
+
+def _chunks(items: List[int], size: int) -> Iterator[List[int]]:
+	for start in range(0, len(items), size):
+		yield items[start:start + size]
+
+
+def _text(value: Any) -> str:
+	if value is None:
+		return ""
+	if isinstance(value, bytes):
+		return value.decode("utf-8", errors="ignore")
+	return str(value)
+
+
+def _decode_words(value: Any) -> str:
+	"""Decode RFC 2047 encoded words in an envelope field."""
+	text = _text(value)
+	try:
+		return str(make_header(decode_header(text)))
+	except Exception:
+		return text
+
+
+def _format_address(address: Any) -> str:
+	mailbox = _text(address.mailbox)
+	host = _text(address.host)
+	addr = f"{mailbox}@{host}" if mailbox and host else (mailbox or host)
+	return formataddr((_decode_words(address.name), addr))
+
+
+def _params(value: Any) -> Dict[str, str]:
+	"""Turn a BODYSTRUCTURE (KEY value KEY value ...) list into a dict."""
+	if not value or not isinstance(value, (tuple, list)):
+		return {}
+	items = list(value)
+	return {_text(k).lower(): _text(v) for k, v in zip(items[0::2], items[1::2])}
+
+
+def _filename(disposition_params: Dict[str, str], content_params: Dict[str, str]) -> str:
+	for params in (disposition_params, content_params):
+		for key in ("filename", "name"):
+			if params.get(key):
+				return _decode_words(params[key])
+			if params.get(key + "*"):
+				return collapse_rfc2231_value(decode_rfc2231(params[key + "*"]))
+	return ""
+
+
+class _Part:
+	"""A leaf of BODYSTRUCTURE that the summarizer wants."""
+
+	def __init__(self, section: str, role: str, mime_type: str, encoding: str, charset: str, size: int, filename: str = "") -> None:
+		self.section = section
+		self.role = role  # "text", "html" or "attachment"
+		self.mime_type = mime_type
+		self.encoding = encoding
+		self.charset = charset
+		self.size = size
+		self.filename = filename
+
+	def fetch_item(self, max_attachment_bytes: int) -> Optional[bytes]:
+		if self.role == "attachment":
+			if self.size > max_attachment_bytes:
+				return None
+			return f"BODY.PEEK[{self.section}]".encode()
+		if self.size > MAX_BODY_BYTES:
+			return f"BODY.PEEK[{self.section}]<0.{MAX_BODY_BYTES}>".encode()
+		return f"BODY.PEEK[{self.section}]".encode()
+
+	def decode(self, data: Optional[bytes]) -> bytes:
+		if not data:
+			return b""
+		if self.encoding == "base64":
+			data = b"".join(data.split())
+			# Partial fetches can cut a base64 quantum in half
+			data = data[:len(data) - len(data) % 4]
+			return base64.b64decode(data)
+		if self.encoding == "quoted-printable":
+			return quopri.decodestring(data)
+		return data
+
+	def decode_text(self, data: Optional[bytes]) -> str:
+		payload = self.decode(data)
+		try:
+			return payload.decode(self.charset or "utf-8", errors="ignore")
+		except LookupError:
+			return payload.decode("utf-8", errors="ignore")
+
+
+def _select_parts(structure: Any, section: str = "") -> List[_Part]:
+	"""Walk BODYSTRUCTURE and pick the first text/plain body (or, without
+	one, the first text/html body) plus every attachment, mirroring the
+	full-message parser."""
+	parts: List[_Part] = []
+	have_text = False
+	have_html = False
+	for leaf_section, leaf in _leaves(structure, section):
+		maintype = _text(leaf[0]).lower()
+		subtype = _text(leaf[1]).lower()
+		mime_type = f"{maintype}/{subtype}"
+		params = _params(leaf[2])
+		encoding = _text(leaf[5]).lower()
+		size = int(leaf[6] or 0)
+
+		# Extension data starts after the type-specific fields
+		if maintype == "text":
+			disposition_index = 9
+		elif mime_type == "message/rfc822":
+			disposition_index = 11
+		else:
+			disposition_index = 8
+		disposition = leaf[disposition_index] if len(leaf) > disposition_index else None
+		disposition_type = ""
+		disposition_params: Dict[str, str] = {}
+		if isinstance(disposition, (tuple, list)) and disposition:
+			disposition_type = _text(disposition[0]).lower()
+			if len(disposition) > 1:
+				disposition_params = _params(disposition[1])
+
+		if disposition_type == "attachment":
+			filename = _filename(disposition_params, params)
+			if filename:
+				parts.append(_Part(leaf_section, "attachment", mime_type, encoding, "", size, filename))
+		elif mime_type == "text/plain" and not have_text:
+			have_text = True
+			parts.append(_Part(leaf_section, "text", mime_type, encoding, params.get("charset", ""), size))
+		elif mime_type == "text/html" and not have_html:
+			have_html = True
+			parts.append(_Part(leaf_section, "html", mime_type, encoding, params.get("charset", ""), size))
+	if any(part.role == "text" and part.size >= MIN_TEXT_BODY_BYTES for part in parts):
+		# The HTML alternative of a plain-text body is not worth downloading
+		parts = [part for part in parts if part.role != "html"]
+	return parts
+
+
+def _leaves(structure: Any, section: str) -> Iterator[Tuple[str, Any]]:
+	if isinstance(structure[0], list):
+		for index, child in enumerate(structure[0], start=1):
+			child_section = f"{section}.{index}" if section else str(index)
+			yield from _leaves(child, child_section)
+	else:
+		# A single-part message still has body part 1
+		yield (section or "1"), structure
+
+
+def _section_data(data: Dict[bytes, Any], section: str) -> Optional[bytes]:
+	prefix = f"BODY[{section}]".encode()
+	for key, value in data.items():
+		if isinstance(key, bytes) and (key == prefix or key.startswith(prefix + b"<")):
+			return value
+	return None
+
+
+def _header_fields_data(data: Dict[bytes, Any]) -> Optional[bytes]:
+	# Servers echo the field list back in their own spelling
+	for key, value in data.items():
+		if isinstance(key, bytes) and key.upper().startswith(b"BODY[HEADER.FIELDS"):
+			return value
+	return None
@@ -0,0 +1,99 @@
+"""Checkpoints that let an interrupted run pick up where it stopped.
+
+A run only advances an account's UID marks and last-run time once its
+digest is written (StateStore.complete_run), so a run that dies halfway
+leaves nothing behind unseen. On the way, every message is checkpointed
+in the StateStore as it is fetched, saved to the MessageStore with its
+attachment text (parsed) and given a summary (summarized). The next run
+loads the parsed messages, and their summaries, from the MessageStore
+rather than downloading and summarizing them again. Only messages that
+never got as far as the store are fetched again.
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from .imap_fetcher import FetchedEmail
+from .state import FETCHED, PARSED, SUMMARIZED, StateStore
+from .store import MessageKey, MessageStore
+from .summarizer import PROMPT_VERSION, EmailSummarizer
+
+
+class RunJournal:
+    """Checkpoints of one fetch run across its accounts.
+
+    Without a MessageStore only the fetched checkpoints are kept, and an
+    interrupted run fetches everything again (nothing is skipped).
+    """
+
+    def __init__(self, state_store: StateStore, store: Optional[MessageStore], summarizer: EmailSummarizer) -> None:
+        self.state_store = state_store
+        self.store = store
+        self.summarizer = summarizer
+        # Saving waits for attachment parses, so it runs off the fetch threads
+        self._saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+        self._saves: List["Future[None]"] = []
+        self._lock = threading.Lock()
+        self._recorded = 0
+
+    def resume(self, account_key: str) -> Tuple[List[FetchedEmail], Dict[MessageKey, str], Dict[str, Set[int]]]:
+        """(messages, summaries, UIDs to skip by mailbox) left by an interrupted run of the account."""
+        if self.store is None:
+            return [], {}, {}
+        keys = [
+            (account_key, mailbox, uid)
+            for (mailbox, uid), stage in self.state_store.checkpoints(account_key).items() if stage >= PARSED
+        ]
+        emails = self.store.load_keys(keys)
+        summaries = self.store.summaries([email.key for email in emails], self.summarizer.ollama_model, PROMPT_VERSION)
+        skip: Dict[str, Set[int]] = {}
+        for email in emails:
+            skip.setdefault(email.mailbox, set()).add(email.uid)
+        return emails, summaries, skip
+
+    def fetched(self, account_key: str, emails: List[FetchedEmail]) -> None:
+        """Checkpoint a fetched batch and queue it to be saved to the store."""
+        self.state_store.checkpoint(account_key, [(email.mailbox, email.uid) for email in emails], FETCHED)
+        if self.store is None:
+            return
+        future = self._saver.submit(self._save, account_key, emails)
+        with self._lock:
+            self._saves.append(future)
+
+    def _save(self, account_key: str, emails: List[FetchedEmail]) -> None:
+        # Attachments are already being parsed for the summaries; this waits for those parses
+        records = [(email, self.summarizer.attachment_texts(email)) for email in emails]
+        self.store.save(records)
+        self.state_store.checkpoint(account_key, [(email.mailbox, email.uid) for email in emails], PARSED)
+
+    def summarized(self) -> None:
+        """Save and checkpoint the summaries the digest has recorded since the last call."""
+        if self.store is None:
+            return
+        recorded = list(self.summarizer.last_summaries.items())
+        new, self._recorded = recorded[self._recorded:], len(recorded)
+        if not new:
+            return
+        # A summary is only stored once its message is
+        self.wait()
+        self.store.set_summaries(new, self.summarizer.ollama_model, PROMPT_VERSION)
+        by_account: Dict[str, List[Tuple[str, int]]] = {}
+        for (account, mailbox, uid), _ in new:
+            by_account.setdefault(account, []).append((mailbox, uid))
+        for account, messages in by_account.items():
+            self.state_store.checkpoint(account, messages, SUMMARIZED)
+
+    def wait(self) -> None:
+        """Block until every queued batch is saved; re-raises a failed save."""
+        with self._lock:
+            saves, self._saves = self._saves, []
+        for future in saves:
+            future.result()
+
+    def close(self) -> None:
+        """Finish saving queued batches; re-raises a failed save."""
+        try:
+            self.wait()
+        finally:
+            self._saver.shutdown(wait=True)
+
@@ -0,0 +1,152 @@
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+@dataclass
+class LLMResult:
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+
+
+class LLMBackend:
+    """Text generation backend used by EmailSummarizer.
+
+    Implementations must be safe to call from several threads at once.
+    """
+
+    def generate(self, prompt: str, max_tokens: int = 1000, format: Optional[str] = None,
+                 system: Optional[str] = None) -> LLMResult:
+        raise NotImplementedError
+
+    def warmup(self) -> None:
+        """Load the model ahead of the first real request."""
+
+    def close(self) -> None:
+        pass
+
+
+class OllamaBackend(LLMBackend):
+    """Ollama /api/generate over a pooled keep-alive HTTP session.
+
+    Connection errors, timeouts, 429s and 5xx responses are retried with
+    exponential backoff and jitter. ``keep_alive`` asks Ollama to keep the
+    model resident between runs. Instructions passed as ``system`` form an
+    identical prefix on every request, so Ollama can reuse its prompt cache
+    for them.
+    """
+
+    def __init__(self, model: str, url: str = "http://localhost:11434", timeout: float = 60.0,
+                 stream: bool = False, pool_size: int = 4, retries: int = 2, backoff: float = 0.5,
+                 keep_alive: Optional[str] = "30m", temperature: float = 0.3) -> None:
+        self.model = model
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        # With stream=True the timeout applies between chunks, not to the whole reply
+        self.stream = stream
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.keep_alive = keep_alive
+        self.temperature = temperature
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._warmup_thread: Optional[threading.Thread] = None
+
+    def _payload(self, prompt: str, max_tokens: int, format: Optional[str], system: Optional[str]) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": self.stream,
+            "options": {
+                "num_predict": max_tokens,
+                "temperature": self.temperature,
+            },
+        }
+        if format:
+            payload["format"] = format
+        if system:
+            payload["system"] = system
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def _retryable(self, error: Exception) -> bool:
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code == 429 or error.response.status_code >= 500
+        return False
+
+    def generate(self, prompt: str, max_tokens: int = 1000, format: Optional[str] = None,
+                 system: Optional[str] = None) -> LLMResult:
+        payload = self._payload(prompt, max_tokens, format, system)
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                response = self.session.post(
+                    f"{self.url}/api/generate", json=payload, timeout=self.timeout, stream=self.stream
+                )
+                if response.status_code >= 400:
+                    # Read the error body so the connection returns to the pool
+                    response.content
+                response.raise_for_status()
+                result = _read_stream(response) if self.stream else response.json()
+            except Exception as e:
+                if attempt >= self.retries or not self._retryable(e):
+                    raise
+                time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+                attempt += 1
+                continue
+            return LLMResult(
+                text=result.get("response", "").strip(),
+                prompt_tokens=result.get("prompt_eval_count", 0),
+                completion_tokens=result.get("eval_count", 0),
+                latency=time.monotonic() - start,
+            )
+
+    def warmup(self) -> None:
+        """Load the model in the background; an empty prompt only loads it."""
+        def load() -> None:
+            try:
+                payload: Dict[str, Any] = {"model": self.model}
+                if self.keep_alive:
+                    payload["keep_alive"] = self.keep_alive
+                self.session.post(f"{self.url}/api/generate", json=payload, timeout=self.timeout).close()
+            except Exception as e:
+                print(f"Ollama warmup failed: {e}")
+
+        if self._warmup_thread is None:
+            self._warmup_thread = threading.Thread(target=load, name="ollama-warmup", daemon=True)
+            self._warmup_thread.start()
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def _read_stream(response: requests.Response) -> Dict[str, Any]:
+    """Collect a streamed /api/generate reply into one result dict."""
+    pieces = []
+    result: Dict[str, Any] = {}
+    for line in response.iter_lines():
+        if not line:
+            continue
+        chunk = json.loads(line)
+        if chunk.get("error"):
+            raise RuntimeError(chunk["error"])
+        pieces.append(chunk.get("response", ""))
+        if chunk.get("done"):
+            # Keep reading to the end of the body so the connection is reused
+            result = chunk
+    result["response"] = "".join(pieces)
+    return result
@@ -0,0 +1,198 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Samples kept per timing series for percentiles; older ones are reservoir-sampled
+MAX_SAMPLES = 2048
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0 for no samples."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+class _Timing:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.samples: List[float] = []
+
+    def add(self, seconds: float, rng: random.Random) -> None:
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(seconds)
+        else:
+            slot = rng.randrange(self.count)
+            if slot < MAX_SAMPLES:
+                self.samples[slot] = seconds
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+            "p50": percentile(self.samples, 50),
+            "p95": percentile(self.samples, 95),
+        }
+
+
+class Metrics:
+    """Thread-safe counters, gauges and timing spans for one run.
+
+    Names are plain snake_case; labels are keyword arguments:
+
+        metrics.inc("imap_messages", 12, account="gmail", mailbox="INBOX")
+        with metrics.span("llm_request", kind="batch"):
+            ...
+
+    Export with report() / write_json() or to_prometheus() / write_prometheus().
+    """
+
+    def __init__(self, namespace: str = "email_summarizer") -> None:
+        self.namespace = namespace
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._timings: Dict[Tuple[str, Labels], _Timing] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            timing = self._timings.get(key)
+            if timing is None:
+                timing = self._timings[key] = _Timing()
+            timing.add(seconds, self._random)
+
+    @contextmanager
+    def span(self, name: str, **labels: Any) -> Iterator[None]:
+        """Time the enclosed block, recording it even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter(self, name: str, **labels: Any) -> float:
+        with self._lock:
+            return self._counters.get((name, _labels(labels)), 0)
+
+    def report(self) -> Dict[str, Any]:
+        """Snapshot of everything recorded, as JSON-serialisable data."""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            timings = {key: timing.summary() for key, timing in self._timings.items()}
+
+        def group(items: Dict[Tuple[str, Labels], Any], field: str) -> Dict[str, List[Dict[str, Any]]]:
+            grouped: Dict[str, List[Dict[str, Any]]] = {}
+            for (name, labels), value in sorted(items.items()):
+                entry: Dict[str, Any] = {"labels": dict(labels)}
+                if isinstance(value, dict):
+                    entry.update(value)
+                else:
+                    entry[field] = value
+                grouped.setdefault(name, []).append(entry)
+            return grouped
+
+        return {
+            "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            "duration_seconds": time.time() - self.started,
+            "counters": group(counters, "value"),
+            "gauges": group(gauges, "value"),
+            "timings": group(timings, "seconds"),
+        }
+
+    def to_prometheus(self) -> str:
+        """Render in the Prometheus text exposition format.
+
+        Counters get a _total suffix and timings become summaries in seconds.
+        """
+        report = self.report()
+        lines: List[str] = []
+
+        def metric(name: str) -> str:
+            return f"{self.namespace}_{name}"
+
+        for name, entries in report["counters"].items():
+            lines.append(f"# TYPE {metric(name)}_total counter")
+            lines += [f"{metric(name)}_total{_format_labels(e['labels'])} {_number(e['value'])}" for e in entries]
+
+        gauges = dict(report["gauges"])
+        gauges.setdefault("run_duration_seconds", []).append({"labels": {}, "value": report["duration_seconds"]})
+        gauges.setdefault("last_run_timestamp_seconds", []).append({"labels": {}, "value": self.started})
+        for name, entries in gauges.items():
+            lines.append(f"# TYPE {metric(name)} gauge")
+            lines += [f"{metric(name)}{_format_labels(e['labels'])} {_number(e['value'])}" for e in entries]
+
+        for name, entries in report["timings"].items():
+            full = f"{metric(name)}_seconds"
+            lines.append(f"# TYPE {full} summary")
+            for e in entries:
+                for quantile, key in (("0.5", "p50"), ("0.95", "p95")):
+                    labels = dict(e["labels"], quantile=quantile)
+                    lines.append(f"{full}{_format_labels(labels)} {_number(e[key])}")
+                lines.append(f"{full}_sum{_format_labels(e['labels'])} {_number(e['sum'])}")
+                lines.append(f"{full}_count{_format_labels(e['labels'])} {e['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: str) -> None:
+        _atomic_write(path, json.dumps(self.report(), indent=2) + "\n")
+
+    def write_prometheus(self, path: str) -> None:
+        # node_exporter's textfile collector may read at any time, so never expose a partial file
+        _atomic_write(path, self.to_prometheus())
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _atomic_write(path: str, text: str) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,85 @@
+"""Executive summary of a whole digest, built by map-reduce.
+
+A busy day's per-entry summaries do not fit in one prompt, so they are
+reduced in levels: the notes (one per digest entry) are split into
+chunks that fit a prompt, each chunk is condensed by the model in
+parallel, and the condensed notes are chunked and condensed again until
+they fit a single final prompt that writes the executive summary and
+action items.
+
+Chunk boundaries are content-defined: a chunk ends after a note whose
+hash falls below a cut-off proportional to the note's size, rather than
+at fixed positions. Adding, removing or changing a note therefore only
+moves the boundaries next to it, the other chunks keep their exact text,
+and their reductions (cached by prompt) are reused on the next run. Only
+the branches above a changed note are recomputed.
+"""
+import hashlib
+from typing import List
+
+from .compaction import estimate_tokens
+
+OVERVIEW_INSTRUCTIONS = """Write an executive summary of the day's email from these notes.
+Start with 3-5 bullet points on the main topics and decisions. Then write "Action items:" followed by one bullet per action item, with its owner and deadline when known, most urgent first, or "Action items: none"."""
+
+REDUCE_INSTRUCTIONS = """Condense these notes on the day's email into a shorter set of bullet points.
+Keep every action item with its owner and deadline, and the main topics and decisions; drop routine detail."""
+
+# Tokens of notes per reduction prompt
+CHUNK_TOKENS = 2000
+
+# Completion tokens of an intermediate reduction, and of the executive summary
+REDUCE_TOKENS = 300
+OVERVIEW_TOKENS = 500
+
+# Levels of intermediate reductions before the rest is cut to fit the final prompt
+MAX_LEVELS = 4
+
+# Digests with at least this many entries get an executive summary
+MIN_ENTRIES = 30
+
+
+def note(subject: str, sender: str, summary: str, important: bool = False) -> str:
+    """One digest entry as a single line of notes."""
+    label = f"{subject} (from {sender}{', important' if important else ''})"
+    return f"{label}: {' '.join(summary.split())}"
+
+
+def chunk(notes: List[str], max_tokens: int = CHUNK_TOKENS) -> List[List[str]]:
+    """Split notes, in order, into content-defined chunks of at most about max_tokens.
+
+    Chunks average about half of max_tokens and are at least a quarter of
+    it unless the notes run out; a note larger than max_tokens is a chunk
+    of its own.
+    """
+    target = max(1, max_tokens // 2)
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    size = 0
+    for text in notes:
+        tokens = estimate_tokens(text)
+        if current and size + tokens > max_tokens:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(text)
+        size += tokens
+        if size >= max_tokens // 4 and _boundary(text, tokens, target):
+            chunks.append(current)
+            current, size = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _boundary(text: str, tokens: int, target: int) -> bool:
+    """Whether a chunk ends after text; the odds grow with its share of target."""
+    value = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    return value < min(1.0, tokens / target) * 2 ** 64
+
+
+def prompt(notes: List[str]) -> str:
+    return "Notes:\n\n" + "\n\n".join(notes)
+
+
+def section(summary: str) -> str:
+    return "\n".join(["## 🧭 Executive Summary\n", summary.strip(), ""])
@@ -0,0 +1,126 @@
+"""Attachment payloads kept in temporary files instead of memory.
+
+A run over a busy mailbox can download hundreds of megabytes of
+attachments, which are all held until the digest is written. spill()
+moves content above a size threshold into a temporary file and returns a
+SpilledPayload standing in for the bytes: it knows its length and
+SHA-256 without reading the file, reads the content back on demand, and
+deletes the file once the last reference to it in this process is gone.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import weakref
+from typing import BinaryIO, Optional, Union
+
+# Attachments larger than this are moved to a temporary file
+SPILL_BYTES = 256 * 1024
+
+
+class SpilledPayload:
+    """Attachment bytes stored in a temporary file.
+
+    Behaves like the bytes it stands for where attachments are used: len(),
+    truth value, slicing, equality and hashing (by content), and bytes().
+    Pickled copies (sent to parser processes) refer to the same file and
+    never delete it.
+    """
+
+    __slots__ = ("path", "size", "digest", "_finalizer", "__weakref__")
+
+    def __init__(self, path: str, size: int, digest: bytes, owner: bool = False) -> None:
+        self.path = path
+        self.size = size
+        self.digest = digest  # SHA-256 of the content
+        self._finalizer = weakref.finalize(self, _remove, path) if owner else None
+
+    @classmethod
+    def write(cls, content: bytes, directory: Optional[str] = None) -> "SpilledPayload":
+        """Store content in a new temporary file owned by the returned payload."""
+        fd, path = tempfile.mkstemp(prefix="attachment-", suffix=".bin", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+        except BaseException:
+            _remove(path)
+            raise
+        return cls(path, len(content), hashlib.sha256(content).digest(), owner=True)
+
+    def open(self) -> BinaryIO:
+        return open(self.path, "rb")
+
+    def read(self, size: int = -1) -> bytes:
+        """The content, or its first size bytes."""
+        with self.open() as f:
+            return f.read(size)
+
+    def release(self) -> None:
+        """Delete the file now rather than when the payload is collected."""
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __bytes__(self) -> bytes:
+        return self.read()
+
+    def __getitem__(self, index: slice) -> bytes:
+        if not isinstance(index, slice):
+            raise TypeError("SpilledPayload only supports slicing")
+        start, stop, step = index.indices(self.size)
+        if step != 1:
+            return self.read()[index]
+        if stop <= start:
+            return b""
+        with self.open() as f:
+            f.seek(start)
+            return f.read(stop - start)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, SpilledPayload):
+            return self.digest == other.digest
+        if isinstance(other, (bytes, bytearray)):
+            return self.size == len(other) and self.digest == hashlib.sha256(other).digest()
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.digest)
+
+    def __reduce__(self):
+        return (SpilledPayload, (self.path, self.size, self.digest))
+
+    def __repr__(self) -> str:
+        return f"SpilledPayload({self.path!r}, size={self.size})"
+
+
+Payload = Union[bytes, SpilledPayload]
+
+
+def _remove(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def spill(content: bytes, threshold: int = SPILL_BYTES, directory: Optional[str] = None) -> Payload:
+    """content itself, or a SpilledPayload when it is larger than threshold (0 never spills)."""
+    if not threshold or len(content) <= threshold:
+        return content
+    return SpilledPayload.write(content, directory)
+
+
+def content_digest(content: Payload) -> bytes:
+    """SHA-256 of the content, without reading a spilled payload."""
+    if isinstance(content, SpilledPayload):
+        return content.digest
+    return hashlib.sha256(content).digest()
+
+
+def open_payload(content: Payload) -> BinaryIO:
+    """A binary file object over the content, read from disk when spilled."""
+    if isinstance(content, SpilledPayload):
+        return content.open()
+    return io.BytesIO(content)
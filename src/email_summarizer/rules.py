@@ -0,0 +1,200 @@
+"""Weighted importance rules, compiled once and applied to whole batches.
+
+Every matching rule adds its weight to an email's score; an email is
+important when its score reaches ``threshold``. Rules can be loaded from a
+JSON file:
+
+    {
+        "threshold": 1.0,
+        "keywords": {"urgent": 2, "invoice": 1, "newsletter": -1},
+        "sender_domains": {"mycompany.com": 1.5},
+        "sender_addresses": {"boss@mycompany.com": 3},
+        "headers": [{"header": "List-Unsubscribe", "pattern": ".", "weight": -0.5}],
+        "attachment_weight": 1.0,
+        "attachment_patterns": {"\\\\.(pdf|docx)$": 0.5},
+        "reply_weight": 1.0
+    }
+
+``keywords`` may also be a plain list (weight 1 each). Keywords match the
+subject case-insensitively at the start of a word, so "meeting" also
+matches "meetings". Sender domains match subdomains too. Any key that is
+left out keeps its default.
+"""
+import json
+import re
+from bisect import bisect_right
+from email.utils import parseaddr
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Pattern, Set, Tuple, Union
+
+from .imap_fetcher import SPAM_MAILBOXES, FetchedEmail
+
+DEFAULT_KEYWORDS = (
+    'urgent', 'asap', 'immediately', 'deadline', 'important',
+    'action required', 'response needed', 'meeting', 'call',
+    'emergency', 'critical', 'priority',
+)
+
+DEFAULT_HEADER_RULES = (
+    {"header": "Importance", "pattern": r"^\s*high", "weight": 1.0},
+    {"header": "X-Priority", "pattern": r"^\s*[12]\b", "weight": 1.0},
+)
+
+_REPLY = re.compile(r"^\s*(?:re|fwd?)\s*:", re.IGNORECASE)
+
+_BULK_PRECEDENCE = re.compile(r"^\s*(?:bulk|list|junk)\b", re.IGNORECASE)
+
+Weights = Union[Mapping[str, float], Iterable[str]]
+
+
+def _weights(value: Optional[Weights], default: Iterable[str] = ()) -> Dict[str, float]:
+    if value is None:
+        value = default
+    if isinstance(value, Mapping):
+        return {str(k).strip().lower(): float(v) for k, v in value.items() if str(k).strip()}
+    return {str(k).strip().lower(): 1.0 for k in value if str(k).strip()}
+
+
+def _normalise(phrase: str) -> str:
+    return " ".join(phrase.lower().split())
+
+
+class ImportanceRules:
+    def __init__(self, keywords: Optional[Weights] = None, sender_domains: Optional[Weights] = None,
+                 sender_addresses: Optional[Weights] = None,
+                 header_rules: Optional[Iterable[Mapping[str, Any]]] = None,
+                 attachment_weight: float = 1.0, attachment_patterns: Optional[Mapping[str, float]] = None,
+                 reply_weight: float = 1.0, threshold: float = 1.0):
+        self.keywords = {_normalise(k): w for k, w in _weights(keywords, DEFAULT_KEYWORDS).items()}
+        self.sender_domains = {k.lstrip("@."): w for k, w in _weights(sender_domains).items()}
+        self.sender_addresses = _weights(sender_addresses)
+        self.attachment_weight = attachment_weight
+        self.reply_weight = reply_weight
+        self.threshold = threshold
+
+        # One alternation for every keyword, longest first so phrases win over their prefixes;
+        # the words of a phrase never match across a newline (see score_batch)
+        self._keyword_re: Optional[Pattern[str]] = None
+        if self.keywords:
+            alternatives = sorted(self.keywords, key=len, reverse=True)
+            self._keyword_re = re.compile(
+                r"\b(?:" + "|".join(r"[^\S\n]+".join(map(re.escape, k.split())) for k in alternatives) + ")",
+                re.IGNORECASE,
+            )
+
+        self.header_rules: List[Tuple[str, Pattern[str], float]] = []
+        for rule in DEFAULT_HEADER_RULES if header_rules is None else header_rules:
+            try:
+                self.header_rules.append(
+                    (str(rule["header"]).lower(), re.compile(str(rule["pattern"]), re.IGNORECASE), float(rule["weight"]))
+                )
+            except (KeyError, TypeError, re.error) as e:
+                raise ValueError(f"Invalid header rule {rule!r}: {e}") from None
+
+        self.attachment_patterns: List[Tuple[Pattern[str], float]] = []
+        for pattern, weight in (attachment_patterns or {}).items():
+            try:
+                self.attachment_patterns.append((re.compile(pattern, re.IGNORECASE), float(weight)))
+            except re.error as e:
+                raise ValueError(f"Invalid attachment pattern {pattern!r}: {e}") from None
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "ImportanceRules":
+        if not isinstance(data, Mapping):
+            raise ValueError("importance rules must be a JSON object")
+        return cls(
+            keywords=data.get("keywords"),
+            sender_domains=data.get("sender_domains"),
+            sender_addresses=data.get("sender_addresses"),
+            header_rules=data.get("headers"),
+            attachment_weight=float(data.get("attachment_weight", 1.0)),
+            attachment_patterns=data.get("attachment_patterns"),
+            reply_weight=float(data.get("reply_weight", 1.0)),
+            threshold=float(data.get("threshold", 1.0)),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "ImportanceRules":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Could not load importance rules from {path}: {e}") from None
+
+    def header_names(self) -> Set[str]:
+        """Headers the rules read; the fetcher must download these."""
+        return {name for name, _, _ in self.header_rules}
+
+    def _sender_score(self, from_addr: str) -> float:
+        address = parseaddr(from_addr)[1].lower()
+        if address in self.sender_addresses:
+            return self.sender_addresses[address]
+        domain = address.rpartition("@")[2]
+        # Most specific domain first: a.b.example.com, b.example.com, example.com, com
+        while domain:
+            if domain in self.sender_domains:
+                return self.sender_domains[domain]
+            domain = domain.partition(".")[2]
+        return 0.0
+
+    def _other_score(self, email: FetchedEmail) -> float:
+        score = self._sender_score(email.from_addr)
+        for name, pattern, weight in self.header_rules:
+            value = email.headers.get(name)
+            if value is not None and pattern.search(value):
+                score += weight
+        if email.attachments:
+            score += self.attachment_weight
+            for pattern, weight in self.attachment_patterns:
+                if any(pattern.search(filename) for filename, _, _ in email.attachments):
+                    score += weight
+        if _REPLY.match(email.subject):
+            score += self.reply_weight
+        return score
+
+    def score_batch(self, emails: List[FetchedEmail]) -> List[float]:
+        """Priority score for each email, scanning all subjects in one regex pass.
+
+        Each keyword counts once per email, however often it appears.
+        """
+        scores = [self._other_score(email) for email in emails]
+        if self._keyword_re is None or not emails:
+            return scores
+        starts = []
+        offset = 0
+        for email in emails:
+            starts.append(offset)
+            offset += len(email.subject) + 1
+        # Newlines separate subjects so no keyword can span two of them
+        subjects = "\n".join(email.subject.replace("\n", " ") for email in emails)
+        seen: Set[Tuple[int, str]] = set()
+        for match in self._keyword_re.finditer(subjects):
+            index = bisect_right(starts, match.start()) - 1
+            keyword = _normalise(match.group(0))
+            if (index, keyword) not in seen:
+                seen.add((index, keyword))
+                scores[index] += self.keywords[keyword]
+        return scores
+
+    def score(self, email: FetchedEmail) -> float:
+        return self.score_batch([email])[0]
+
+    def is_important(self, email: FetchedEmail) -> bool:
+        return self.score(email) >= self.threshold
+
+    def rank(self, emails: List[FetchedEmail]) -> List[Tuple[float, FetchedEmail]]:
+        """(score, email) pairs, highest priority first; ties keep input order."""
+        scored = list(zip(self.score_batch(emails), emails))
+        return sorted(scored, key=lambda pair: -pair[0])
+
+
+def is_bulk(email: FetchedEmail) -> bool:
+    """Spam-folder mail, mailing lists, newsletters and automated notifications."""
+    if email.mailbox in SPAM_MAILBOXES:
+        return True
+    headers = email.headers
+    if headers.get("list-id") or headers.get("list-unsubscribe"):
+        return True
+    if _BULK_PRECEDENCE.match(headers.get("precedence", "")):
+        return True
+    auto_submitted = headers.get("auto-submitted", "").strip().lower()
+    return bool(auto_submitted) and auto_submitted != "no"
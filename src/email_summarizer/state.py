@@ -1,61 +1,183 @@
 import json
 import os
+import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import Dict, Optional
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+try:
+	import fcntl
+except ImportError:  # Windows: runs are not locked against each other
+	fcntl = None  # type: ignore[assignment]
+
+# Checkpoint stages of a message in an unfinished run, in order
+FETCHED = 1  # downloaded
+PARSED = 2  # saved to the message store with its attachment text
+SUMMARIZED = 3  # summary saved to the message store
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+	account TEXT PRIMARY KEY,
+	last_run TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS mailboxes (
+	account TEXT NOT NULL,
+	mailbox TEXT NOT NULL,
+	uidvalidity INTEGER NOT NULL,
+	last_uid INTEGER NOT NULL,
+	PRIMARY KEY (account, mailbox)
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+	account TEXT NOT NULL,
+	mailbox TEXT NOT NULL,
+	uid INTEGER NOT NULL,
+	stage INTEGER NOT NULL,
+	PRIMARY KEY (account, mailbox, uid)
+);
+"""
+
+
+class StateLockedError(RuntimeError):
+	"""Another process holds the lock on an account (or the digest)."""
 
 
 class StateStore:
-	"""File-based state to track last-run timestamps per account.
-
-	Stored at: {state_dir}/state.json
-	Schema:
-	{
-		"accounts": {
-			"gmail": {"last_run_iso": "..."},
-			"outlook": {"last_run_iso": "..."}
-		}
-	}
+	"""Journaled run state: last-run timestamps and per-mailbox UID
+	high-water marks per account, plus checkpoints of the messages an
+	unfinished run has got through.
+
+	Stored at {state_dir}/state.db (SQLite in WAL mode), so each update is
+	a small transaction rather than a rewrite of the whole file, and a
+	crash never leaves it half written. An existing state.json is imported
+	once. lock() guards an account against concurrent runs.
 	"""
 
 	def __init__(self, state_dir: str) -> None:
 		self.state_dir = state_dir
-		self.state_file = os.path.join(state_dir, "state.json")
+		self.state_file = os.path.join(state_dir, "state.db")
 		os.makedirs(state_dir, exist_ok=True)
-		self._state: Dict[str, Dict] = {"accounts": {}}
-		self._load()
+		# Accounts are fetched from worker threads
+		self._lock = threading.RLock()
+		self._db = sqlite3.connect(self.state_file, check_same_thread=False, timeout=30)
+		with self._lock, self._db:
+			self._db.execute("PRAGMA journal_mode=WAL")
+			self._db.executescript(_SCHEMA)
+			if self._db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+				self._import_json(os.path.join(state_dir, "state.json"))
+				self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
 
-	def _load(self) -> None:
-		if not os.path.exists(self.state_file):
-			return
+	def _import_json(self, path: str) -> None:
+		"""Carry over the state.json of earlier versions."""
 		try:
-			with open(self.state_file, "r", encoding="utf-8") as f:
-				self._state = json.load(f)
+			with open(path, "r", encoding="utf-8") as f:
+				accounts = json.load(f).get("accounts", {})
 		except Exception:
-			# Corrupt state: reset
-			self._state = {"accounts": {}}
+			# Missing or corrupt: start afresh
+			return
+		for account, node in accounts.items():
+			if node.get("last_run_iso"):
+				self._db.execute("INSERT OR REPLACE INTO accounts VALUES (?, ?)", (account, node["last_run_iso"]))
+			for mailbox, mark in (node.get("mailboxes") or {}).items():
+				try:
+					self._db.execute(
+						"INSERT OR REPLACE INTO mailboxes VALUES (?, ?, ?, ?)",
+						(account, mailbox, int(mark["uidvalidity"]), int(mark["last_uid"])),
+					)
+				except (KeyError, TypeError, ValueError):
+					continue
+
+	def close(self) -> None:
+		with self._lock:
+			self._db.close()
 
-	def save(self) -> None:
-		tmp_path = self.state_file + ".tmp"
-		with open(tmp_path, "w", encoding="utf-8") as f:
-			json.dump(self._state, f, indent=2)
-		os.replace(tmp_path, self.state_file)
+	@contextmanager
+	def lock(self, key: str) -> Iterator[None]:
+		"""Hold an exclusive lock on key (an account or the digest) for the
+		duration; raises StateLockedError at once if another process has it."""
+		if fcntl is None:
+			yield
+			return
+		directory = os.path.join(self.state_dir, "locks")
+		os.makedirs(directory, exist_ok=True)
+		with open(os.path.join(directory, f"{key}.lock"), "a") as f:
+			try:
+				fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+			except OSError:
+				raise StateLockedError(f"{key} is in use by another email-summarizer run") from None
+			try:
+				yield
+			finally:
+				fcntl.flock(f.fileno(), fcntl.LOCK_UN)
 
 	def get_last_run(self, account_key: str) -> Optional[datetime]:
-		node = self._state.get("accounts", {}).get(account_key)
-		if not node:
-			return None
-		iso = node.get("last_run_iso")
-		if not iso:
+		with self._lock:
+			row = self._db.execute("SELECT last_run FROM accounts WHERE account = ?", (account_key,)).fetchone()
+		if not row:
 			return None
 		try:
-			return datetime.fromisoformat(iso)
+			return datetime.fromisoformat(row[0])
 		except Exception:
 			return None
 
 	def set_last_run(self, account_key: str, dt: Optional[datetime] = None) -> None:
+		with self._lock, self._db:
+			self._set_last_run(account_key, dt)
+
+	def _set_last_run(self, account_key: str, dt: Optional[datetime]) -> None:
 		if dt is None:
 			dt = datetime.now(timezone.utc)
-		self._state.setdefault("accounts", {}).setdefault(account_key, {})[
-			"last_run_iso"
-		] = dt.astimezone(timezone.utc).isoformat()
-		self.save()
+		self._db.execute(
+			"INSERT OR REPLACE INTO accounts VALUES (?, ?)",
+			(account_key, dt.astimezone(timezone.utc).isoformat()),
+		)
+
+	def get_mailbox_marks(self, account_key: str) -> Dict[str, Tuple[int, int]]:
+		"""Return {mailbox: (uidvalidity, last_uid)} for an account."""
+		with self._lock:
+			rows = self._db.execute(
+				"SELECT mailbox, uidvalidity, last_uid FROM mailboxes WHERE account = ?", (account_key,)
+			).fetchall()
+		return {mailbox: (uidvalidity, last_uid) for mailbox, uidvalidity, last_uid in rows}
+
+	def set_mailbox_marks(self, account_key: str, marks: Dict[str, Tuple[int, int]]) -> None:
+		with self._lock, self._db:
+			self._set_mailbox_marks(account_key, marks)
+
+	def set_mailbox_mark(self, account_key: str, mailbox: str, mark: Tuple[int, int]) -> None:
+		"""Advance one mailbox's mark alone; the account's last-run time and checkpoints are left as they are."""
+		with self._lock, self._db:
+			self._set_mailbox_marks(account_key, {mailbox: mark})
+
+	def _set_mailbox_marks(self, account_key: str, marks: Dict[str, Tuple[int, int]]) -> None:
+		self._db.executemany(
+			"INSERT OR REPLACE INTO mailboxes VALUES (?, ?, ?, ?)",
+			[(account_key, mailbox, uidvalidity, last_uid) for mailbox, (uidvalidity, last_uid) in marks.items()],
+		)
+
+	def checkpoint(self, account_key: str, messages: Iterable[Tuple[str, int]], stage: int) -> None:
+		"""Record that messages ((mailbox, uid) pairs) reached stage; stages never go back."""
+		with self._lock, self._db:
+			self._db.executemany(
+				"""INSERT INTO checkpoints VALUES (?, ?, ?, ?)
+				   ON CONFLICT (account, mailbox, uid) DO UPDATE SET stage = MAX(stage, excluded.stage)""",
+				[(account_key, mailbox, uid, stage) for mailbox, uid in messages],
+			)
+
+	def checkpoints(self, account_key: str) -> Dict[Tuple[str, int], int]:
+		"""{(mailbox, uid): stage} for the messages of an unfinished run."""
+		with self._lock:
+			rows = self._db.execute(
+				"SELECT mailbox, uid, stage FROM checkpoints WHERE account = ?", (account_key,)
+			).fetchall()
+		return {(mailbox, uid): stage for mailbox, uid, stage in rows}
+
+	def complete_run(self, account_key: str, marks: Dict[str, Tuple[int, int]],
+			dt: Optional[datetime] = None) -> None:
+		"""Finish a run in one transaction: advance the marks and last-run time, drop the checkpoints."""
+		with self._lock, self._db:
+			self._set_mailbox_marks(account_key, marks)
+			self._set_last_run(account_key, dt)
+			self._db.execute("DELETE FROM checkpoints WHERE account = ?", (account_key,))
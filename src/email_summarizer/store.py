@@ -0,0 +1,323 @@
+"""Local SQLite store of parsed messages, their summaries and past digests.
+
+Everything fetched is kept at {state_dir}/messages.db (WAL mode, so the
+daemon can write while a digest or search reads). Messages are indexed by
+account/mailbox/UID and by date, and their subject, sender, body and
+attachment text are full-text indexed with FTS5 where SQLite has it.
+Regenerating a digest, trying another model or searching old mail are
+then local queries instead of IMAP round trips.
+"""
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .imap_fetcher import FetchedEmail
+
+# Characters of body text kept per message, enough for thread prompts and fingerprints
+MAX_BODY_CHARS = 20000
+
+# (filename, mime type, extracted text or "")
+StoredAttachment = Tuple[str, str, str]
+
+MessageKey = Tuple[str, str, int]
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    mailbox TEXT NOT NULL,
+    uid INTEGER NOT NULL,
+    message_id TEXT NOT NULL DEFAULT '',
+    in_reply_to TEXT NOT NULL DEFAULT '',
+    refs TEXT NOT NULL DEFAULT '[]',
+    subject TEXT NOT NULL DEFAULT '',
+    from_addr TEXT NOT NULL DEFAULT '',
+    to_addrs TEXT NOT NULL DEFAULT '[]',
+    date TEXT NOT NULL,
+    date_ts REAL NOT NULL,
+    headers TEXT NOT NULL DEFAULT '{}',
+    body_text TEXT NOT NULL DEFAULT '',
+    stored_at REAL NOT NULL,
+    UNIQUE (account, mailbox, uid)
+);
+CREATE INDEX IF NOT EXISTS messages_date ON messages (date_ts);
+CREATE INDEX IF NOT EXISTS messages_stored ON messages (stored_at);
+CREATE INDEX IF NOT EXISTS messages_message_id ON messages (message_id);
+CREATE TABLE IF NOT EXISTS attachments (
+    message INTEGER NOT NULL REFERENCES messages (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    mime_type TEXT NOT NULL,
+    text TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (message, position)
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    message INTEGER NOT NULL REFERENCES messages (id) ON DELETE CASCADE,
+    model TEXT NOT NULL,
+    prompt_version INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (message, model, prompt_version)
+);
+CREATE TABLE IF NOT EXISTS digests (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    model TEXT NOT NULL,
+    email_count INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS message_search
+USING fts5 (subject, from_addr, body_text, attachment_text, tokenize = 'unicode61 remove_diacritics 2')
+"""
+
+
+class MessageStore:
+    """Thread-safe handle on the message database.
+
+    One connection is shared behind a lock; WAL lets other processes read
+    while it writes.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("PRAGMA foreign_keys=ON")
+            self._db.executescript(_SCHEMA)
+            self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            try:
+                self._db.execute(_FTS_SCHEMA)
+                self.full_text = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: search falls back to LIKE
+                self.full_text = False
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def save(self, records: Iterable[Tuple[FetchedEmail, List[StoredAttachment]]]) -> int:
+        """Insert or replace messages with their attachment text; returns how many."""
+        now = time.time()
+        count = 0
+        with self._lock, self._db:
+            for email, attachments in records:
+                self._db.execute(
+                    """INSERT INTO messages (account, mailbox, uid, message_id, in_reply_to, refs, subject,
+                           from_addr, to_addrs, date, date_ts, headers, body_text, stored_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT (account, mailbox, uid) DO UPDATE SET
+                           message_id = excluded.message_id, in_reply_to = excluded.in_reply_to,
+                           refs = excluded.refs, subject = excluded.subject, from_addr = excluded.from_addr,
+                           to_addrs = excluded.to_addrs, date = excluded.date, date_ts = excluded.date_ts,
+                           headers = excluded.headers, body_text = excluded.body_text,
+                           stored_at = excluded.stored_at""",
+                    (
+                        email.account, email.mailbox, email.uid, email.message_id, email.in_reply_to,
+                        json.dumps(email.references), email.subject, email.from_addr, json.dumps(email.to_addrs),
+                        email.date.isoformat(), _timestamp(email.date), json.dumps(email.headers),
+                        email.body_text[:MAX_BODY_CHARS], now,
+                    ),
+                )
+                message = self._db.execute(
+                    "SELECT id FROM messages WHERE account = ? AND mailbox = ? AND uid = ?",
+                    (email.account, email.mailbox, email.uid),
+                ).fetchone()[0]
+                self._db.execute("DELETE FROM attachments WHERE message = ?", (message,))
+                self._db.executemany(
+                    "INSERT INTO attachments (message, position, filename, mime_type, text) VALUES (?, ?, ?, ?, ?)",
+                    [(message, i, filename, mime_type, text) for i, (filename, mime_type, text) in enumerate(attachments)],
+                )
+                if self.full_text:
+                    self._db.execute("DELETE FROM message_search WHERE rowid = ?", (message,))
+                    self._db.execute(
+                        "INSERT INTO message_search (rowid, subject, from_addr, body_text, attachment_text)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (message, email.subject, email.from_addr, email.body_text[:MAX_BODY_CHARS],
+                         "\n".join(text for _, _, text in attachments if text)),
+                    )
+                count += 1
+        return count
+
+    def set_summaries(self, summaries: Iterable[Tuple[MessageKey, str]], model: str, prompt_version: int) -> None:
+        """Record summaries of stored messages; keys not in the store are ignored."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                """INSERT OR REPLACE INTO summaries (message, model, prompt_version, summary, created_at)
+                   SELECT id, ?, ?, ?, ? FROM messages WHERE account = ? AND mailbox = ? AND uid = ?""",
+                [(model, prompt_version, summary, now, *key) for key, summary in summaries],
+            )
+
+    def summaries(self, keys: Sequence[MessageKey], model: str, prompt_version: int) -> Dict[MessageKey, str]:
+        """Stored summaries by the given model and prompt version, for whichever of keys have one."""
+        keys = list(keys)
+        found: Dict[MessageKey, str] = {}
+        with self._lock:
+            # 3 parameters per key; batches stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 300):
+                chunk = keys[start:start + 300]
+                rows = self._db.execute(
+                    f"""SELECT m.account, m.mailbox, m.uid, s.summary FROM summaries s
+                        JOIN messages m ON m.id = s.message
+                        WHERE s.model = ? AND s.prompt_version = ?
+                          AND (m.account, m.mailbox, m.uid) IN (VALUES {', '.join('(?, ?, ?)' for _ in chunk)})""",
+                    [model, prompt_version] + [part for key in chunk for part in key],
+                ).fetchall()
+                for row in rows:
+                    found[(row["account"], row["mailbox"], row["uid"])] = row["summary"]
+        return found
+
+    def load(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+             stored_since: Optional[datetime] = None, accounts: Optional[Iterable[str]] = None) -> List[FetchedEmail]:
+        """Messages dated in [since, until) and stored after stored_since, oldest first."""
+        clauses: List[str] = []
+        params: List[Any] = []
+        if since is not None:
+            clauses.append("date_ts >= ?")
+            params.append(_timestamp(since))
+        if until is not None:
+            clauses.append("date_ts < ?")
+            params.append(_timestamp(until))
+        if stored_since is not None:
+            clauses.append("stored_at > ?")
+            params.append(_timestamp(stored_since))
+        if accounts is not None:
+            accounts = list(accounts)
+            clauses.append(f"account IN ({', '.join('?' for _ in accounts)})")
+            params.extend(accounts)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._db.execute(f"SELECT * FROM messages {where} ORDER BY date_ts, id", params).fetchall()
+            return self._emails(rows)
+
+    def load_keys(self, keys: Sequence[MessageKey]) -> List[FetchedEmail]:
+        """The stored messages among keys, oldest first."""
+        keys = list(keys)
+        rows: List[sqlite3.Row] = []
+        with self._lock:
+            for start in range(0, len(keys), 300):
+                chunk = keys[start:start + 300]
+                rows.extend(self._db.execute(
+                    f"""SELECT * FROM messages
+                        WHERE (account, mailbox, uid) IN (VALUES {', '.join('(?, ?, ?)' for _ in chunk)})""",
+                    [part for key in chunk for part in key],
+                ).fetchall())
+            rows.sort(key=lambda row: (row["date_ts"], row["id"]))
+            return self._emails(rows)
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[FetchedEmail, str]]:
+        """(email, snippet) for messages matching query, best match first.
+
+        With FTS5 the query uses its syntax (words, "phrases", OR, prefix*);
+        if it does not parse, the words are searched for literally.
+        """
+        with self._lock:
+            if not self.full_text:
+                pattern = f"%{query}%"
+                rows = self._db.execute(
+                    """SELECT *, substr(body_text, 1, 160) AS snippet FROM messages
+                       WHERE subject LIKE ? OR from_addr LIKE ? OR body_text LIKE ?
+                       ORDER BY date_ts DESC LIMIT ?""",
+                    (pattern, pattern, pattern, limit),
+                ).fetchall()
+            else:
+                sql = """SELECT m.*, snippet(message_search, -1, '**', '**', '…', 16) AS snippet
+                         FROM message_search JOIN messages m ON m.id = message_search.rowid
+                         WHERE message_search MATCH ? ORDER BY rank LIMIT ?"""
+                try:
+                    rows = self._db.execute(sql, (query, limit)).fetchall()
+                except sqlite3.OperationalError:
+                    literal = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+                    rows = self._db.execute(sql, (literal, limit)).fetchall() if literal else []
+            return list(zip(self._emails(rows), (row["snippet"] or "" for row in rows)))
+
+    def add_digest(self, text: str, model: str, email_count: int) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO digests (created_at, model, email_count, text) VALUES (?, ?, ?, ?)",
+                (time.time(), model, email_count, text),
+            )
+
+    def digests(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Most recent digests first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT created_at, model, email_count, text FROM digests ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def prune(self, before: datetime) -> int:
+        """Delete messages dated before ``before``; returns how many were removed."""
+        cutoff = _timestamp(before)
+        with self._lock, self._db:
+            if self.full_text:
+                self._db.execute(
+                    "DELETE FROM message_search WHERE rowid IN (SELECT id FROM messages WHERE date_ts < ?)", (cutoff,)
+                )
+            removed = self._db.execute("DELETE FROM messages WHERE date_ts < ?", (cutoff,)).rowcount
+            self._db.execute("DELETE FROM digests WHERE created_at < ?", (cutoff,))
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def _emails(self, rows: List[sqlite3.Row]) -> List[FetchedEmail]:
+        """Rebuild FetchedEmails; call with the lock held."""
+        ids = [row["id"] for row in rows]
+        attachments: Dict[int, List[Tuple[str, bytes, str]]] = {}
+        # Batched to stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            for a in self._db.execute(
+                f"SELECT message, filename, mime_type, text FROM attachments"
+                f" WHERE message IN ({', '.join('?' for _ in chunk)}) ORDER BY message, position",
+                chunk,
+            ):
+                # Extracted text stands in for the file, so prompts rebuilt from
+                # the store match the ones built when the message was stored
+                if a["text"]:
+                    item = (a["filename"], a["text"].encode("utf-8"), "text/plain")
+                else:
+                    item = (a["filename"], b"", a["mime_type"])
+                attachments.setdefault(a["message"], []).append(item)
+        return [
+            FetchedEmail(
+                account=row["account"],
+                uid=row["uid"],
+                subject=row["subject"],
+                from_addr=row["from_addr"],
+                to_addrs=json.loads(row["to_addrs"]),
+                date=datetime.fromisoformat(row["date"]),
+                body_text=row["body_text"],
+                html_text=None,
+                attachments=attachments.get(row["id"], []),
+                raw_message=b"",
+                mailbox=row["mailbox"],
+                headers=json.loads(row["headers"]),
+                message_id=row["message_id"],
+                in_reply_to=row["in_reply_to"],
+                references=json.loads(row["refs"]),
+            )
+            for row in rows
+        ]
+
+
+def _timestamp(date: datetime) -> float:
+    try:
+        return date.timestamp()
+    except (OverflowError, OSError, ValueError):
+        return 0.0
@@ -1,160 +1,1045 @@
+import heapq
+import itertools
 import json
-import requests
-from typing import List, Dict, Any
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor, TimeoutError
+from typing import Callable, Iterator, List, Dict, Any, Optional, Set, Tuple
+from . import extractive, overview
 from .imap_fetcher import FetchedEmail
-from .attachment_parser import parse_all_attachments
+from .attachment_parser import AttachmentPool, parse_all_attachments
+from .cache import DiskCache
+from .compaction import compact, compact_document, estimate_tokens, fill_budget, fit_tokens
+from .conversations import Conversation, group_conversations, is_reply
+from .dedup import MAX_DISTANCE, FingerprintStore, SimHashIndex, cluster_duplicates, fingerprint, sender
+from .llm import LLMBackend, OllamaBackend
+from .metrics import Metrics
+from .payload import Payload
+from .rules import ImportanceRules, is_bulk
+
+# Bump when the prompt wording changes so cached summaries are not reused
+PROMPT_VERSION = 3
+
+# Sent as the system prompt so every request shares the same prefix
+SUMMARY_INSTRUCTIONS = "Summarize this email in 2-3 bullet points. Focus on key information, actions needed, and important details."
+
+# Tokens of email content (body first, then attachments) in a prompt
+CONTENT_TOKEN_BUDGET = 750
+
+# Characters of text extracted per attachment, and tokens of each in a prompt
+ATTACHMENT_CHAR_BUDGET = 1000
+ATTACHMENT_TOKEN_BUDGET = 250
+
+# Attachments get at least this many tokens, or are listed by name only
+MIN_ATTACHMENT_TOKENS = 20
+
+BATCH_INSTRUCTIONS = """Summarize each of the following emails in 1-3 bullet points. Focus on key information, actions needed, and important details.
+Respond with a JSON object that maps each email number (as a string) to its summary, for example {"1": "• ...", "2": "• ..."}."""
+
+# Completion tokens allowed per email in a batched prompt
+BATCH_TOKENS_PER_EMAIL = 120
+
+THREAD_INSTRUCTIONS = "Summarize this email conversation in 2-4 bullet points. Focus on where it stands now: decisions made, open questions and actions needed, and who owns them."
+
+# Tokens of conversation text included in a thread prompt
+THREAD_TOKEN_BUDGET = 1500
+
+# Batched summaries outside these bounds are retried on their own
+MIN_SUMMARY_CHARS = 10
+MAX_SUMMARY_CHARS = 1500
+
+# Weight of the newest LLM call in the running estimate of call duration
+LLM_SECONDS_SMOOTHING = 0.3
 
 
 class EmailSummarizer:
-    def __init__(self, ollama_model: str = "llama3.1:8b", ollama_url: str = "http://localhost:11434"):
+    def __init__(self, ollama_model: str = "llama3.1:8b", ollama_url: str = "http://localhost:11434",
+                 max_workers: int = 4, request_timeout: float = 60.0, cache: Optional[DiskCache] = None,
+                 attachment_pool: Optional[AttachmentPool] = None,
+                 batch_token_budget: int = 0, batch_max_email_tokens: int = 300, stream: bool = False,
+                 backend: Optional[LLMBackend] = None, metrics: Optional[Metrics] = None,
+                 rules: Optional[ImportanceRules] = None, group_threads: bool = True,
+                 collapse_duplicates: bool = True, fingerprints: Optional[FingerprintStore] = None,
+                 duplicate_distance: int = MAX_DISTANCE, llm_min_score: Optional[float] = None,
+                 extractive_bulk: bool = True, content_token_budget: int = CONTENT_TOKEN_BUDGET,
+                 time_budget: Optional[float] = None, overview_min_entries: int = overview.MIN_ENTRIES,
+                 overview_chunk_tokens: int = overview.CHUNK_TOKENS):
         self.ollama_model = ollama_model
+        self.cache = cache
+        self.attachment_pool = attachment_pool
+        # Short emails are packed into shared prompts up to this many tokens; 0 disables
+        self.batch_token_budget = batch_token_budget
+        self.batch_max_email_tokens = batch_max_email_tokens
+        # Tokens of email content per prompt, see _email_content()
+        self.content_token_budget = content_token_budget
         self.ollama_url = ollama_url
+        self.max_workers = max(1, max_workers)
+        self.request_timeout = request_timeout
+        self.backend = backend or OllamaBackend(
+            ollama_model, ollama_url, timeout=request_timeout, stream=stream, pool_size=self.max_workers
+        )
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.rules = rules or ImportanceRules()
+        # Summarize each multi-message conversation with one prompt
+        self.group_threads = group_threads
+        # Summarize one email per cluster of near-identical bulk mail from one
+        # sender; fingerprints remembers clusters (and their summaries) across runs
+        self.collapse_duplicates = collapse_duplicates
+        self.fingerprints = fingerprints
+        self.duplicate_distance = duplicate_distance
+        self._fingerprints: Dict[Any, Optional[int]] = {}
+        self._prefetched: SimHashIndex[Tuple[str, Any]] = SimHashIndex(duplicate_distance)  # (sender, email.key)
+        # Emails scoring below llm_min_score, and bulk mail with extractive_bulk,
+        # get an extractive summary instead of an LLM call
+        self.llm_min_score = llm_min_score
+        self.extractive_bulk = extractive_bulk
+        self._extractive_keys: Set[Any] = set()
+        # With time_budget (seconds, counted from the first queued summary),
+        # queued work runs highest importance first, and whatever would not
+        # finish by the deadline gets an extractive summary instead
+        self.time_budget = time_budget
+        self._deadline: Optional[float] = None
+        self._llm_seconds: Optional[float] = None
+        self._degraded: Set[Any] = set()
+        # Tasks waiting for a worker: (-priority, sequence, future, fn, args)
+        self._queue: List[Tuple[float, int, "Future[Any]", Callable[..., Any], Tuple[Any, ...]]] = []
+        self._sequence = itertools.count()
+        # Digests with at least overview_min_entries entries (0 never) end with an
+        # executive summary, reduced from chunks of overview_chunk_tokens
+        self.overview_min_entries = overview_min_entries
+        self.overview_chunk_tokens = overview_chunk_tokens
+        # Per-email summaries computed by the last digest or summarize_arrivals(), for MessageStore
+        self.last_summaries: Dict[Any, str] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[Any, "Future[str]"] = {}
+        self._started: Optional[float] = None
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, Any] = {
+            "emails": 0,
+            "llm_calls": 0,
+            "batch_fallbacks": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "degraded": 0,
+            "elapsed": 0.0,
+        }
+    
+    def _record(self, **counts: Any) -> None:
+        with self._stats_lock:
+            for key, value in counts.items():
+                self.stats[key] += value
     
-    def _call_ollama(self, prompt: str, max_tokens: int = 1000) -> str:
-        """Call Ollama API with the given prompt."""
+    def _call_ollama(self, prompt: str, max_tokens: int = 1000, format: Optional[str] = None,
+                     system: Optional[str] = SUMMARY_INSTRUCTIONS) -> str:
+        """Call the LLM backend with the given prompt."""
+        kind = "batch" if format == "json" else "single"
+        started = time.monotonic()
         try:
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": self.ollama_model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "num_predict": max_tokens,
-                        "temperature": 0.3
-                    }
-                },
-                timeout=60
-            )
-            response.raise_for_status()
-            result = response.json()
-            return result.get("response", "").strip()
+            with self.metrics.span("llm_request", kind=kind):
+                result = self.backend.generate(prompt, max_tokens=max_tokens, format=format, system=system)
         except Exception as e:
+            self.metrics.inc("llm_errors", kind=kind)
             print(f"Ollama API error: {e}")
             return ""
+        seconds = time.monotonic() - started
+        with self._stats_lock:
+            if self._llm_seconds is None:
+                self._llm_seconds = seconds
+            else:
+                self._llm_seconds += LLM_SECONDS_SMOOTHING * (seconds - self._llm_seconds)
+        self._record(
+            llm_calls=1,
+            prompt_tokens=result.prompt_tokens,
+            completion_tokens=result.completion_tokens,
+        )
+        self.metrics.inc("llm_requests", kind=kind)
+        self.metrics.inc("llm_prompt_tokens", result.prompt_tokens, kind=kind)
+        self.metrics.inc("llm_completion_tokens", result.completion_tokens, kind=kind)
+        return result.text
+    
+    def warmup(self) -> None:
+        """Start loading the model so it is resident before the first summary."""
+        self.backend.warmup()
     
     def is_important(self, email: FetchedEmail) -> bool:
-        """Determine if an email is important based on heuristics."""
-        subject = email.subject.lower()
-        from_addr = email.from_addr.lower()
-        
-        # High importance indicators
-        high_priority_keywords = [
-            'urgent', 'asap', 'immediately', 'deadline', 'important',
-            'action required', 'response needed', 'meeting', 'call',
-            'emergency', 'critical', 'priority'
+        """Determine if an email is important using the importance rules."""
+        return self.rules.is_important(email)
+    
+    def _attachment_lines(self, parsed_attachments: List[Tuple[str, str]], budget: int) -> List[str]:
+        """One line per attachment, each fitted into what is left of budget."""
+        fitted = fill_budget(
+            [compact_document(text) for _, text in parsed_attachments], budget,
+            per_text=ATTACHMENT_TOKEN_BUDGET, min_tokens=MIN_ATTACHMENT_TOKENS,
+        )
+        return [
+            f"Attachment '{filename}': {text or '[not included]'}"
+            for (filename, _), text in zip(parsed_attachments, fitted)
         ]
+    
+    def _email_content(self, email: FetchedEmail, parsed_attachments: List[Tuple[str, str]]) -> str:
+        """Build the content section of the prompt; empty when nothing is readable.
         
-        # Check subject for high priority keywords
-        if any(keyword in subject for keyword in high_priority_keywords):
-            return True
-        
-        # Check if from known contacts (simplified - you could expand this)
-        known_domains = ['company.com', 'workplace.org']  # Add your important domains
-        if any(domain in from_addr for domain in known_domains):
-            return True
-        
-        # Check if email has attachments (often indicates importance)
-        if email.attachments:
-            return True
-        
-        # Check if email is a reply (conversation thread)
-        if subject.startswith('re:') or subject.startswith('fwd:'):
-            return True
-        
-        return False
+        The body is compacted (quoted history, signature, disclaimers and
+        long links removed) and takes the token budget first; attachments
+        share what is left.
+        """
+        body = fit_tokens(compact(email.body_text), self.content_token_budget)
+        content_parts = []
+        if body:
+            content_parts.append(f"Email body: {body}")
+        if parsed_attachments:
+            remaining = self.content_token_budget - estimate_tokens("\n\n".join(content_parts))
+            attachment_lines = self._attachment_lines(parsed_attachments, remaining)
+            content_parts.append("Attachments: " + "\n".join(attachment_lines))
+        return "\n\n".join(content_parts)
+    
+    def _build_prompt(self, email: FetchedEmail, content: str) -> str:
+        return f"""From: {email.from_addr}
+Subject: {email.subject}
+Date: {email.date}
+
+Content:
+{content}
+
+Summary:"""
+    
+    def _cache_key(self, prompt: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return DiskCache.make_key(self.ollama_model, PROMPT_VERSION, prompt)
+    
+    def _fallback_summary(self, email: FetchedEmail,
+                          parsed_attachments: Optional[List[Tuple[str, str]]] = None) -> str:
+        """Summary used when the LLM fails: the email's key sentences."""
+        return self._extractive_summary(email, parsed_attachments) or (
+            f"• From: {email.from_addr}\n• Subject: {email.subject}"
+        )
     
-    def summarize_email(self, email: FetchedEmail) -> str:
+    def _extractive_summary(self, email: FetchedEmail,
+                            parsed_attachments: Optional[List[Tuple[str, str]]] = None) -> str:
+        """Key sentences of the email's new text (or of its attachments when the body is empty)."""
+        with self._stats_lock:
+            self._extractive_keys.add(email.key)
+        text = compact(email.body_text)
+        if not text.strip() and parsed_attachments:
+            text = "\n\n".join(attachment_text for _, attachment_text in parsed_attachments)
+        filenames = [filename for filename, _, _ in email.attachments]
+        return extractive.summarize(text, email.subject, attachments=filenames)
+    
+    def _extractive_thread(self, conversation: Conversation) -> str:
+        text = "\n\n".join(new_text for _, new_text in conversation.messages() if new_text)
+        return extractive.summarize(text, conversation.subject, max_sentences=4) or (
+            f"• {len(conversation)} messages from {', '.join(conversation.participants())}"
+        )
+    
+    def needs_llm(self, emails: List[FetchedEmail], scores: Optional[List[float]] = None) -> List[bool]:
+        """Whether each email is worth an LLM call, or gets an extractive summary."""
+        if scores is None:
+            scores = self.rules.score_batch(emails) if self.llm_min_score is not None else [0.0] * len(emails)
+        return [
+            not (self.extractive_bulk and is_bulk(email))
+            and (self.llm_min_score is None or score >= self.llm_min_score)
+            for email, score in zip(emails, scores)
+        ]
+    
+    def _submit_extractive(self, email: FetchedEmail) -> "Future[str]":
+        summary = self._extractive_summary(email) or self._no_content_summary(email)
+        self.metrics.inc("summaries", source="extractive")
+        return _completed(summary)
+    
+    def _no_content_summary(self, email: FetchedEmail) -> str:
+        return f"Email from {email.from_addr} with subject '{email.subject}' (no readable content)"
+    
+    def summarize_email(self, email: FetchedEmail, parsed_attachments: Optional[List[Tuple[str, str]]] = None) -> str:
         """Generate a summary for a single email."""
         # Parse attachments
-        parsed_attachments = parse_all_attachments(email.attachments)
-        attachment_text = ""
-        if parsed_attachments:
-            attachment_summaries = []
-            for filename, text in parsed_attachments:
-                # Truncate very long attachments
-                if len(text) > 1000:
-                    text = text[:1000] + "..."
-                attachment_summaries.append(f"Attachment '{filename}': {text}")
-            attachment_text = "\n".join(attachment_summaries)
-        
-        # Prepare content for summarization
-        content_parts = []
-        if email.body_text:
-            content_parts.append(f"Email body: {email.body_text}")
-        if attachment_text:
-            content_parts.append(f"Attachments: {attachment_text}")
+        if parsed_attachments is None:
+            parsed_attachments = parse_all_attachments(
+                email.attachments, pool=self.attachment_pool, max_chars=ATTACHMENT_CHAR_BUDGET + 1
+            )
         
-        if not content_parts:
-            return f"Email from {email.from_addr} with subject '{email.subject}' (no readable content)"
+        content = self._email_content(email, parsed_attachments)
+        if not content:
+            self.metrics.inc("summaries", source="no_content")
+            return self._no_content_summary(email)
+        prompt = self._build_prompt(email, content)
         
-        content = "\n\n".join(content_parts)
+        cache_key = self._cache_key(prompt)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached:
+                self.metrics.inc("summaries", source="cache")
+                return cached
+        if self._out_of_time():
+            return self._degraded_summary(email, parsed_attachments)
         
-        # Truncate very long content
-        if len(content) > 3000:
-            content = content[:3000] + "..."
+        summary = self._call_ollama(prompt, max_tokens=200)
+        if summary and cache_key is not None:
+            self.cache.set(cache_key, summary)
+        if not summary:
+            # Fallback summary
+            self.metrics.inc("summaries", source="fallback")
+            summary = self._fallback_summary(email, parsed_attachments)
+        else:
+            self.metrics.inc("summaries", source="llm")
         
-        prompt = f"""Summarize this email in 2-3 bullet points. Focus on key information, actions needed, and important details.
-
+        return summary
+    
+    def _batch_candidate(self, email: FetchedEmail) -> bool:
+        """Short, attachment-free emails that are not already cached can share a prompt."""
+        if not self.batch_token_budget or email.attachments or not email.body_text:
+            return False
+        content = self._email_content(email, [])
+        if estimate_tokens(content) > self.batch_max_email_tokens:
+            return False
+        cache_key = self._cache_key(self._build_prompt(email, content))
+        return cache_key is None or cache_key not in self.cache
+    
+    def _pack_batches(self, emails: List[FetchedEmail]) -> List[List[FetchedEmail]]:
+        """Greedily pack emails, in order, into batches under batch_token_budget."""
+        batches: List[List[FetchedEmail]] = []
+        current: List[FetchedEmail] = []
+        used = estimate_tokens(BATCH_INSTRUCTIONS)
+        for email in emails:
+            cost = estimate_tokens(self._batch_entry(email, "0"))
+            if current and used + cost > self.batch_token_budget:
+                batches.append(current)
+                current = []
+                used = estimate_tokens(BATCH_INSTRUCTIONS)
+            current.append(email)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _batch_entry(self, email: FetchedEmail, email_id: str) -> str:
+        return f"""### Email {email_id}
 From: {email.from_addr}
 Subject: {email.subject}
 Date: {email.date}
 
 Content:
-{content}
+{self._email_content(email, [])}
+"""
+    
+    def summarize_batch(self, emails: List[FetchedEmail]) -> List[str]:
+        """Summarize several short emails with one LLM call.
+        
+        The model returns a JSON object keyed by each email's batch ID. Any
+        email whose entry is missing or malformed is re-summarized on its own.
+        """
+        if len(emails) == 1:
+            return [self.summarize_email(emails[0], [])]
+        if self._out_of_time():
+            return [self._degraded_summary(email) for email in emails]
+        ids = [str(index) for index in range(1, len(emails) + 1)]
+        prompt = "\n".join(self._batch_entry(email, email_id) for email, email_id in zip(emails, ids))
+        response = self._call_ollama(
+            prompt, max_tokens=BATCH_TOKENS_PER_EMAIL * len(emails), format="json", system=BATCH_INSTRUCTIONS
+        )
+        try:
+            results = json.loads(response) if response else {}
+        except ValueError:
+            results = {}
+        if not isinstance(results, dict):
+            results = {}
+        
+        summaries = []
+        for email, email_id in zip(emails, ids):
+            summary = results.get(email_id)
+            if isinstance(summary, list):
+                summary = "\n".join(f"• {item}" for item in summary if isinstance(item, str))
+            if not isinstance(summary, str) or not (MIN_SUMMARY_CHARS <= len(summary.strip()) <= MAX_SUMMARY_CHARS):
+                self._record(batch_fallbacks=1)
+                self.metrics.inc("batch_fallbacks")
+                summaries.append(self.summarize_email(email, []))
+                continue
+            summary = summary.strip()
+            self.metrics.inc("summaries", source="batch")
+            cache_key = self._cache_key(self._build_prompt(email, self._email_content(email, [])))
+            if cache_key is not None:
+                self.cache.set(cache_key, summary)
+            summaries.append(summary)
+        return summaries
+    
+    def submit(self, email: FetchedEmail, priority: float = 0.0) -> "Future[str]":
+        """Queue an email for summarization on the worker pool.
+
+        At most ``max_workers`` requests are in flight to Ollama at once;
+        queued emails with a higher priority (importance score) go first.
+        """
+        if self.attachment_pool is None or not email.attachments:
+            return self.submit_task(self.summarize_email, email, priority=priority)
+        # Queue the attachments on the process pool now so they parse in
+        # parallel with everything else already in flight
+        pending = self.attachment_pool.submit_all(email.attachments, max_chars=ATTACHMENT_CHAR_BUDGET + 1)
+        
+        def run() -> str:
+            # Time a summary worker spends blocked on attachment parsing
+            with self.metrics.span("attachment_wait"):
+                parsed_attachments = self.attachment_pool.collect(pending)
+            return self.summarize_email(email, parsed_attachments)
+        
+        return self.submit_task(run, priority=priority)
+    
+    def _submit_batch(self, emails: List[FetchedEmail], priority: float = 0.0) -> List["Future[str]"]:
+        futures: List["Future[str]"] = [Future() for _ in emails]
+        
+        def run() -> None:
+            try:
+                summaries = self.summarize_batch(emails)
+            except Exception as e:
+                print(f"Batch summarization error: {e}")
+                summaries = [self._fallback_summary(email) for email in emails]
+            for future, summary in zip(futures, summaries):
+                _resolve(future, summary)
+        
+        self.submit_task(run, priority=priority)
+        return futures
+    
+    def submit_task(self, fn, *args, priority: float = 0.0) -> "Future[Any]":
+        """Run fn(*args) on the worker pool, higher priority first (FIFO among equals)."""
+        future: "Future[Any]" = Future()
+        with self._stats_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="summarize")
+            if self._started is None:
+                self._started = time.monotonic()
+                self._deadline = self._started + self.time_budget if self.time_budget else None
+            heapq.heappush(self._queue, (-priority, next(self._sequence), future, fn, args))
+        # Each pool job runs whichever queued task is most important at the time
+        self._pool.submit(self._run_next)
+        return future
+    
+    def _run_next(self) -> None:
+        with self._stats_lock:
+            _, _, future, fn, args = heapq.heappop(self._queue)
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+    
+    def _out_of_time(self) -> bool:
+        """Whether an LLM call started now would likely end past the deadline."""
+        if self._deadline is None:
+            return False
+        return time.monotonic() + (self._llm_seconds or 0.0) > self._deadline
+    
+    def _mark_degraded(self, emails: List[FetchedEmail]) -> None:
+        """Mark an entry's emails as degraded, counting the entry once even when
+        both its task and the digest's deadline wait degrade it."""
+        with self._stats_lock:
+            keys = {email.key for email in emails}
+            new = not keys <= self._degraded
+            self._degraded |= keys
+        if new:
+            self._record(degraded=1)
+            self.metrics.inc("summaries", source="degraded")
+    
+    def _degraded_summary(self, email: FetchedEmail,
+                          parsed_attachments: Optional[List[Tuple[str, str]]] = None) -> str:
+        """Extractive stand-in for an LLM summary the time budget had no room for."""
+        self._mark_degraded([email])
+        return self._fallback_summary(email, parsed_attachments)
+    
+    def _degraded_thread(self, conversation: Conversation) -> str:
+        self._mark_degraded(conversation.emails)
+        return self._extractive_thread(conversation)
+    
+    def submit_many(self, emails: List[FetchedEmail]) -> List["Future[str]"]:
+        """Queue emails, packing short ones into batched prompts when enabled."""
+        futures: Dict[int, "Future[str]"] = {}
+        batchable = []
+        scores = self.rules.score_batch(emails)
+        for index, (email, use_llm) in enumerate(zip(emails, self.needs_llm(emails, scores))):
+            if not use_llm:
+                futures[index] = self._submit_extractive(email)
+            elif self._batch_candidate(email):
+                batchable.append((index, email))
+            else:
+                futures[index] = self.submit(email, scores[index])
+        # Batches preserve input order, so futures line up with batchable
+        batch_indexes = [index for index, _ in batchable]
+        position = 0
+        for batch in self._pack_batches([email for _, email in batchable]):
+            indexes = batch_indexes[position:position + len(batch)]
+            position += len(batch)
+            # A batch goes at the pace of its most important email
+            batch_futures = self._submit_batch(batch, max(scores[index] for index in indexes))
+            for index, future in zip(indexes, batch_futures):
+                futures[index] = future
+        return [futures[index] for index in range(len(emails))]
+    
+    def prefetch(self, emails: List[FetchedEmail]) -> None:
+        """Start summarizing emails ahead of generate_daily_digest.
+        
+        Safe to call from fetch worker threads as batches arrive. With
+        group_threads, replies and messages replied to within the batch are
+        held back, since their conversation may not be complete yet. With
+        collapse_duplicates, near duplicates of a message already started
+        (or summarized in an earlier run) are skipped.
+        """
+        if self.group_threads:
+            referenced = {ref for email in emails for ref in [email.in_reply_to] + email.references if ref}
+            emails = [e for e in emails if not is_reply(e) and e.message_id not in referenced]
+        if self.collapse_duplicates:
+            emails = [
+                email for email, score in zip(emails, self.rules.score_batch(emails))
+                if not (self._collapsible(email, score) and self._prefetched_duplicate(email))
+            ]
+        for email, future in zip(emails, self.submit_many(emails)):
+            with self._stats_lock:
+                self._pending[email.key] = future
+    
+    def _fingerprint(self, email: FetchedEmail) -> Optional[int]:
+        with self._stats_lock:
+            if email.key in self._fingerprints:
+                return self._fingerprints[email.key]
+        value = fingerprint(email.body_text)
+        with self._stats_lock:
+            self._fingerprints[email.key] = value
+        return value
+    
+    def _collapsible(self, email: FetchedEmail, score: float) -> bool:
+        """Only bulk and spam-folder mail that is not important is collapsed with its near duplicates."""
+        return is_bulk(email) and score < self.rules.threshold
+    
+    def _prefetched_duplicate(self, email: FetchedEmail) -> bool:
+        value = self._fingerprint(email)
+        if value is None:
+            return False
+        if self._earlier_summary(email, value):
+            return True
+        address = sender(email)
+        with self._stats_lock:
+            if self._prefetched.find(value, lambda item: item[0] == address) is not None:
+                return True
+            self._prefetched.add(value, (address, email.key))
+        return False
+    
+    def _collapse_duplicates(self, conversations: List[Conversation], scores: Dict[int, float]
+                             ) -> Tuple[List[Conversation], Dict[int, List[FetchedEmail]], Dict[Any, str]]:
+        """Keep one single-message conversation per cluster of near duplicates.
+
+        Only collapsible mail (see _collapsible(), scores by id of the email)
+        is clustered. Returns the remaining conversations, the emails
+        collapsed into each (by id of the kept conversation), and summaries
+        from earlier runs to reuse, keyed by email.key.
+        """
+        singles = {
+            id(c.emails[0]): c for c in conversations
+            if len(c) == 1 and self._collapsible(c.emails[0], scores[id(c.emails[0])])
+        }
+        emails = [c.emails[0] for c in singles.values()]
+        values = {email.key: self._fingerprint(email) for email in emails}
+        kept = set()
+        collapsed: Dict[int, List[FetchedEmail]] = {}
+        known: Dict[Any, str] = {}
+        for cluster in cluster_duplicates(emails, self.duplicate_distance, values):
+            # Keep the member prefetch() already started, if any
+            with self._stats_lock:
+                representative = next((e for e in cluster.emails if e.key in self._pending), cluster.representative)
+                for email in cluster.emails:
+                    if email is not representative:
+                        stale = self._pending.pop(email.key, None)
+                        if stale is not None:
+                            stale.cancel()
+            conversation = singles[id(representative)]
+            kept.add(id(conversation))
+            if len(cluster.emails) > 1:
+                collapsed[id(conversation)] = [e for e in cluster.emails if e is not representative]
+                self.metrics.inc("duplicates_collapsed", len(cluster.emails) - 1)
+            earlier = self._earlier_summary(representative, cluster.fingerprint)
+            if earlier:
+                known[representative.key] = earlier
+        remaining = [c for c in conversations if id(c.emails[0]) not in singles or id(c) in kept]
+        return remaining, collapsed, known
+    
+    def _known_summary(self, email: FetchedEmail, summary: str, source: str = "duplicate") -> "Future[str]":
+        """Future holding a summary computed earlier, e.g. for a near duplicate."""
+        with self._stats_lock:
+            stale = self._pending.pop(email.key, None)
+        if stale is not None:
+            stale.cancel()
+        self.metrics.inc("summaries", source=source)
+        return _completed(summary)
+    
+    def _earlier_summary(self, email: FetchedEmail, value: Optional[int]) -> Optional[str]:
+        """Summary a near duplicate of email received before, if any.
+
+        A match on the very same message (e.g. a re-run over the same
+        window) does not count.
+        """
+        if self.fingerprints is None or value is None:
+            return None
+        entry = self.fingerprints.find(value, sender(email))
+        if not entry or entry.get("message") == _identity(email):
+            return None
+        return entry.get("summary") or None
+    
+    def _record_summary(self, email: FetchedEmail, summary: str, count: int) -> None:
+        """Keep a new summary in last_summaries and its fingerprint for later runs.
+
+        Extractive and no-content summaries are not kept: they are cheap to
+        redo, and an LLM summary should replace them when one is possible.
+        """
+        with self._stats_lock:
+            extractive_summary = email.key in self._extractive_keys
+        if extractive_summary or summary == self._no_content_summary(email):
+            summary = ""
+        else:
+            self.last_summaries[email.key] = summary
+        value = self._fingerprint(email)
+        if self.fingerprints is None or value is None:
+            return
+        self.fingerprints.record(value, email.subject, summary, count, message=_identity(email), sender=sender(email))
+    
+    def attachment_texts(self, email: FetchedEmail) -> List[Tuple[str, str, str]]:
+        """(filename, mime type, extracted text or "") for each attachment, as prompts use it."""
+        parsed = dict(parse_all_attachments(
+            email.attachments, pool=self.attachment_pool, max_chars=ATTACHMENT_CHAR_BUDGET + 1
+        ))
+        return [(filename, mime_type, parsed.get(filename, "")) for filename, _, mime_type in email.attachments]
+    
+    def _futures_for(self, emails: List[FetchedEmail]) -> List["Future[str]"]:
+        """Futures for emails, reusing any already started by prefetch()."""
+        futures: List[Optional["Future[str]"]] = []
+        for email in emails:
+            with self._stats_lock:
+                futures.append(self._pending.pop(email.key, None))
+        missing = [email for email, future in zip(emails, futures) if future is None]
+        queued = iter(self.submit_many(missing))
+        return [future or next(queued) for future in futures]
+    
+    def _thread_prompt(self, conversation: Conversation, parsed_attachments: List[Tuple[str, str]]) -> str:
+        """Prompt holding each message's new text once; empty when nothing is readable."""
+        parts = []
+        for email, text in conversation.messages():
+            if text:
+                parts.append(f"[{email.date.strftime('%Y-%m-%d %H:%M')}] {email.from_addr}:\n{text}")
+        # Keep the opening message and the latest replies within the budget
+        omitted = 0
+        while len(parts) > 2 and sum(estimate_tokens(part) for part in parts) > THREAD_TOKEN_BUDGET:
+            parts.pop(1)
+            omitted += 1
+        if omitted:
+            parts.insert(1, f"[{omitted} earlier messages omitted]")
+        body = fit_tokens("\n\n".join(parts), THREAD_TOKEN_BUDGET)
+        
+        attachment_lines = self._attachment_lines(
+            parsed_attachments, ATTACHMENT_TOKEN_BUDGET * len(parsed_attachments)
+        )
+        if not body and not attachment_lines:
+            return ""
+        attachment_section = ""
+        if attachment_lines:
+            attachment_section = "\nAttachments:\n" + "\n".join(attachment_lines) + "\n"
+        return f"""Subject: {conversation.subject}
+Participants: {", ".join(conversation.participants())}
 
+Conversation:
+{body}
+{attachment_section}
 Summary:"""
+    
+    def summarize_thread(self, conversation: Conversation,
+                         parsed_attachments: Optional[List[Tuple[str, str]]] = None) -> str:
+        """Summarize a whole conversation with a single LLM call."""
+        if parsed_attachments is None:
+            parsed_attachments = parse_all_attachments(
+                _thread_attachments(conversation), pool=self.attachment_pool, max_chars=ATTACHMENT_CHAR_BUDGET + 1
+            )
+        prompt = self._thread_prompt(conversation, parsed_attachments)
+        if not prompt:
+            self.metrics.inc("summaries", source="no_content")
+            return self._no_content_summary(conversation.latest)
+        self.metrics.inc("thread_messages", len(conversation))
         
-        summary = self._call_ollama(prompt, max_tokens=200)
-        if not summary:
-            # Fallback summary
-            summary = f"• From: {email.from_addr}\n• Subject: {email.subject}\n• Content: {email.body_text[:200]}..."
+        cache_key = self._cache_key(prompt)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached:
+                self.metrics.inc("summaries", source="cache")
+                return cached
+        if self._out_of_time():
+            return self._degraded_thread(conversation)
         
+        summary = self._call_ollama(prompt, max_tokens=300, system=THREAD_INSTRUCTIONS)
+        if not summary:
+            self.metrics.inc("summaries", source="fallback")
+            return self._extractive_thread(conversation)
+        if cache_key is not None:
+            self.cache.set(cache_key, summary)
+        self.metrics.inc("summaries", source="thread")
         return summary
     
-    def generate_daily_digest(self, emails: List[FetchedEmail]) -> str:
-        """Generate a daily digest of all emails."""
+    def _submit_thread(self, conversation: Conversation) -> "Future[str]":
+        # A member summarized on its own by prefetch() is superseded by the thread summary
+        with self._stats_lock:
+            for email in conversation.emails:
+                stale = self._pending.pop(email.key, None)
+                if stale is not None:
+                    stale.cancel()
+        scores = self.rules.score_batch(conversation.emails)
+        if not any(self.needs_llm(conversation.emails, scores)):
+            self.metrics.inc("summaries", source="extractive")
+            return _completed(self._extractive_thread(conversation))
+        # A conversation is as important as its most important message
+        priority = max(scores)
+        attachments = _thread_attachments(conversation)
+        if self.attachment_pool is None or not attachments:
+            return self.submit_task(self.summarize_thread, conversation, priority=priority)
+        pending = self.attachment_pool.submit_all(attachments, max_chars=ATTACHMENT_CHAR_BUDGET + 1)
+        
+        def run() -> str:
+            with self.metrics.span("attachment_wait"):
+                parsed_attachments = self.attachment_pool.collect(pending)
+            return self.summarize_thread(conversation, parsed_attachments)
+        
+        return self.submit_task(run, priority=priority)
+    
+    def _conversation_futures(self, conversations: List[Conversation], known: Optional[Dict[Any, str]] = None,
+                              precomputed: Optional[Dict[Any, str]] = None) -> List["Future[str]"]:
+        """One future per conversation; single messages go through the usual path.
+
+        Single messages whose key is in ``precomputed`` or ``known`` reuse
+        that summary.
+        """
+        known = known or {}
+        precomputed = precomputed or {}
+        singles = iter(self._futures_for([
+            c.emails[0] for c in conversations
+            if len(c) == 1 and c.emails[0].key not in known and c.emails[0].key not in precomputed
+        ]))
+        futures = []
+        for conversation in conversations:
+            email = conversation.emails[0]
+            if len(conversation) > 1:
+                futures.append(self._submit_thread(conversation))
+            elif email.key in precomputed:
+                futures.append(self._known_summary(email, precomputed[email.key], source="precomputed"))
+            elif email.key in known:
+                futures.append(self._known_summary(email, known[email.key]))
+            else:
+                futures.append(next(singles))
+        return futures
+    
+    def summarize_arrivals(self, emails: List[FetchedEmail]) -> List[str]:
+        """Summarize newly arrived emails each on their own, in input order.
+
+        Used by the daemon ahead of the digest. Collapsible near duplicates
+        of messages remembered in fingerprints reuse that summary instead of
+        calling the model, and every new summary is remembered in turn.
+        """
+        self.last_summaries = {}
+        known: Dict[Any, str] = {}
+        if self.collapse_duplicates:
+            for email, score in zip(emails, self.rules.score_batch(emails)):
+                if not self._collapsible(email, score):
+                    continue
+                earlier = self._earlier_summary(email, self._fingerprint(email))
+                if earlier:
+                    known[email.key] = earlier
+        futures = self._conversation_futures([Conversation([email]) for email in emails], known)
+        summaries = [future.result() for future in futures]
+        for email, summary in zip(emails, summaries):
+            self._record_summary(email, summary, 1)
+        self._finish_run(len(emails))
+        if self.fingerprints is not None:
+            self.fingerprints.save()
+        return summaries
+    
+    def _finish_run(self, count: int) -> None:
+        with self._stats_lock:
+            started, self._started = self._started, None
+            self._deadline = None
+            self._degraded.clear()
+            self._fingerprints.clear()
+            self._extractive_keys.clear()
+            self._prefetched = SimHashIndex(self.duplicate_distance)
+        self._record(emails=count, elapsed=time.monotonic() - started if started is not None else 0.0)
+    
+    def throughput_report(self) -> str:
+        """Describe summarization throughput for the work done so far."""
+        elapsed = self.stats["elapsed"] or 1e-9
+        tokens = self.stats["prompt_tokens"] + self.stats["completion_tokens"]
+        return (
+            f"Summarized {self.stats['emails']} emails in {self.stats['elapsed']:.1f}s "
+            f"({self.stats['emails'] / elapsed:.2f} emails/s, {tokens / elapsed:.1f} tokens/s, "
+            f"{self.stats['llm_calls']} LLM calls, {self.stats['batch_fallbacks']} batch fallbacks"
+            + (f", {self.stats['degraded']} quick summaries at the time budget" if self.stats["degraded"] else "")
+            + ")"
+        )
+    
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        if self.attachment_pool is not None:
+            self.attachment_pool.close()
+        self.backend.close()
+    
+    def _format_entry(self, email: FetchedEmail, summary: str) -> List[str]:
+        return [
+            f"**From:** {email.from_addr}",
+            f"**Subject:** {email.subject}",
+            f"**Time:** {email.date.strftime('%H:%M')}",
+            "",
+            summary,
+            "---",
+            "",
+        ]
+    
+    def _format_conversation(self, conversation: Conversation, summary: str,
+                             similar: Optional[List[FetchedEmail]] = None, seen_before: bool = False,
+                             degraded: bool = False) -> List[str]:
+        if len(conversation) == 1:
+            lines = self._format_entry(conversation.emails[0], summary)
+        else:
+            first, last = conversation.emails[0].date, conversation.latest.date
+            lines = [
+                f"**From:** {', '.join(conversation.participants())}",
+                f"**Subject:** {conversation.subject} ({len(conversation)} messages)",
+                f"**Time:** {first.strftime('%H:%M')}–{last.strftime('%H:%M')}",
+                "",
+                summary,
+                "---",
+                "",
+            ]
+        if similar or seen_before:
+            # Goes just above the closing rule
+            lines.insert(len(lines) - 2, _similar_line(similar or [], seen_before))
+        if degraded:
+            lines.insert(len(lines) - 2, "_Quick summary: the time budget ran out before the model got to it_")
+        return lines
+    
+    def _await(self, conversation: Conversation, future: "Future[str]") -> str:
+        """The conversation's summary, or a quick one if it is not ready by the deadline."""
+        deadline = self._deadline
+        if deadline is None:
+            return future.result()
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except TimeoutError:
+            # A call still running finishes in the background and fills the summary cache
+            future.cancel()
+        if len(conversation) == 1:
+            return self._degraded_summary(conversation.emails[0])
+        return self._degraded_thread(conversation)
+    
+    def _reduce(self, notes: List[str], instructions: str, max_tokens: int) -> str:
+        """One reduction of notes, from the summary cache when possible; "" if the model fails."""
+        prompt = overview.prompt(notes)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = DiskCache.make_key(self.ollama_model, PROMPT_VERSION, instructions, prompt)
+            cached = self.cache.get(cache_key)
+            if cached:
+                self.metrics.inc("overview_reductions", source="cache")
+                return cached
+        if self._out_of_time():
+            self.metrics.inc("overview_reductions", source="degraded")
+            return ""
+        reduced = self._call_ollama(prompt, max_tokens=max_tokens, system=instructions)
+        if not reduced:
+            self.metrics.inc("overview_reductions", source="fallback")
+            return ""
+        if cache_key is not None:
+            self.cache.set(cache_key, reduced)
+        self.metrics.inc("overview_reductions", source="llm")
+        return reduced
+    
+    def _condense(self, notes: List[str]) -> str:
+        return (
+            self._reduce(notes, overview.REDUCE_INSTRUCTIONS, overview.REDUCE_TOKENS)
+            or fit_tokens("\n".join(notes), overview.REDUCE_TOKENS)
+        )
+    
+    def executive_summary(self, notes: List[str]) -> str:
+        """Executive summary and action items of a digest's notes (see overview.note()).
+        
+        Notes are reduced level by level, each level's chunks in parallel,
+        until they fit one prompt. "" when the model cannot write it.
+        """
+        budget = self.overview_chunk_tokens
+        level = [fit_tokens(text, budget // 4) for text in notes]
+        for _ in range(overview.MAX_LEVELS):
+            if sum(map(estimate_tokens, level)) <= budget:
+                break
+            futures = [self.submit_task(self._condense, chunk) for chunk in overview.chunk(level, budget)]
+            level = [future.result() for future in futures]
+        fitted = [text for text in fill_budget(level, budget) if text]
+        return self._reduce(fitted, overview.OVERVIEW_INSTRUCTIONS, overview.OVERVIEW_TOKENS)
+    
+    def iter_daily_digest(self, emails: List[FetchedEmail],
+                          summaries: Optional[Dict[Any, str]] = None) -> Iterator[str]:
+        """Yield the daily digest section by section.
+        
+        Every summary is queued up front; each entry is yielded as soon as
+        its summary (and all before it) is ready, so callers can write the
+        digest incrementally. Joining the chunks with newlines gives the
+        same text as generate_daily_digest.
+        
+        ``summaries`` maps email.key to a summary computed ahead of time
+        (by the daemon); those emails are not summarized again unless they
+        are part of a conversation.
+        """
+        self.last_summaries = {}
         if not emails:
-            return "No emails found for the specified time period."
+            yield "No emails found for the specified time period."
+            return
+        
+        if self.group_threads:
+            conversations = group_conversations(emails)
+        else:
+            conversations = [Conversation([email]) for email in emails]
+        thread_count = len(conversations)
         
-        # Separate important and regular emails
-        important_emails = [e for e in emails if self.is_important(e)]
-        regular_emails = [e for e in emails if not self.is_important(e)]
+        # Every email is scored in one pass
+        scores = dict(zip(map(id, emails), self.rules.score_batch(emails)))
         
-        digest_parts = []
+        # Bulk mail: one entry per cluster of near-identical messages
+        collapsed: Dict[int, List[FetchedEmail]] = {}
+        known: Dict[Any, str] = {}
+        if self.collapse_duplicates:
+            conversations, collapsed, known = self._collapse_duplicates(conversations, scores)
+        
+        def members(conversation: Conversation) -> List[FetchedEmail]:
+            return conversation.emails + collapsed.get(id(conversation), [])
+        
+        # Separate important and regular conversations; a conversation is as
+        # important as its most important message
+        important_flags = [
+            max(scores[id(email)] for email in members(conversation)) >= self.rules.threshold
+            for conversation in conversations
+        ]
+        important = [c for c, flag in zip(conversations, important_flags) if flag]
+        regular = [c for c, flag in zip(conversations, important_flags) if not flag]
+        
+        # Important emails are queued first so they come back first
+        important_futures = self._conversation_futures(important, known, summaries)
+        regular_futures = self._conversation_futures(regular, known, summaries)
         
         # Header
-        digest_parts.append(f"# Daily Email Digest - {emails[0].date.strftime('%Y-%m-%d')}")
-        digest_parts.append(f"Total emails: {len(emails)}")
-        digest_parts.append(f"Important emails: {len(important_emails)}")
-        digest_parts.append("")
+        header = [
+            f"# Daily Email Digest - {emails[0].date.strftime('%Y-%m-%d')}",
+            f"Total emails: {len(emails)}",
+            f"Important emails: {sum(len(members(c)) for c in important)}",
+        ]
+        if thread_count < len(emails):
+            header.append(f"Conversations: {thread_count}")
+        duplicate_count = sum(len(similar) for similar in collapsed.values())
+        if duplicate_count:
+            header.append(f"Similar messages collapsed: {duplicate_count}")
+        yield "\n".join(header + [""])
+        
+        degraded: List[Conversation] = []
+        notes: List[str] = []
+        
+        def entries(conversations: List[Conversation], futures: List["Future[str]"],
+                    important: bool = False) -> Iterator[str]:
+            for conversation, future in zip(conversations, futures):
+                summary = self._await(conversation, future)
+                similar = collapsed.get(id(conversation), [])
+                email = conversation.emails[0]
+                with self._stats_lock:
+                    quick = email.key in self._degraded
+                if quick:
+                    degraded.append(conversation)
+                elif len(conversation) == 1 and not (summaries and email.key in summaries):
+                    self._record_summary(email, summary, 1 + len(similar))
+                seen_before = len(conversation) == 1 and email.key in known and not (summaries and email.key in summaries)
+                notes.append(overview.note(conversation.subject, conversation.latest.from_addr, summary, important))
+                yield "\n".join(self._format_conversation(conversation, summary, similar, seen_before, quick))
         
         # Important emails section
-        if important_emails:
-            digest_parts.append("## 🔥 Important Emails")
-            digest_parts.append("")
-            for email in important_emails:
-                summary = self.summarize_email(email)
-                digest_parts.append(f"**From:** {email.from_addr}")
-                digest_parts.append(f"**Subject:** {email.subject}")
-                digest_parts.append(f"**Time:** {email.date.strftime('%H:%M')}")
-                digest_parts.append("")
-                digest_parts.append(summary)
-                digest_parts.append("---")
-                digest_parts.append("")
+        if important:
+            yield "## 🔥 Important Emails\n"
+            yield from entries(important, important_futures, important=True)
         
         # Regular emails section
-        if regular_emails:
-            digest_parts.append("## 📧 Other Emails")
-            digest_parts.append("")
-            for email in regular_emails:
-                summary = self.summarize_email(email)
-                digest_parts.append(f"**From:** {email.from_addr}")
-                digest_parts.append(f"**Subject:** {email.subject}")
-                digest_parts.append(f"**Time:** {email.date.strftime('%H:%M')}")
-                digest_parts.append("")
-                digest_parts.append(summary)
-                digest_parts.append("---")
-                digest_parts.append("")
-        
-        return "\n".join(digest_parts)
+        if regular:
+            yield "## 📧 Other Emails\n"
+            yield from entries(regular, regular_futures)
+        
+        if self.overview_min_entries and len(notes) >= self.overview_min_entries:
+            with self.metrics.span("overview"):
+                executive_summary = self.executive_summary(notes)
+            if executive_summary:
+                yield overview.section(executive_summary)
+        
+        if degraded:
+            yield _time_budget_section(degraded, self.time_budget or 0.0)
+        
+        self._finish_run(len(emails))
+        if self.fingerprints is not None:
+            self.fingerprints.save()
+    
+    def generate_daily_digest(self, emails: List[FetchedEmail],
+                              summaries: Optional[Dict[Any, str]] = None) -> str:
+        """Generate a daily digest of all emails."""
+        return "\n".join(self.iter_daily_digest(emails, summaries))
+
+
+def _resolve(future: "Future[str]", summary: str) -> None:
+    """Set a batch member's result unless it was cancelled in the meantime."""
+    if future.cancelled():
+        return
+    try:
+        future.set_result(summary)
+    except InvalidStateError:
+        pass
+
+
+def _completed(summary: str) -> "Future[str]":
+    future: "Future[str]" = Future()
+    future.set_result(summary)
+    return future
+
+
+def _identity(email: FetchedEmail) -> str:
+    """Stable name for a message across runs and mailboxes."""
+    return email.message_id or "/".join(map(str, email.key))
+
+
+def _similar_line(similar: List[FetchedEmail], seen_before: bool) -> str:
+    """Digest lines listing the near duplicates collapsed into an entry, by subject."""
+    if not similar:
+        return "_Similar to messages seen in earlier runs_"
+    text = f"{len(similar)} similar message{'s' if len(similar) != 1 else ''} from {similar[0].from_addr}"
+    if seen_before:
+        text += " (also seen in earlier runs)"
+    subjects: Dict[str, int] = {}
+    for email in similar:
+        subjects[email.subject] = subjects.get(email.subject, 0) + 1
+    lines = [f"_{text}:_"]
+    lines += [f"- {subject}" + (f" (×{count})" if count > 1 else "") for subject, count in subjects.items()]
+    return "\n".join(lines)
+
+
+def _time_budget_section(degraded: List[Conversation], time_budget: float) -> str:
+    lines = [
+        "## ⏱️ Time Budget\n",
+        f"The {time_budget:g}s time budget ran out before the model got to {len(degraded)} "
+        f"{'entry' if len(degraded) == 1 else 'entries'}; they have a quick extractive summary:",
+        "",
+    ]
+    lines += [f"- {conversation.subject} ({conversation.latest.from_addr})" for conversation in degraded]
+    return "\n".join(lines + [""])
+
+
+def _thread_attachments(conversation: Conversation) -> List[Tuple[str, Payload, str]]:
+    """Attachments across a conversation, each distinct file once."""
+    seen = set()
+    attachments = []
+    for email in conversation.emails:
+        for filename, content, mime_type in email.attachments:
+            key = (filename, len(content), hash(content))  # spilled payloads hash their stored digest
+            if key not in seen:
+                seen.add(key)
+                attachments.append((filename, content, mime_type))
+    return attachments